@@ -54,13 +54,15 @@ __maintainer__ = "Spyros Kousidis"
 __status__ = "Development" # Development/Production/Prototype
 
 from math import atan2, asin, pi
+import numpy as np
 
 __all__ = [
     # Classes
     'SFVec3f', 'SFVec2f', 'SFRotation', 'MFVec3f',
     'MFVec2f', 'MFRotation', 'MFString', 'MFFloat',
     # Functions
-    'sfbool'
+    'sfbool', 'mfvec3f_array', 'mfvec2f_array', 'mfrotation_array',
+    'mf_array', 'mf_batch', 'mf_unbatch'
     ]
 
 class SFVec3f(object):
@@ -239,34 +241,43 @@ class SFVec2f(object):
 class SFRotation(object):
     """ parse and return SFRotation values from Instant Reality """
 
+    #objects pickled before the euler angles were cached lack the flag
+    __euler = False
+
     def getv(self):
         return [self.__qx, self.__qy, self.__qz, self.__qw]
     def getbank(self):
+        if not self.__euler:
+            self.__convert_to_euler__()
         return self.__bank
     def getheading(self):
+        if not self.__euler:
+            self.__convert_to_euler__()
         return self.__heading
     def getattitude(self):
+        if not self.__euler:
+            self.__convert_to_euler__()
         return self.__attitude
     def getqx(self):
         return self.__qx
     def setqx(self, value):
         self.__qx = value
-        self.__convert_to_euler__()
+        self.__euler = False
     def getqy(self):
         return self.__qy
     def setqy(self, value):
         self.__qy = value
-        self.__convert_to_euler__()
+        self.__euler = False
     def getqz(self):
         return self.__qz
     def setqz(self, value):
         self.__qz = value
-        self.__convert_to_euler__()
+        self.__euler = False
     def getqw(self):
         return self.__qw
     def setqw(self, value):
         self.__qw = value
-        self.__convert_to_euler__()
+        self.__euler = False
 
     qx = property(fget=getqx, fset=setqx, doc="qx")
     qy = property(fget=getqy, fset=setqy, doc="qy")
@@ -334,7 +345,8 @@ class SFRotation(object):
         self.__qy = args[1]
         self.__qz = args[2]
         self.__qw = args[3]
-        self.__convert_to_euler__()
+        #the Euler angles are computed when they are first needed
+        self.__euler = False
 
     def __convert_to_euler__(self):
         """ Convert Quaternion to Euler angles
@@ -348,6 +360,7 @@ class SFRotation(object):
 
         The computed angles are in radians
         """
+        self.__euler = True
         qx = self.__qx
         qy = self.__qy
         qz = self.__qz
@@ -657,6 +670,10 @@ class MFVec2f(object):
     def __len__(self):
         return len(self.__v)
 
+    def toarray(self, dtype=np.float64):
+        """Return the values as an ndarray of shape (n, 2)"""
+        return np.array([x.v for x in self.__v], dtype).reshape(-1, 2)
+
 
 class MFVec3f(object):
 
@@ -770,6 +787,10 @@ class MFVec3f(object):
     def __len__(self):
         return len(self.__v)
 
+    def toarray(self, dtype=np.float64):
+        """Return the values as an ndarray of shape (n, 3)"""
+        return np.array([x.v for x in self.__v], dtype).reshape(-1, 3)
+
 class MFRotation(object):
 
     """Parse and return MFRotation values from Instant Reality."""
@@ -879,6 +900,10 @@ class MFRotation(object):
     def __len__(self):
         return len(self.__v)
 
+    def toarray(self, dtype=np.float64):
+        """Return the values as an ndarray of shape (n, 4)"""
+        return np.array([x.v for x in self.__v], dtype).reshape(-1, 4)
+
 
 def sfbool(string):
     """ Parse a string into a boolean value
@@ -891,3 +916,160 @@ def sfbool(string):
 
     """
     return string.lower() == 'true'
+
+def mf_array(string, width, dtype=np.float64):
+    """ Parse an MF string into an ndarray of shape (n, width)
+
+    Decodes the string representation of an MFVec2f (width 2),
+    MFVec3f (width 3) or MFRotation (width 4) straight into a
+    contiguous array, without creating an object for every item.
+
+    The values are the same as those of the respective MF object,
+    including the error items (all -1) for items that have the wrong
+    number of values or values that are not floats:
+
+    >>> mf_array("[2.0 4.0 6.0, 3.0 5.0]", 3).tolist()
+    [[2.0, 4.0, 6.0], [-1.0, -1.0, -1.0]]
+
+    Arguments:
+    string -- The string, e.g. "[1 2 3, 4 5 6]"
+    width  -- The number of values per item
+
+    Keyword arguments:
+    dtype  -- The dtype of the array, e.g. np.float32
+
+    """
+    concat = string.split('[')[1].split(']')[0] if '[' in string else ''
+    if len(concat) == 0:
+        return np.empty((0, width), dtype)
+    #mark the item separators, so that all the numbers can be converted
+    #in one go, after checking that every item has width numbers
+    nitems = concat.count(', ') + 1
+    tokens = concat.replace(', ', ' , ').split(' ')
+    if len(tokens) == nitems * (width + 1) - 1 and \
+       tokens[width::width + 1].count(',') == nitems - 1:
+        del tokens[width::width + 1]
+        try:
+            return np.array(tokens, dtype).reshape(nitems, width)
+        except ValueError:
+            pass
+    #some items are malformed: parse them one by one, like the objects do
+    items = []
+    for item in concat.split(', '):
+        tokens = item.split(' ')
+        try:
+            if len(tokens) != width:
+                raise ValueError
+            items.append([float(x) for x in tokens])
+        except ValueError:
+            items.append([-1.0] * width)
+    return np.array(items, dtype)
+
+def mfvec3f_array(string, dtype=np.float64):
+    """ Parse an MFVec3f string into an ndarray of shape (n, 3)
+
+    >>> mfvec3f_array("[2.0 4.0 6.0, 3.0 5.0 7.0]")[1].tolist()
+    [3.0, 5.0, 7.0]
+
+    """
+    return mf_array(string, 3, dtype)
+
+def mfvec2f_array(string, dtype=np.float64):
+    """ Parse an MFVec2f string into an ndarray of shape (n, 2)
+
+    >>> mfvec2f_array("[2.0 4.0, 3.0 5.0]")[1].tolist()
+    [3.0, 5.0]
+
+    """
+    return mf_array(string, 2, dtype)
+
+def mfrotation_array(string, dtype=np.float64):
+    """ Parse an MFRotation string into an ndarray of shape (n, 4)
+
+    >>> mfrotation_array("[1.0 2.0 3.0 4.0]")[0].tolist()
+    [1.0, 2.0, 3.0, 4.0]
+
+    """
+    return mf_array(string, 4, dtype)
+
+def mf_batch(values, width, dtype=np.float64):
+    """ Decode a sequence of MF values into an ndarray of shape (N, n, width)
+
+    Each value can be an MF string, an MF object, or an array of shape
+    (n, width). Values with fewer than n items, as well as missing
+    values (None or NaN), are padded with NaN:
+
+    >>> batch = mf_batch(["[1 2 3, 4 5 6]", "[]"], 3)
+    >>> batch.shape
+    (2, 2, 3)
+    >>> np.isnan(batch[1]).all()
+    True
+
+    This is useful for decoding a whole column of a StreamFrame into
+    a tensor, e.g. (frames x joints x 3) for skeleton data
+
+    Arguments:
+    values -- A sequence of values (e.g. a column of a StreamFrame)
+    width  -- The number of values per item
+
+    Keyword arguments:
+    dtype  -- The dtype of the array, e.g. np.float32
+
+    """
+    arrays = []
+    for value in values:
+        if isinstance(value, basestring):
+            arrays.append(mf_array(value, width, dtype))
+        elif isinstance(value, (MFVec2f, MFVec3f, MFRotation)):
+            arrays.append(value.toarray(dtype))
+        elif isinstance(value, np.ndarray):
+            arrays.append(value.reshape(-1, width))
+        else:
+            arrays.append(np.empty((0, width), dtype))
+    nitems = max([len(x) for x in arrays]) if arrays else 0
+    batch = np.empty((len(arrays), nitems, width), dtype)
+    batch.fill(np.nan)
+    for i, array in enumerate(arrays):
+        batch[i, :len(array)] = array
+    return batch
+
+def mf_unbatch(batch):
+    """ Encode an ndarray of shape (N, n, width) into a list of MF objects
+
+    The inverse of mf_batch, e.g. for writing a tensor back to a
+    StreamFrame or an XIO file. Each row becomes an MFVec2f (width 2),
+    MFVec3f (width 3) or MFRotation (width 4) of its items, without the
+    items at the end that are all NaN (the padding of mf_batch). Items
+    that are all NaN before other items (e.g. a joint that was not
+    tracked) are kept as items with NaN values, so that the items keep
+    their positions. Rows without any items that are not all NaN
+    become NaN:
+
+    >>> values = mf_unbatch(mf_batch(["[1 2 3, 4 5 6]", "[]"], 3))
+    >>> print values[0]
+    [1.0 2.0 3.0, 4.0 5.0 6.0]
+    >>> values[1]
+    nan
+
+    The items are converted through their shortest string, so that
+    float32 values are written as they were read.
+
+    Arguments:
+    batch  -- An ndarray of shape (N, n, width)
+
+    """
+    mftype, sftype = {2: (MFVec2f, SFVec2f), 3: (MFVec3f, SFVec3f),
+                      4: (MFRotation, SFRotation)}[batch.shape[2]]
+    present = ~np.isnan(batch).all(axis=2)
+    #the number of items up to the last one that is not all NaN
+    lengths = np.zeros(len(batch), dtype=int)
+    rows, items = np.nonzero(present)
+    np.maximum.at(lengths, rows, items + 1)
+    tokens = batch.astype(str)
+    values = []
+    for row, length in zip(tokens, lengths):
+        if length:
+            values.append(mftype([sftype(*item) for item in row[:length]]))
+        else:
+            values.append(np.nan)
+    return values
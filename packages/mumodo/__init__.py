@@ -1,3 +1,4 @@
-__all__ = ["analysis","corpus", "mumodoIO", "plotting", "xiofile", "increco"] 
+__all__ = ["analysis","corpus", "mumodoIO", "plotting", "xiofile", "increco",
+           "gzipio"] 
 
 #import utils
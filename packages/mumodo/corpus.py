@@ -40,6 +40,7 @@ __status__ = "Development" # Development/Production/Prototype
 import yaml, os, codecs, pickle
 from moviepy.editor import VideoFileClip, AudioFileClip
 from mumodo.mumodoIO import open_streamframe_from_xiofile,\
+                            open_streamframes_from_xiofile,\
                             open_intervalframe_from_textgrid
 from mumodo.analysis import slice_intervalframe_by_time, get_tier_type, \
                             slice_pointframe_by_time
@@ -109,6 +110,7 @@ class Resource(object):
         self.__cached_object__ = None
         self.__rtype__ = 'GenericResource'
         self.__path_prefix__ = None
+        self.__mumodo__ = None
 
     def __repr__(self):
         return "{}\nname: {}\ndescription: {}\nfilename: {}\nunits: {}\n".\
@@ -482,8 +484,16 @@ class XIOStreamResource(BaseStreamResource):
 
     kwargs  -- a dictonary of kwargs to be passed to the function
                that parses the XIO file and returns the StreamFrame.
-               Notably, an offset can be one of these. See the
-               documentation of mumodo.mumodoIO for more information
+               Notably, an offset can be one of these, and a fixed
+               clock grid (grid_rate, grid_origin, grid_fill) that
+               makes the StreamFrames of different resources share
+               their index. See the documentation of mumodo.mumodoIO
+               for more information
+
+    parts   -- a list of filenames of the next parts of a recording
+               that was split into several files. The filename is the
+               first part. The parts are read as one file (see
+               mumodo.xiofile.XIOMultiFile)
 
     """
     def __init__(self, **kwargs):
@@ -497,16 +507,39 @@ class XIOStreamResource(BaseStreamResource):
             self.__kwargs__ = kwargs['kwargs']
         else:
             self.__kwargs__ = {}
+        if 'parts' in kwargs:
+            self.__parts__ = kwargs['parts']
+        else:
+            self.__parts__ = None
 
     def __repr__(self):
-        return super(XIOStreamResource, self).__repr__() + \
+        rep = super(XIOStreamResource, self).__repr__() + \
            "sensorname: {}\nkwargs: {}\n".format(self.__sensorname__,
                                                  self.__kwargs__)
+        if self.__parts__ is not None:
+            rep += "parts: {}\n".format(self.__parts__)
+        return rep
 
     def __toyaml__(self):
-        return dict(super(XIOStreamResource, self).__toyaml__().items() + \
+        yamldict = dict(super(XIOStreamResource, self).__toyaml__().items() + \
            {'sensorname': self.__sensorname__,
             'kwargs': self.__kwargs__}.items())
+        if self.__parts__ is not None:
+            yamldict['parts'] = self.__parts__
+        return yamldict
+
+    def get_filepaths(self):
+        """ Get the paths of all the parts of the XIO file
+
+        """
+        filepaths = [self.get_filepath()]
+        for part in self.__parts__ or []:
+            if self.__path_prefix__ is None or \
+               not isinstance(self.__path_prefix__, basestring):
+                filepaths.append(part)
+            else:
+                filepaths.append(os.path.join(self.__path_prefix__, part))
+        return filepaths
 
     def __load__(self):
         if super(XIOStreamResource, self).__load__() < 0:
@@ -515,11 +548,20 @@ class XIOStreamResource(BaseStreamResource):
             print "No sensorname has been set."
             print "No StreamFrame can be created."
             return -1
+        #load all resources of the mumodo that share this file at once
+        if self.__cached_object__ is None and self.__mumodo__ is not None:
+            self.__mumodo__.load_xio_resources(self.get_filepath())
         if self.__cached_object__ is None:
+            filepath = self.get_filepath()
+            if self.__parts__:
+                filepath = self.get_filepaths()
+                if not all(os.path.isfile(part) for part in filepath):
+                    print "A part of the file does not exist"
+                    return -1
             print "Parsing XIO file (will be done only once)."
             print "Please wait ..."
             self.__cached_object__ = open_streamframe_from_xiofile\
-                                     (self.get_filepath(),
+                                     (filepath,
                                       self.__sensorname__,
                                       **self.__kwargs__)
         return 0
@@ -1009,6 +1051,7 @@ class Mumodo(object):
                 return -1
             self.__resources__[rname] = resource
             resource.set_path_prefix(self.__localpath__)
+            resource.__mumodo__ = self
             if resource.__filename__ not in self.__files__:
                 self.__files__.append(resource.__filename__)
 
@@ -1036,6 +1079,70 @@ class Mumodo(object):
         """
         return self.__name__
 
+    def load_xio_resources(self, filepath=None):
+        """ Load the XIOStreamResources of this mumodo that share a file
+
+        XIOStreamResources that are loaded from the same XIO file are
+        loaded together, parsing the file only once. This is done
+        automatically when the first of them is accessed.
+
+        Resources are loaded together if they use the same time range
+        (start_time, end_time and relative kwargs). A resource with the
+        same sensorname as another one, but different kwargs, is left
+        to load on its own.
+
+        Kwargs:
+
+        filepath -- Only load resources from this file. By default the
+                    resources of all XIO files are loaded
+
+        """
+        passkeys = ['start_time', 'end_time', 'relative']
+        sensorkeys = ['window_size', 'with_fields', 'without_fields',
+                      'discard_duplicates', 'timestamp_offset', 'grid_rate',
+                      'grid_origin', 'grid_fill', 'expand_mf']
+        groups = {}
+        for r in self:
+            if not isinstance(r, XIOStreamResource) or \
+               r.__cached_object__ is not None or \
+               r.__sensorname__ is None or r.__parts__ or \
+               not os.path.isfile(r.get_filepath()) or \
+               filepath is not None and r.get_filepath() != filepath:
+                continue
+            kwargs = r.__kwargs__
+            if any(key not in passkeys + sensorkeys for key in kwargs):
+                continue
+            passkwargs = dict([(key, kwargs[key]) for key in passkeys \
+                               if key in kwargs])
+            groupkey = (r.get_filepath(), repr(sorted(passkwargs.items())))
+            if groupkey not in groups:
+                groups[groupkey] = (passkwargs, {}, [])
+            sensorkwargs = dict([(key, kwargs[key]) for key in sensorkeys \
+                                 if key in kwargs])
+            sensors = groups[groupkey][1]
+            if r.__sensorname__ in sensors and \
+               sensors[r.__sensorname__] != sensorkwargs:
+                continue
+            sensors[r.__sensorname__] = sensorkwargs
+            groups[groupkey][2].append(r)
+
+        for groupkey in groups:
+            passkwargs, sensors, resources = groups[groupkey]
+            if len(resources) < 2:
+                continue
+            print "Parsing XIO file for {} resources (will be done only "\
+                  "once).".format(len(resources))
+            print "Please wait ..."
+            streams = open_streamframes_from_xiofile(groupkey[0], sensors,
+                                                     **passkwargs)
+            for r in resources:
+                stream = streams[r.__sensorname__]
+                #resources with identical settings get their own copy
+                if any(stream is other.__cached_object__ \
+                       for other in resources):
+                    stream = stream.copy()
+                r.__cached_object__ = stream
+
 def serialize_mumodo(mumodo, default_flow_style=False):
     """ Create a human-readable and editable yaml dump
 
@@ -0,0 +1,667 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Dialogue Systems Group, University of Bielefeld
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""gzipio.py: Low-level readers and writers for gzip compressed files
+
+   XIO files are usually compressed with gzip. The gzip module of the
+   standard library can only seek forward in a compressed file: seeking
+   backwards means decompressing again from the start of the file.
+
+   This module contains file-like objects that are used by the XIOFile
+   class in order to access large compressed files efficiently, e.g.
+   GzipCheckpointReader, which keeps snapshots of the decompressor
+   every few MB, so that seeking only has to decompress from the
+   nearest snapshot (similar to zran.c from the zlib distribution)
+
+   BlockedGzipWriter writes "blocked" gzip files (similar to the BGZF
+   format of samtools): the file is a series of independent gzip
+   members (blocks) that end at line boundaries, and the header of
+   each block records its compressed and uncompressed size. A blocked
+   file is still a valid gzip file, but its blocks can be located
+   without decompressing anything (see gzip_block_index), and then be
+   decompressed and parsed in parallel.
+
+   ReadAheadReader decompresses a file in a background thread while the
+   lines are being parsed, for reading a whole file sequentially.
+
+   TailReader returns the lines that are appended to a file that is still
+   being written (e.g. by the venice logger during a recording).
+
+"""
+
+__author__ = ["Spyros Kousidis", "Katharina Jettka", "Gerdis Anderson",
+              "Robert Rogalla", "Fabian Wohlgemuth", "Casey Kennington"]
+__copyright__ = "Dialogue Systems Group Bielefeld - www.dsg-bielefeld.de"
+__credits__ = ["Spyros Kousidis", "Katharina Jettka", "Gerdis Anderson",
+               "Robert Rogalla", "Fabian Wohlgemuth", "Casey Kennington"]
+__license__ = "MIT"
+__version__ = "2.0"
+__maintainer__ = "Spyros Kousidis"
+__status__ = "Development" # Development/Production/Prototype
+
+import io
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Full
+
+__all__ = [
+    # Classes
+    'GzipCheckpointReader', 'BlockedGzipWriter', 'ReadAheadReader',
+    'TailReader',
+    # Functions
+    'gzip_block', 'gzip_block_index', 'read_gzip_block'
+    ]
+
+#The extra subfield that marks the blocks of a blocked gzip file. It holds
+#the compressed size of the block and the uncompressed size of its data
+BLOCK_SUBFIELD = 'XB'
+BLOCK_HEADER = struct.Struct('<BBBBIBBH2sHII')
+BLOCK_TRAILER = struct.Struct('<II')
+
+GZIP_MAGIC = '\x1f\x8b'
+
+class GzipCheckpointReader(object):
+
+    """Read a gzip file with fast random access (seeking)."""
+
+    def __init__(self, path, interval=1048576, chunksize=65536, blocks=None,
+                 follow=False):
+        """Open a gzip file for reading with random access.
+
+        The file is read and decompressed in chunks. Every time
+        (approximately) interval bytes of uncompressed data have been
+        produced, a copy of the state of the decompressor is kept as a
+        checkpoint, together with the compressed and uncompressed
+        offsets at that point. Seeking to any offset then decompresses
+        at most interval bytes, starting from the nearest checkpoint.
+
+        Checkpoints are created while reading forward, so after one
+        pass over the file (e.g. indexing it), any offset can be
+        reached in constant time. They are kept in memory only, and use
+        about 40KB each.
+
+        Files with several gzip members (e.g. created by appending to a
+        gzip file) are supported, as with the gzip module. In blocked
+        gzip files, every block can be decompressed on its own, so the
+        start of every block is a checkpoint that costs no memory (see
+        the blocks argument).
+
+        Arguments:
+        path        --  Path of the gzip file
+
+        Keyword arguments:
+        interval    --  Uncompressed bytes between checkpoints
+        chunksize   --  Compressed bytes to decompress at a time
+        blocks      --  The block index of a blocked gzip file (see
+                        gzip_block_index). If given, the blocks are
+                        used as checkpoints from the start
+        follow      --  If True, the file may still be written: reading
+                        stops at the data that is available, and data
+                        that is appended later can be read afterwards.
+                        Otherwise, a file that ends in the middle of a
+                        gzip member raises an IOError, like corrupted
+                        data does
+
+        """
+        self.path = path
+        self.follow = follow
+        self.interval = interval
+        self.chunksize = chunksize
+        #io.open, because a (C stdio) file does not read past its end again
+        self.raw = io.open(path, 'rb')
+        #checkpoints: uncompressed offsets (for bisect) and states
+        self.checkpoint_offsets = [0]
+        self.checkpoints = [(0, None)]
+        for rawoffset, _, offset, _ in (blocks or [])[1:]:
+            self.checkpoint_offsets.append(offset)
+            self.checkpoints.append((rawoffset, None))
+        self.__restore__(0)
+
+    def __newdecompressor__(self):
+        #16 + MAX_WBITS lets zlib parse the gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def __restore__(self, index):
+        """Restore the reading state from a checkpoint"""
+        rawoffset, decompressor = self.checkpoints[index]
+        self.raw.seek(rawoffset)
+        #None marks the start of a gzip member: start from scratch
+        if decompressor is None:
+            self.decompressor = self.__newdecompressor__()
+        else:
+            self.decompressor = decompressor.copy()
+        self.bufferoffset = self.checkpoint_offsets[index]
+        self.buffer = ''
+        self.bufferpos = 0
+        self.eof = False
+
+    def __fill__(self):
+        """Decompress the next chunk into the buffer
+
+        Returns False if there is no more data in the file.
+        """
+        if self.eof:
+            return False
+        data = ''
+        while not data:
+            chunk = self.raw.read(self.chunksize)
+            if not chunk:
+                #a file that may still be growing is not finished
+                if not self.follow:
+                    if self.raw.tell() > 0 and \
+                       not _member_complete(self.decompressor):
+                        raise IOError('gzip file ' + self.path +
+                                      ' ends in the middle of a member')
+                    data = self.decompressor.flush()
+                    self.eof = True
+                break
+            data, self.decompressor, garbage = _inflate(self.decompressor,
+                                                        chunk)
+            if garbage:
+                #trailing garbage after the last member
+                self.eof = True
+                break
+        #drop consumed data and append the new data
+        self.bufferoffset += self.bufferpos
+        self.buffer = self.buffer[self.bufferpos:] + data
+        self.bufferpos = 0
+        #keep a checkpoint at the end of the decompressed data
+        end = self.bufferoffset + len(self.buffer)
+        if not self.eof and end >= self.checkpoint_offsets[-1] + \
+                                   self.interval:
+            self.checkpoint_offsets.append(end)
+            self.checkpoints.append((self.raw.tell(),
+                                     self.decompressor.copy()))
+        return len(data) > 0
+
+    def tell(self):
+        """Return the current (uncompressed) offset"""
+        return self.bufferoffset + self.bufferpos
+
+    def seek(self, offset, whence=0):
+        """Seek to an uncompressed offset
+
+        Arguments:
+        offset  --  The offset
+        whence  --  0 (default) for absolute offsets, 1 for offsets
+                    relative to the current position
+
+        """
+        if whence == 1:
+            offset += self.tell()
+        elif whence != 0:
+            raise ValueError('Seek from end not supported')
+        if offset < 0:
+            raise IOError('Negative seek in read mode')
+        #restore the nearest checkpoint, unless we are closer already
+        index = bisect_right(self.checkpoint_offsets, offset) - 1
+        if offset < self.bufferoffset or \
+           self.checkpoint_offsets[index] > self.bufferoffset + \
+                                            len(self.buffer):
+            self.__restore__(index)
+        #decompress forward up to the offset
+        while offset > self.bufferoffset + len(self.buffer):
+            self.bufferpos = len(self.buffer)
+            if not self.__fill__():
+                break
+        self.bufferpos = min(offset - self.bufferoffset, len(self.buffer))
+        return self.tell()
+
+    def read(self, size=-1):
+        """Read up to size bytes (all remaining bytes by default)"""
+        while size < 0 or len(self.buffer) - self.bufferpos < size:
+            if not self.__fill__():
+                break
+        if size < 0:
+            size = len(self.buffer) - self.bufferpos
+        data = self.buffer[self.bufferpos:self.bufferpos + size]
+        self.bufferpos += len(data)
+        return data
+
+    def readline(self):
+        """Read one line, including the trailing newline"""
+        end = self.buffer.find('\n', self.bufferpos)
+        while end < 0:
+            searched = len(self.buffer) - self.bufferpos
+            if not self.__fill__():
+                end = len(self.buffer) - 1
+                break
+            end = self.buffer.find('\n', self.bufferpos + searched)
+        line = self.buffer[self.bufferpos:end + 1]
+        self.bufferpos = end + 1
+        return line
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+    def close(self):
+        """Close the underlying file"""
+        self.raw.close()
+
+
+class BlockedGzipWriter(object):
+
+    """Write a blocked gzip file, compressing blocks in parallel."""
+
+    def __init__(self, path, blocksize=65536, compresslevel=9, threads=1,
+                 mode='wb'):
+        """Open a blocked gzip file for writing
+
+        The data is written as a series of independent gzip members
+        (blocks) of about blocksize uncompressed bytes each. Blocks only
+        end after a newline, so that every block contains whole lines
+        (a line that is longer than blocksize makes a longer block).
+        The file can be read by any gzip reader (e.g. zcat, or the gzip
+        module), and its blocks can be found with gzip_block_index.
+
+        Compressing is the bottleneck when writing, so blocks can be
+        compressed by several threads (zlib does not hold the global
+        interpreter lock while compressing).
+
+        Arguments:
+        path            --  Path of the gzip file
+
+        Keyword arguments:
+        blocksize       --  Uncompressed bytes per block (approximately)
+        compresslevel   --  The zlib compression level (1-9)
+        threads         --  Number of threads compressing blocks
+        mode            --  'wb' (default) to create a new file, 'ab' to
+                            append blocks to an existing file
+
+        """
+        self.path = path
+        self.blocksize = blocksize
+        self.compresslevel = compresslevel
+        self.raw = open(path, mode)
+        self.pool = ThreadPool(threads) if threads > 1 else None
+        #complete blocks that wait for (parallel) compression
+        self.pending = []
+        self.maxpending = max(1, 2 * threads)
+        #data that does not make a complete block yet
+        self.buffer = []
+        self.buffersize = 0
+
+    def write(self, data):
+        """Write a string to the file"""
+        self.buffer.append(data)
+        self.buffersize += len(data)
+        if self.buffersize >= self.blocksize:
+            self.__cut__()
+
+    def __cut__(self):
+        """Cut complete blocks off the buffer, at line boundaries"""
+        data = ''.join(self.buffer)
+        start = 0
+        while len(data) - start >= self.blocksize:
+            end = data.rfind('\n', start, start + self.blocksize)
+            if end < 0:
+                end = data.find('\n', start + self.blocksize)
+                if end < 0:
+                    break
+            self.pending.append(data[start:end + 1])
+            start = end + 1
+        data = data[start:]
+        self.buffer = [data]
+        self.buffersize = len(data)
+        if len(self.pending) >= self.maxpending:
+            self.__compress__()
+
+    def __compress__(self):
+        """Compress the pending blocks and write them to the file"""
+        if self.pool is None:
+            blocks = [gzip_block(x, self.compresslevel) for x in self.pending]
+        else:
+            blocks = self.pool.map(_gzip_block_args,
+                                   [(x, self.compresslevel)
+                                    for x in self.pending])
+        for block in blocks:
+            self.raw.write(block)
+        self.pending = []
+
+    def flush(self):
+        """Write all complete lines to the file
+
+        Data after the last newline stays in the buffer, so that lines
+        are never split across blocks.
+
+        """
+        data = ''.join(self.buffer)
+        end = data.rfind('\n') + 1
+        if end > 0:
+            self.pending.append(data[:end])
+            self.buffer = [data[end:]]
+            self.buffersize = len(data) - end
+        self.__compress__()
+        self.raw.flush()
+
+    def close(self):
+        """Write all remaining data and close the file"""
+        data = ''.join(self.buffer)
+        if data:
+            self.pending.append(data)
+        self.buffer = []
+        self.buffersize = 0
+        self.__compress__()
+        self.raw.close()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+class ReadAheadReader(object):
+
+    """Iterate over the lines of a file that is read in a background thread."""
+
+    def __init__(self, path, chunksize=262144, queuesize=16):
+        """Start reading (and decompressing) a file in the background
+
+        A thread reads the file in chunks, decompresses them (if the file
+        is gzip compressed) and puts the lines in batches into a bounded
+        queue, while the lines of earlier batches are consumed (e.g.
+        parsed) by iterating over the reader. zlib does not hold the
+        global interpreter lock while decompressing, so decompressing
+        and parsing run in parallel on machines with more than one core.
+
+        The reader only supports iterating over the lines once, from the
+        start of the file. The thread stops when all lines have been
+        read, or when the reader is closed.
+
+        Arguments:
+        path        --  Path of the (gzip compressed or plain) file
+
+        Keyword arguments:
+        chunksize   --  Bytes to read (and decompress) at a time
+        queuesize   --  The maximum number of batches waiting in the
+                        queue, which limits the memory used
+
+        """
+        self.path = path
+        self.chunksize = chunksize
+        self.queue = Queue(queuesize)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__produce__)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __put__(self, item):
+        """Put an item into the queue, unless the reader is closed"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __produce__(self):
+        """Read the file and put batches of lines into the queue"""
+        try:
+            with open(self.path, 'rb') as raw:
+                gzipped = raw.read(2) == GZIP_MAGIC
+                raw.seek(0)
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                garbage = False
+                rest = ''
+                chunk = raw.read(self.chunksize)
+                while chunk and not self.stopped.is_set():
+                    if gzipped:
+                        data, decompressor, garbage = _inflate(decompressor,
+                                                               chunk)
+                    else:
+                        data = chunk
+                    data = rest + data
+                    end = data.rfind('\n') + 1
+                    rest = data[end:]
+                    if end > 0 and \
+                       not self.__put__(StringIO(data[:end]).readlines()):
+                        return
+                    #trailing garbage after the last member ends the file
+                    chunk = '' if garbage else raw.read(self.chunksize)
+                if self.stopped.is_set():
+                    return
+                if gzipped and not garbage:
+                    if raw.tell() > 0 and not _member_complete(decompressor):
+                        raise IOError('gzip file ' + self.path +
+                                      ' ends in the middle of a member')
+                    rest += decompressor.flush()
+                if rest:
+                    self.__put__(StringIO(rest).readlines())
+            self.__put__(None)
+        except Exception as error:
+            self.__put__(error)
+
+    def __iter__(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            for line in batch:
+                yield line
+
+    def close(self):
+        """Stop the background thread"""
+        self.stopped.set()
+        self.thread.join()
+
+class TailReader(object):
+
+    """Read the lines that are appended to a (gzip compressed) file."""
+
+    def __init__(self, path, chunksize=65536, maxsize=4194304):
+        """Open a file that is still being written, for reading its lines
+
+        Every call of readlines returns the complete lines that have been
+        written since the previous call, starting from the beginning of
+        the file. The last line is only returned once it is complete
+        (ends with a newline). Gzip compressed files are decompressed as
+        they grow, also if they consist of several gzip members.
+
+        Arguments:
+        path        --  Path of the file
+
+        Keyword arguments:
+        chunksize   --  Bytes to read (and decompress) at a time
+        maxsize     --  Maximum number of (compressed) bytes to read in
+                        one call of readlines
+
+        """
+        self.path = path
+        self.chunksize = chunksize
+        self.maxsize = maxsize
+        self.raw = io.open(path, 'rb')
+        self.gzipped = None
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        #True after trailing garbage (see _inflate)
+        self.garbage = False
+        #the incomplete last line
+        self.rest = ''
+        #the (uncompressed) offset of the next line
+        self.offset = 0
+
+    def readlines(self):
+        """Return a list with the complete lines that have been appended
+
+        The list is empty if there are no new complete lines. The offset
+        of the first line is the value of the offset attribute before
+        the call.
+
+        """
+        if self.garbage:
+            return []
+        if self.gzipped is None:
+            magic = self.raw.read(2)
+            self.raw.seek(0)
+            if len(magic) < 2:
+                return []
+            self.gzipped = magic == '\x1f\x8b'
+        data = []
+        size = 0
+        while size < self.maxsize:
+            chunk = self.raw.read(self.chunksize)
+            if not chunk:
+                break
+            size += len(chunk)
+            if not self.gzipped:
+                data.append(chunk)
+                continue
+            #corrupted data raises an IOError
+            inflated, self.decompressor, self.garbage = \
+                _inflate(self.decompressor, chunk)
+            data.append(inflated)
+            if self.garbage:
+                #trailing garbage after the last member: nothing follows
+                break
+        data = self.rest + ''.join(data)
+        end = data.rfind('\n') + 1
+        self.rest = data[end:]
+        self.offset += end
+        return StringIO(data[:end]).readlines()
+
+    def close(self):
+        """Close the file"""
+        self.raw.close()
+
+def _inflate(decompressor, chunk):
+    """Decompress the next chunk of a gzip file
+
+    Returns the decompressed data, the decompressor of the member that
+    is being decompressed (a new one if a new member starts within the
+    chunk), and True if the chunk ends with trailing garbage, i.e.
+    anything but a gzip member after a complete member (e.g. the zeros
+    some tools pad files with). The garbage is dropped. Errors within a
+    member (corrupted data, or a wrong checksum) raise an IOError.
+
+    """
+    try:
+        data = decompressor.decompress(chunk)
+        #after the end of a member, the rest of the chunk is unused
+        while len(decompressor.unused_data) >= len(GZIP_MAGIC):
+            rest = decompressor.unused_data
+            if not rest.startswith(GZIP_MAGIC):
+                return data, decompressor, True
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data += decompressor.decompress(rest)
+    except zlib.error as error:
+        raise IOError('corrupted gzip data: ' + str(error))
+    return data, decompressor, False
+
+def _member_complete(decompressor):
+    """Return True if the decompressor has reached the end of its member
+       (the checksum of which zlib has verified)"""
+    #after the end of a member, any further input is unused
+    probe = decompressor.copy()
+    try:
+        probe.decompress('\0')
+    except zlib.error:
+        return False
+    return len(probe.unused_data) > 0
+
+def gzip_block(data, compresslevel=9):
+    """ Compress a string into a gzip member with a block header
+
+    The header has an extra field (see BLOCK_SUBFIELD) with the size of
+    the whole member and the size of the data, so that the blocks of
+    a file can be found without decompressing them.
+
+    >>> import zlib
+    >>> zlib.decompress(gzip_block('some data'), 16 + zlib.MAX_WBITS)
+    'some data'
+
+    Arguments:
+    data            --  The (uncompressed) data
+
+    Keyword arguments:
+    compresslevel   --  The zlib compression level (1-9)
+
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED,
+                                  -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    size = BLOCK_HEADER.size + len(deflated) + BLOCK_TRAILER.size
+    #magic, deflate, FEXTRA flag, no mtime, no xfl, unknown OS, extra field
+    header = BLOCK_HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 255, 12,
+                               BLOCK_SUBFIELD, 8, size, len(data))
+    trailer = BLOCK_TRAILER.pack(zlib.crc32(data) & 0xffffffff,
+                                 len(data) & 0xffffffff)
+    return header + deflated + trailer
+
+def _gzip_block_args(args):
+    return gzip_block(*args)
+
+def gzip_block_index(path):
+    """ Find the blocks of a blocked gzip file
+
+    Only the headers of the blocks are read, nothing is decompressed.
+
+    Returns a list of tuples (rawoffset, rawsize, offset, size), with
+    the compressed offset and size and the uncompressed offset and size
+    of every block, or None if the file is not a blocked gzip file
+    (e.g. if it was written by the gzip module)
+
+    Arguments:
+    path    --  Path of the gzip file
+
+    """
+    blocks = []
+    rawoffset = 0
+    offset = 0
+    with open(path, 'rb') as f:
+        while True:
+            f.seek(rawoffset)
+            header = f.read(BLOCK_HEADER.size)
+            if not header:
+                break
+            if len(header) < BLOCK_HEADER.size:
+                return None
+            fields = BLOCK_HEADER.unpack(header)
+            if fields[:2] != (0x1f, 0x8b) or not fields[3] & 4 or \
+               fields[8] != BLOCK_SUBFIELD:
+                return None
+            rawsize, size = fields[10:]
+            blocks.append((rawoffset, rawsize, offset, size))
+            rawoffset += rawsize
+            offset += size
+    if not blocks:
+        return None
+    return blocks
+
+def read_gzip_block(path, rawoffset, rawsize):
+    """ Read and decompress one block of a blocked gzip file
+
+    Arguments:
+    path        --  Path of the gzip file
+    rawoffset   --  The (compressed) offset of the block
+    rawsize     --  The (compressed) size of the block
+
+    """
+    with open(path, 'rb') as f:
+        f.seek(rawoffset)
+        data = f.read(rawsize)
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
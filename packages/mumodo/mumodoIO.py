@@ -53,15 +53,28 @@ __version__ = "2.0"
 __maintainer__ = "Spyros Kousidis"
 __status__ = "Development" # Development/Production/Prototype
 
-from mumodo.xiofile import XIOFile
+import os
+import re
+from functools import partial
+from itertools import islice
+from mumodo.xiofile import XIOFile, XIOMultiFile, XIOColumns, SensorFilter, \
+                           LazyValue
+from mumodo.InstantIO import MFVec2f, MFVec3f, MFRotation, mfvec2f_array, \
+                             mfvec3f_array, mfrotation_array, mf_batch, \
+                             mf_unbatch
 from mumodo.increco import IncReco
 import tgt
+import numpy as np
 import pandas as pd
 
-__all__ = ['open_streamframe_from_xiofile',
-           'save_streamframe_to_xiofile', 'open_intervalframe_from_textgrid',
+__all__ = ['open_streamframe_from_xiofile', 'open_streamframes_from_xiofile',
+           'open_streamframe_chunks_from_xiofile',
+           'save_streamframe_to_xiofile', 'decode_streamframe',
+           'mf_column_array', 'expand_mf_columns', 'collapse_mf_columns',
+           'open_intervalframe_from_textgrid',
            'save_intervalframe_to_textgrid',
-           'quantize', 'open_intervalframe_from_increco',
+           'quantize', 'quantize_arrays', 'Quantizer', 'StreamFrameFollower',
+           'open_intervalframe_from_increco',
            'convert_pointtier_to_streamframe',
            'convert_streamframe_to_pointtier']
 
@@ -69,14 +82,19 @@ def open_streamframe_from_xiofile(filepath, sensorname, window_size=5,
                                   with_fields=None, without_fields=None,
                                   discard_duplicates=True, start_time=0,
                                   end_time=0, relative=True,
-                                  timestamp_offset=0):
+                                  timestamp_offset=0, sensorfilter=None,
+                                  processes=1, readahead=True, lazy=False,
+                                  grid_rate=0, grid_origin=0,
+                                  grid_fill='hold', expand_mf=False):
     """Import data for one sensor out of a XIOFile and return a
        StreamFrame indexed with timestamps. By default, the timestamps
        are made relative. Optionally, and offset can be added to
        relative timestamps or the raw timestamps can be kept.
 
        Arguments:
-       filepath             --  Path + filename of the XIOFile to be imported.
+       filepath             --  Path + filename of the XIOFile to be imported,
+                                or a list of the paths of the parts of a
+                                recording (see XIOMultiFile)
        sensorname           --  Name of the sensor to be imported.
        window_size,
        with_fields,
@@ -91,86 +109,822 @@ def open_streamframe_from_xiofile(filepath, sensorname, window_size=5,
                                will leave the timestamps raw. Any non-zero
                                integer value will be added as offset to the
                                relative timestamps
+       sensorfilter         -- An additional function f(sensorname, fieldname)
+                               that returns True for the lines that should be
+                               imported (see XIOFile.xio_quicklinegen)
+       processes            -- The number of processes that parse blocked
+                               XIO files in parallel (see
+                               XIOFile.xio_quicklinegen)
+       readahead            -- If True (default), the file is decompressed
+                               by a background thread while it is parsed
+                               (see XIOFile.xio_quicklinegen)
+       lazy                 -- If True, vectors, rotations and the other
+                               composite values are converted only when
+                               they are first used (see LazyValue), or
+                               by decode_streamframe. This is much faster
+                               if only a part of the StreamFrame is used
+       grid_rate,
+       grid_origin,
+       grid_fill            -- Quantize onto a fixed clock grid with
+                               grid_rate frames per second instead of
+                               opening a window at every first event
+                               (see quantize_arrays). grid_origin is a
+                               grid point on the index of the StreamFrame
+                               (i.e. after applying timestamp_offset), so
+                               that StreamFrames of different sensors and
+                               files with the same grid share their index
+       expand_mf            -- If True, the MFVec2f, MFVec3f and MFRotation
+                               columns (e.g. the joint positions of a
+                               skeleton) are expanded into one float32
+                               column per item and component (see
+                               expand_mf_columns)
+
+       The values of lines that are not imported (other sensors, fields
+       that are excluded by with_fields or without_fields, or lines
+       rejected by the sensorfilter) are never parsed. If the file has a
+       sidecar index (see XIOFile) and can be entered at any block of
+       lines (uncompressed and blocked gzip files, see
+       XIOFile.xio_canseek), the blocks of lines without the sensor are
+       not even read. Other files are read ahead instead.
+
+    """
+    infile = _open_xiofile(filepath, lazy)
+    selected = SensorFilter(sensorname, with_fields, without_fields)
+    if sensorfilter is None:
+        linefilter = selected
+    else:
+        linefilter = _AllFilters(selected, sensorfilter)
+    events = infile.xio_quickcolumns(start_time, end_time, relative,
+                                     sensorfilter=linefilter,
+                                     processes=processes,
+                                     readahead=readahead and
+                                     not infile.indexed)
+    stream = _quantize_columns(events.get(sensorname, XIOColumns()),
+                               window_size, with_fields, without_fields,
+                               discard_duplicates, grid_rate,
+                               _raw_origin(grid_origin, infile.min_time,
+                                           timestamp_offset),
+                               grid_fill)
+    infile.xiofile_close()
+    stream = _index_streamframe(stream, infile.min_time, timestamp_offset)
+    if expand_mf:
+        stream = expand_mf_columns(stream)
+    return stream
+
+def _open_xiofile(filepath, lazy=False, indexing=False, writeindex=False):
+    """Open a XIOFile (or a list of parts) for reading
+
+    A valid sidecar index is used if the file can be entered at the
+    blocks of lines it points to (see XIOFile.xio_canseek). Plain gzip
+    files are read sequentially instead (and can be read ahead), and a
+    stale index is not rebuilt. If indexing is True, the file is always
+    indexed (with a valid sidecar index, if there is one), and if
+    writeindex is True as well, the index is saved to the sidecar index
+    file.
 
     """
-    infile = XIOFile(filepath, 'r', indexing=False)
-    stream = pd.DataFrame(quantize(infile.xio_quicklinegen(start_time, end_time,
-                                                           True, relative),
-                                   sensorname, window_size, with_fields,
+    if isinstance(filepath, basestring):
+        opener = partial(XIOFile, filepath, 'r')
+        indexfile = filepath + XIOFile.index_suffix
+    else:
+        opener = partial(XIOMultiFile, filepath)
+        indexfile = filepath[0] + XIOMultiFile.index_suffix
+    if indexing:
+        return opener(indexing=True, writeindex=writeindex, lazy=lazy)
+    infile = opener(lazy=lazy)
+    if os.path.isfile(indexfile) and infile.xio_canseek() and \
+       infile.xio_loadindex():
+        infile.indexed = True
+    return infile
+
+def open_streamframe_chunks_from_xiofile(filepath, sensorname,
+                                         chunk_rows=10000, chunk_duration=0,
+                                         window_size=5, with_fields=None,
+                                         without_fields=None,
+                                         discard_duplicates=True,
+                                         start_time=0, end_time=0,
+                                         relative=True, timestamp_offset=0,
+                                         sensorfilter=None, processes=1,
+                                         lazy=False, grid_rate=0,
+                                         grid_origin=0, grid_fill='hold',
+                                         batchsize=65536, writeindex=False):
+    """Import data for one sensor out of a XIOFile in chunks
+
+       A generator that yields consecutive StreamFrames, which together
+       contain the same frames as the StreamFrame returned by
+       open_streamframe_from_xiofile with the same arguments, i.e.
+       pd.concat of the chunks is that StreamFrame. Only one chunk and
+       batchsize lines are in memory at a time, so that recordings of
+       any length can be processed.
+
+       The lines are quantized in batches. The window that is still
+       open at the end of a batch (or with a grid, the last value of
+       each field) is carried over to the next batch. In grid mode, the
+       chunks are exact if the timestamps of the sensor are in order.
+       With grid_fill='nearest', a grid frame is only complete when
+       every field has an event after it, so a field that stops early
+       keeps the later frames in memory until the end of the file.
+
+       The file is indexed first, if it has no valid sidecar index (see
+       XIOFile). All chunks have a column for each field of the sensor
+       in the index. A column has the dtype it would have in a
+       StreamFrame of the frames of the chunk, except that int and bool
+       columns without any values are object instead of float64, so
+       that pd.concat of the chunks has the dtypes of the whole
+       StreamFrame.
+
+       Arguments:
+       filepath             --  Path + filename of the XIOFile to be imported,
+                                or a list of the paths of the parts of a
+                                recording (see XIOMultiFile)
+       sensorname           --  Name of the sensor to be imported.
+
+       Keyword arguments:
+       chunk_rows           --  The number of frames in a chunk (the last
+                                chunk may have less)
+       chunk_duration       --  If larger than 0, the chunks are periods
+                                of chunk_duration ms of the index instead,
+                                starting at multiples of chunk_duration.
+                                Periods without frames are skipped
+       batchsize            --  The number of lines quantized at a time
+       writeindex           --  If True, the index is saved to the sidecar
+                                index file, so that the next import reads
+                                the file only once
+       Other keyword arguments are the same as for
+       open_streamframe_from_xiofile.
+
+    """
+    if without_fields is None:
+        without_fields = []
+    infile = _open_xiofile(filepath, lazy, indexing=True,
+                           writeindex=writeindex)
+    selected = SensorFilter(sensorname, with_fields, without_fields)
+    if sensorfilter is None:
+        linefilter = selected
+    else:
+        linefilter = _AllFilters(selected, sensorfilter)
+    if with_fields:
+        columns = sorted(set(with_fields))
+    else:
+        columns = sorted(x for x in infile.fieldnames.get(sensorname, [])
+                         if linefilter(sensorname, x))
+    valuetypes = dict((x, infile.catalog[(sensorname, x)][0].lower())
+                      for x in columns
+                      if (sensorname, x) in infile.catalog)
+    chunker = _StreamChunker(columns, valuetypes, window_size,
+                             without_fields, discard_duplicates, grid_rate,
+                             _raw_origin(grid_origin, infile.min_time,
+                                         timestamp_offset),
+                             grid_fill)
+    rows = infile.xio_quicklinegen(start_time, end_time, True, relative,
+                                   sensorfilter=linefilter,
+                                   processes=processes,
+                                   readahead=not infile.xio_canseek(),
+                                   records=True)
+    chunk = None
+    try:
+        final = False
+        while not final:
+            batch = list(islice(rows, batchsize))
+            final = len(batch) < batchsize
+            frames = _index_streamframe(chunker.push(batch, final),
+                                        infile.min_time, timestamp_offset)
+            if chunk is None or len(chunk) == 0:
+                chunk = frames
+            elif len(frames):
+                chunk = pd.concat([chunk, frames])
+            while len(chunk):
+                if chunk_duration > 0:
+                    #the frames up to the first one of another period
+                    periods = chunk.index.values // chunk_duration
+                    later = np.flatnonzero(periods != periods[0])
+                    if len(later) == 0 and not final:
+                        break
+                    end = later[0] if len(later) else len(chunk)
+                else:
+                    if len(chunk) < chunk_rows and not final:
+                        break
+                    end = chunk_rows
+                yield chunk[:end]
+                chunk = chunk[end:]
+    finally:
+        infile.xiofile_close()
+
+class _StreamChunker(object):
+
+    """Quantize the records of one sensor batch by batch"""
+
+    def __init__(self, columns, valuetypes, window_size, without_fields,
+                 discard_duplicates, grid_rate, grid_origin, grid_fill):
+        self.columns = columns
+        self.valuetypes = valuetypes
+        self.kwargs = {'window_size': window_size,
+                       'without_fields': without_fields,
+                       'discard_duplicates': discard_duplicates,
+                       'grid_rate': grid_rate, 'grid_origin': grid_origin,
+                       'grid_fill': grid_fill, 'columns': columns}
+        self.grid = grid_rate > 0
+        self.nearest = grid_fill == 'nearest'
+        #the records that may still change later frames
+        self.pending = []
+        #the timestamp of the last grid frame that was returned
+        self.done = None
+
+    def push(self, batch, final=False):
+        """Add a batch of records, and return the complete frames
+
+        Arguments:
+        batch   --  A list of XIORecords
+
+        Keyword arguments:
+        final   --  If True, the frames that are still open are returned
+                    too
+
+        """
+        records = self.pending + batch
+        limit = None
+        if self.grid:
+            if not final:
+                limit, self.pending = self.__holdback__(records)
+            frames = records
+        elif final:
+            frames, self.pending = records, []
+        else:
+            #all windows but the last one (which may still grow)
+            times = np.array([x.time for x in records], dtype=np.int64)
+            starts = _window_starts(times, self.kwargs['window_size'])
+            last = starts[-1] if len(starts) else 0
+            frames, self.pending = records[:last], records[last:]
+        stream = _quantize_records(frames, **self.kwargs)
+        if self.grid:
+            #only the grid frames that are new and cannot change any more
+            keep = np.ones(len(stream), dtype=bool)
+            if self.done is not None:
+                keep &= (stream['time'] > self.done).values
+            if limit is not None:
+                keep &= (stream['time'] < limit).values
+            stream = stream[keep]
+            if len(stream):
+                self.done = stream['time'].iloc[-1]
+        #int and bool columns without values are object, as they are in
+        #a StreamFrame with missing values, so that concatenating them
+        #with chunks that have values does not turn these into floats
+        for column in self.columns:
+            if _VALUE_KINDS.get(self.valuetypes.get(column)) in (int, bool) \
+               and stream[column].dtype == np.float64:
+                stream[column] = stream[column].astype(object)
+        return stream
+
+    def __holdback__(self, records):
+        """Return the time up to which the grid frames are complete, and
+           the records needed for the later frames"""
+        lasttimes = {}
+        for x in records:
+            lasttimes[x.fieldname] = x.time
+        if not lasttimes:
+            return None, records
+        if self.nearest:
+            #every field needs an event after a grid point
+            if set(self.columns) - set(lasttimes):
+                limit = -1
+            else:
+                limit = min(lasttimes[x] for x in self.columns)
+        else:
+            limit = max(lasttimes.values())
+        #the records at or after limit, and the last one of each field
+        #before limit
+        before = {}
+        keep = []
+        for i, x in enumerate(records):
+            if x.time < limit:
+                before[x.fieldname] = i
+            else:
+                keep.append(i)
+        keep = sorted(keep + before.values())
+        return limit, [records[i] for i in keep]
+
+def open_streamframes_from_xiofile(filepath, sensornames, window_size=5,
+                                   with_fields=None, without_fields=None,
+                                   discard_duplicates=True, start_time=0,
+                                   end_time=0, relative=True,
+                                   timestamp_offset=0, processes=1,
+                                   readahead=True, lazy=False, grid_rate=0,
+                                   grid_origin=0, grid_fill='hold',
+                                   expand_mf=False):
+    """Import data for several sensors out of a XIOFile in a single pass
+       and return a dict of StreamFrames, with the sensornames as keys.
+
+       The result is the same as calling open_streamframe_from_xiofile
+       once per sensor, but the file is decompressed and parsed only once.
+
+       Arguments:
+       filepath             --  Path + filename of the XIOFile to be imported,
+                                or a list of the paths of the parts of a
+                                recording (see XIOMultiFile)
+       sensornames          --  Names of the sensors to be imported. Either
+                                a list of sensornames, or a dict with the
+                                sensornames as keys and dicts of keyword
+                                arguments as values. The keyword arguments
+                                window_size, with_fields, without_fields,
+                                discard_duplicates, timestamp_offset,
+                                expand_mf and the grid_ arguments given
+                                there override the defaults below for
+                                that sensor.
+
+       Keyword arguments:
+       window_size,
+       with_fields,
+       without_fields,
+       discard_duplicates,
+       timestamp_offset,
+       grid_rate,
+       grid_origin,
+       grid_fill,
+       expand_mf            --  Defaults for all sensors (see
+                                open_streamframe_from_xiofile)
+       start_time,
+       end_time,
+       relative,
+       processes,
+       readahead            -- Parameters for xio_quicklinegen (see
+                               open_streamframe_from_xiofile).
+       lazy                 -- Convert composite values only when they
+                               are used (see open_streamframe_from_xiofile)
+
+    """
+    defaults = {'window_size': window_size, 'with_fields': with_fields,
+                'without_fields': without_fields,
+                'discard_duplicates': discard_duplicates,
+                'timestamp_offset': timestamp_offset, 'grid_rate': grid_rate,
+                'grid_origin': grid_origin, 'grid_fill': grid_fill,
+                'expand_mf': expand_mf}
+    settings = {}
+    for sensorname in sensornames:
+        settings[sensorname] = dict(defaults)
+        if isinstance(sensornames, dict) and sensornames[sensorname]:
+            settings[sensorname].update(sensornames[sensorname])
+
+    #the events of each sensor, quantized when the file has been read
+    infile = _open_xiofile(filepath, lazy)
+    events = infile.xio_quickcolumns(start_time, end_time, relative,
+                                     sensorfilter=SensorFilter(settings),
+                                     processes=processes,
+                                     readahead=readahead and
+                                     not infile.indexed)
+    infile.xiofile_close()
+
+    streams = {}
+    for sensorname in settings:
+        kwargs = dict(settings[sensorname])
+        timestamp_offset = kwargs.pop('timestamp_offset')
+        expand = kwargs.pop('expand_mf')
+        kwargs['grid_origin'] = _raw_origin(kwargs['grid_origin'],
+                                            infile.min_time, timestamp_offset)
+        stream = _quantize_columns(events.pop(sensorname, XIOColumns()),
+                                   **kwargs)
+        stream = _index_streamframe(stream, infile.min_time, timestamp_offset)
+        if expand:
+            stream = expand_mf_columns(stream)
+        streams[sensorname] = stream
+    return streams
+
+class StreamFrameFollower(object):
+
+    """Keep a StreamFrame up to date with an XIO file being written."""
+
+    def __init__(self, filepath, sensorname, window_size=5, with_fields=None,
+                 without_fields=None, discard_duplicates=True,
+                 timestamp_offset=0, sensorfilter=None):
+        """Follow one sensor of an XIO file that is still being written
+
+        Every call of refresh returns a StreamFrame with all the data of
+        the sensor written so far. Only the lines that were appended
+        since the previous call are parsed and quantized: the frames
+        quantized so far and the state of the quantizer are kept (see
+        XIOFile.xio_follow and Quantizer).
+
+        The last frame may still change when more lines are appended
+        (its window is still open).
+
+        Arguments and keyword arguments are the same as for
+        open_streamframe_from_xiofile (timestamps are always relative
+        to the first timestamp in the file, plus timestamp_offset).
+
+        """
+        self.infile = XIOFile(filepath, 'r', indexing=False, follow=True)
+        selected = SensorFilter(sensorname, with_fields, without_fields)
+        if sensorfilter is None:
+            self.linefilter = selected
+        else:
+            self.linefilter = _AllFilters(selected, sensorfilter)
+        self.quantizer = Quantizer(sensorname, window_size, with_fields,
                                    without_fields, discard_duplicates,
-                                   enumerate_fields=True))
+                                   enumerate_fields=True)
+        self.timestamp_offset = timestamp_offset
+        self.frames = []
+
+    def refresh(self, timeout=0, poll_interval=0.5):
+        """Parse the new lines and return the updated StreamFrame
+
+        Keyword arguments:
+        timeout         --  Seconds to wait for new lines (see
+                            XIOFile.xio_follow). By default, only the
+                            lines written so far are parsed
+        poll_interval   --  Seconds between looking for new lines
+
+        """
+        for row in self.infile.xio_follow(sensorfilter=self.linefilter,
+                                          poll_interval=poll_interval,
+                                          timeout=timeout):
+            frame = self.quantizer.push(row)
+            if frame:
+                self.frames.append(frame)
+        return _make_streamframe(self.frames + [self.quantizer.flush(),
+                                                self.quantizer.enumeration()],
+                                 getattr(self.infile, 'min_time', 0),
+                                 self.timestamp_offset)
+
+    def close(self):
+        """Close the XIO file"""
+        if self.infile.tail is not None:
+            self.infile.tail.close()
+        self.infile.xiofile_close()
+
+class _AllFilters(object):
+
+    """Combine sensorfilters (picklable, unlike a lambda)"""
+
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def __call__(self, sensorname, fieldname):
+        for linefilter in self.filters:
+            if not linefilter(sensorname, fieldname):
+                return False
+        return True
+
+def _make_streamframe(frames, min_time, timestamp_offset):
+    """Create a StreamFrame from quantized frames
+
+    The last frame must be the one with the enumerated fields (see
+    quantize), which is dropped after the DataFrame has been created.
+    The columns then get the same dtypes as in quantize_arrays.
+
+    """
+    stream = pd.DataFrame(frames)
     stream.dropna(subset=['time'], inplace=True)
     stream = stream[:-1]
+    if len(stream) < 1:
+        return stream
+    stream = pd.DataFrame(dict((column, _typed_column(stream[column].values)
+                                if column != 'time' else stream[column])
+                               for column in stream.columns))
+    return _index_streamframe(stream, min_time, timestamp_offset)
+
+def _index_streamframe(stream, min_time, timestamp_offset):
+    """Index a StreamFrame with its (relative or raw) timestamps"""
     if len(stream) < 1:
         return stream
     stream.index = stream['time'].map(lambda x: int(x))
     if type(timestamp_offset) == int:
-        stream.index -= infile.min_time
+        stream.index -= min_time
         stream.index += timestamp_offset
     else:
         print "non-int offset in input: raw timestamps from the file will be" +\
                " used"
-    infile.xiofile_close()
     stream.index.name = None
     return stream
 
-def save_streamframe_to_xiofile(framedict, filepath):
+def decode_streamframe(streamframe, columns=None):
+    """Convert the lazy values of a StreamFrame
+
+    Returns a copy of a StreamFrame imported with lazy=True (see
+    open_streamframe_from_xiofile), in which the LazyValues are replaced
+    by the converted values. To convert only a time slice, slice the
+    StreamFrame first, e.g. decode_streamframe(stream.ix[1000:2000])
+
+    Arguments:
+    streamframe -- the StreamFrame with LazyValues
+
+    Keyword arguments:
+    columns     -- list of the columns to convert. Defaults to all columns
+
+    """
+    streamframe = streamframe.copy()
+    if columns is None:
+        columns = streamframe.columns
+    for col in columns:
+        if streamframe[col].dtype == object:
+            streamframe[col] = [x.value if isinstance(x, LazyValue) else x
+                                for x in streamframe[col].values]
+    return streamframe
+
+#the number of values per item of the MF vector types, by the type of the
+#values (or the parsing function of LazyValues)
+_MF_WIDTHS = {MFVec2f: 2, MFVec3f: 3, MFRotation: 4, mfvec2f_array: 2,
+              mfvec3f_array: 3, mfrotation_array: 4}
+
+#the names of the components of an item, by width
+_MF_COMPONENTS = {2: ['x', 'y'], 3: ['x', 'y', 'z'],
+                  4: ['qx', 'qy', 'qz', 'qw']}
+
+_MF_COLUMN = re.compile(r'^(.*)_(\d+)_(x|y|z|qx|qy|qz|qw)$')
+
+def _mf_width(values):
+    """Return the width of the first MF vector value, None if there is
+       none (or the first value is of another type)"""
+    for value in values:
+        if isinstance(value, LazyValue):
+            return _MF_WIDTHS.get(value.function)
+        if isinstance(value, np.ndarray):
+            return value.shape[1] if value.ndim == 2 else None
+        if type(value) in _MF_WIDTHS:
+            return _MF_WIDTHS[type(value)]
+        if value is not None and value == value:
+            return None
+
+def mf_column_array(streamframe, column, dtype=np.float32):
+    """Return an MF vector column of a StreamFrame as an ndarray
+
+    Returns an array of shape (frames x items x width), e.g.
+    (frames x joints x 3) for the MFVec3f joint positions of a skeleton,
+    whose rows are in the order of the index of the StreamFrame. Frames
+    without a value, or with fewer items (e.g. an empty []), have NaN
+    for the missing items. LazyValues are decoded straight from their
+    strings. Use mf_unbatch (see InstantIO) to convert the array back
+    into MF objects.
+
+    Arguments:
+    streamframe -- the StreamFrame
+    column      -- the name of a column of MFVec2f, MFVec3f or MFRotation
+                   values
+
+    Keyword arguments:
+    dtype       -- the dtype of the array
+
+    """
+    values = streamframe[column].values
+    width = _mf_width(values)
+    if width is None:
+        print str(column) + " is not a column of MF vectors"
+        return
+    return mf_batch([x.raw if isinstance(x, LazyValue) else x
+                     for x in values], width, dtype)
+
+def expand_mf_columns(streamframe, columns=None, dtype=np.float32):
+    """Expand MF vector columns into one float column per component
+
+    Returns a copy of a StreamFrame in which each column of MFVec2f,
+    MFVec3f or MFRotation values is replaced by a float column for each
+    component of each item, named column_item_component, e.g.
+    JointPositions3_0_x, JointPositions3_0_y, ..., JointPositions3_19_z
+    for the 20 joints of a skeleton. The components of rotations are
+    qx, qy, qz and qw. Frames without a value, or with fewer items (e.g.
+    an empty []), have NaN for the missing items (see mf_column_array),
+    and columns without any items have no float columns at all. The
+    other columns are kept as they are.
+
+    Arguments:
+    streamframe -- the StreamFrame
+
+    Keyword arguments:
+    columns     -- list of the columns to expand. Defaults to all the
+                   columns of MF vectors
+    dtype       -- the dtype of the new columns
+
+    """
+    order = []
+    data = {}
+    for col in streamframe.columns:
+        values = streamframe[col].values
+        width = None
+        if columns is None or col in columns:
+            width = _mf_width(values)
+        if width is None:
+            order.append(col)
+            data[col] = values
+            continue
+        batch = mf_column_array(streamframe, col, dtype)
+        names = ['%s_%d_%s' % (col, item, component)
+                 for item in range(batch.shape[1])
+                 for component in _MF_COMPONENTS[width]]
+        for name, values in zip(names, batch.reshape(len(batch), -1).T):
+            order.append(name)
+            data[name] = values
+    return pd.DataFrame(data, index=streamframe.index, columns=order)
+
+def collapse_mf_columns(streamframe, columns=None):
+    """Convert expanded MF vector columns back into MF objects
+
+    The inverse of expand_mf_columns, e.g. before saving a StreamFrame
+    with save_streamframe_to_xiofile: the float columns named
+    column_item_component are replaced by a column of MFVec2f, MFVec3f
+    or MFRotation objects (depending on the components), with the items
+    that are not all NaN. Frames without any such items have NaN (and
+    are not saved).
+
+    Arguments:
+    streamframe -- the StreamFrame
+
+    Keyword arguments:
+    columns     -- list of the names of the MF columns to restore.
+                   Defaults to all the expanded columns
+
+    """
+    groups = {}
+    for col in streamframe.columns:
+        match = _MF_COLUMN.match(str(col))
+        if match and (columns is None or match.group(1) in columns):
+            groups.setdefault(match.group(1), []).append(
+                (int(match.group(2)), match.group(3), col))
+    order = []
+    data = {}
+    for col in streamframe.columns:
+        match = _MF_COLUMN.match(str(col))
+        if not match or match.group(1) not in groups:
+            order.append(col)
+            data[col] = streamframe[col].values
+            continue
+        name = match.group(1)
+        if name in data:
+            continue
+        components = set(x[1] for x in groups[name])
+        if 'qw' in components:
+            width = 4
+        elif 'z' in components:
+            width = 3
+        else:
+            width = 2
+        nitems = max(x[0] for x in groups[name]) + 1
+        dtype = np.result_type(*[streamframe[x[2]].dtype
+                                 for x in groups[name]])
+        batch = np.empty((len(streamframe), nitems, width), dtype)
+        batch.fill(np.nan)
+        for item, component, expanded in groups[name]:
+            batch[:, item, _MF_COMPONENTS[width].index(component)] = \
+                streamframe[expanded].values
+        order.append(name)
+        data[name] = _object_array(mf_unbatch(batch))
+    return pd.DataFrame(data, index=streamframe.index, columns=order)
+
+def save_streamframe_to_xiofile(framedict, filepath, chunksize=65536,
+                                blocksize=0, compresslevel=9, threads=1):
     """Save many streamframes to a single XIOFile.
 
+    The lines of all StreamFrames are written in time order, and the
+    fields of a frame in the order of the columns (frames of different
+    sensors with the same timestamp in the order of the sensornames). The
+    XIO type of each column is resolved once (or once per type of value
+    in object columns), and the values are converted to strings a whole
+    column at a time. The StreamFrames are merged chunk by chunk, so
+    that they are never copied, and the lines are written in large
+    batches.
+
     Arguments:
     framedict   --  a dict of streamframes, keys are the
                     sensornames
     filepath    --  Path + filename of the file to be written.
-    sensorname  --  Name of the sensor.
 
-    """
+    Keyword arguments:
+    chunksize   --  The (approximate) number of frames formatted at a time
+    blocksize,
+    compresslevel,
+    threads     --  The compression of the file (see XIOFile). Lower
+                    compression levels or several threads make saving
+                    large StreamFrames much faster
 
-    #create a joined streamframe
-    frame = None
-    for key in framedict.keys():
-        if len(framedict[key]) < 1:
+    """
+    sensors = []
+    for key in sorted(framedict.keys()):
+        streamframe = framedict[key]
+        if len(streamframe) < 1:
             continue
-        sensorframe = framedict[key].copy(deep=True)
-        sensorframe['sensorname'] = key
-        if frame is None:
-            frame = sensorframe
-        else:
-            frame = frame.append(sensorframe)
+        times = np.asarray(streamframe.index).astype(np.int64)
+        order = np.argsort(times, kind='mergesort')
+        columns = [(col, _xio_column_type(streamframe[col]))
+                   for col in streamframe.columns
+                   if col not in ['time', 'sensorname']]
+        sensors.append((key, streamframe, times[order], order, columns))
 
-    if len(frame) < 1:
+    if not sensors:
         print "invalid data!"
         return
 
-    frame.sort_index(inplace=True)
+    #the timestamps at which the chunks start
+    alltimes = np.sort(np.concatenate([x[2] for x in sensors]),
+                       kind='mergesort')
+    starts = np.unique(alltimes[::max(chunksize, 1)]).tolist()
+    bounds = zip(starts, starts[1:] + [alltimes[-1] + 1])
 
-    outfile = XIOFile(filepath, 'w')
-    types = {'float': 'sffloat', 'SFVec3f': 'sfvec3f', 'SFVec2f': 'sfvec2f',
-             'SFRotation': 'sfrotation', 'MFVec3f': 'mfvec3f',
-             'MFVec2f': 'mfvec2f', 'MFRotation': 'mfrotation',
-             'MFString': 'mfstring', 'MFFloat': 'mffloat',
-             'bool':'sfbool', 'int':'sfint32', 'str':'sfstring'}
-
-    for row in frame.iterrows(): #each row of the dataframe
-        timestamp = int(row[0])
-        fields = row[1]
-        sensorname = fields['sensorname']
-
-        for fieldname in row[1].index:  #fieldname becomes name of each column
-            if fieldname in ['time', 'sensorname']:
+    outfile = XIOFile(filepath, 'w', blocksize=blocksize,
+                      compresslevel=compresslevel, threads=threads)
+    for start, end in bounds:
+        keys = []
+        records = []
+        for sensorpos, (sensorname, streamframe, times, order,
+                        columns) in enumerate(sensors):
+            first, last = np.searchsorted(times, [start, end])
+            if first == last:
                 continue
-            for key in types:
-                if key in str(type(row[1][fieldname])):
-                    otype = types[key]
-                    value = row[1][fieldname]
-                    if str(value).lower() != 'nan':
-                        outfile.xio_writeline(outfile.xio_formatline(otype,
-                                                                     value,
-                                                                     sensorname,
-                                                                     fieldname,
-                                                                     timestamp))
+            rows = order[first:last]
+            chunktimes = times[first:last]
+            for colpos, (col, valuetype) in enumerate(columns):
+                found = _xio_column_values(streamframe[col].values[rows],
+                                           valuetype)
+                if found is None:
+                    continue
+                positions, valuetypes, values = found
+                timestamps = chunktimes[positions].tolist()
+                keys.append((timestamps, [sensorpos] * len(positions),
+                             positions.tolist(), [colpos] * len(positions)))
+                records.extend(zip(valuetypes, [sensorname] * len(values),
+                                   [col] * len(values), timestamps, values))
+        if not records:
+            continue
+        keys = [np.concatenate([np.asarray(x[i], dtype=np.int64)
+                                for x in keys]) for i in range(4)]
+        #by time, sensor, frame and column
+        order = np.lexsort(keys[::-1])
+        outfile.xio_writerecords([records[i] for i in order])
     outfile.xiofile_close()
     return
 
+#the XIO types of the values, by (a part of) the name of their type
+_XIO_TYPES = {'float': 'sffloat', 'SFVec3f': 'sfvec3f', 'SFVec2f': 'sfvec2f',
+              'SFRotation': 'sfrotation', 'MFVec3f': 'mfvec3f',
+              'MFVec2f': 'mfvec2f', 'MFRotation': 'mfrotation',
+              'MFString': 'mfstring', 'MFFloat': 'mffloat',
+              'bool': 'sfbool', 'int': 'sfint32', 'str': 'sfstring'}
+
+#the XIO types of LazyValues, by their parsing function
+_LAZY_TYPES = {MFVec2f: 'mfvec2f', MFVec3f: 'mfvec3f',
+               MFRotation: 'mfrotation', mfvec2f_array: 'mfvec2f',
+               mfvec3f_array: 'mfvec3f', mfrotation_array: 'mfrotation'}
+
+def _xio_type(valuetype):
+    """Return the XIO type of the values of a Python type, None if the
+       values cannot be saved"""
+    name = str(valuetype)
+    for key in _XIO_TYPES:
+        if key in name:
+            return _XIO_TYPES[key]
+
+def _xio_column_type(column):
+    """Return the XIO type of a column, None if it depends on the values
+       (object columns)"""
+    if column.dtype == object:
+        return None
+    return _xio_type(column.dtype.type)
+
+def _xio_column_values(values, valuetype):
+    """Convert the values of a column to strings for saving
+
+    Returns a tuple of the positions of the values that are saved
+    (missing values are not), their XIO types and their strings, or None
+    if no value is saved.
+
+    Arguments:
+    values      -- an ndarray of values
+    valuetype   -- the XIO type of the column (see _xio_column_type)
+
+    """
+    if valuetype is not None:
+        if values.dtype.kind == 'f':
+            positions = np.flatnonzero(~np.isnan(values))
+        else:
+            positions = np.arange(len(values))
+        if len(positions) == 0:
+            return None
+        return (positions, [valuetype] * len(positions),
+                values[positions].astype(str).tolist())
+    if values.dtype != object:
+        return None
+    positions = []
+    valuetypes = []
+    strings = []
+    cache = {}
+    for i, value in enumerate(values):
+        if isinstance(value, LazyValue):
+            xiotype = _LAZY_TYPES.get(value.function)
+            if xiotype is not None:
+                #save the raw string, without converting the value
+                positions.append(i)
+                valuetypes.append(xiotype)
+                strings.append(value.raw)
+                continue
+            value = value.value
+        kind = type(value)
+        if kind not in cache:
+            cache[kind] = _xio_type(kind)
+        if cache[kind] is None or value != value:
+            continue
+        positions.append(i)
+        valuetypes.append(cache[kind])
+        strings.append(str(value))
+    if not positions:
+        return None
+    return np.array(positions, dtype=np.int64), valuetypes, strings
+
 def open_intervalframe_from_textgrid(filepath, encoding='utf-8',
                                      asobjects=False,
                                      include_empty_intervals=False):
@@ -317,10 +1071,15 @@ def quantize(rows, sensorname, window_size=5, with_fields=None,
     fields in the frame and their values. The function can be directly
     input to a Pandas Dataframe constructor (as the data argument)
 
+    quantize_arrays does the same for all events at once, and is much
+    faster for importing whole files.
+
     Arguments:
     rows  -- iterable with dictionaries as items. They represent parsed
              I/O events. These dictionaries' keys should be:
             ['sensorname', 'fieldname', 'time', 'type','value']
+             The items can also be XIORecord tuples (see
+             XIOFile.xio_quicklinegen), which is faster
 
     sensorname --  the name of the sensor by which to group
 
@@ -345,57 +1104,396 @@ def quantize(rows, sensorname, window_size=5, with_fields=None,
                         value in it
 
     """
-    if with_fields is None:
-        with_fields = []
+    quantizer = Quantizer(sensorname, window_size, with_fields,
+                          without_fields, discard_duplicates,
+                          enumerate_fields)
+    for row in rows:
+        frame = quantizer.push(row)
+        if frame:
+            yield frame
+    #After the loop, ensure the last frame is yielded
+    yield quantizer.flush()
+
+    #then add row with True for all keys, so that column-types aren't
+    #converted automatically to float, due to a NaN value
+    if enumerate_fields:
+        yield quantizer.enumeration()
+
+def quantize_arrays(times, codes, values, fieldnames, window_size=5,
+                    discard_duplicates=True, grid_rate=0, grid_origin=0,
+                    grid_fill='hold', kinds=None):
+    """Quantize columns of events into frames, and return a StreamFrame
+
+    This does the same as quantize (with enumerate_fields=True), but
+    for all events at once, with array operations instead of a loop
+    over the events, which is much faster. The events of one sensor are
+    given as three columns (arrays or lists of the same length). The
+    events that open a window are found with a binary search in the
+    timestamps, duplicate fields in a window are resolved by keeping
+    the first or the last value of each (window, field) pair, and the
+    values are then put into one column per field.
+
+    The returned DataFrame has one row per frame (in the order of the
+    events that opened the windows), a column 'time' with the
+    timestamps of the frames, and one column per fieldname, sorted by
+    name like the columns of a DataFrame created from quantize. A column
+    has dtype float64 if all its values are floats (missing values are
+    NaN). Columns with only ints or only bools in every frame have dtype
+    int64 or bool. All other columns have dtype object, with NaN for
+    missing values.
+
+    Arguments:
+    times       --  The timestamps of the events
+    codes       --  The field of each event, as an index into fieldnames.
+                    Events with a negative code are ignored (like the
+                    fields excluded by with_fields and without_fields in
+                    quantize)
+    values      --  The (parsed) values of the events
+    fieldnames  --  The names of the fields. Every field becomes a column,
+                    also if it has no events
+
+    Keyword arguments:
+    window_size,
+    discard_duplicates  --  see quantize
+    grid_rate   --  If larger than 0, the frames are not opened by the
+                    events, but lie on a fixed clock grid with grid_rate
+                    frames per second (e.g. 30). The grid points are
+                    grid_origin + k * 1000 / grid_rate, rounded to whole
+                    ms, from the first to the last event. StreamFrames
+                    with the same grid share their timestamps, and can
+                    be compared without aligning them first. The
+                    window_size and discard_duplicates are then ignored
+    grid_origin --  A timestamp that is a point of the grid
+    grid_fill   --  How the grid frames get their values:
+                    'hold' (default) - the value of the last event of
+                    each field at or before the frame (the value is
+                    held until the next event of the field)
+                    'nearest' - the value of the event of each field
+                    that is nearest to the frame (the earlier one if
+                    two are equally near)
+    kinds       --  The type (float, int or bool) of all the values of
+                    each field, or None where it is not known. The
+                    columns of fields with a known type get their dtype
+                    without looking at the values
+
+    """
+    if kinds is None:
+        kinds = [None] * len(fieldnames)
+    times = np.asarray(times, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int64)
+    values = _object_array(values)
+    if len(codes) and codes.min() < 0:
+        keep = codes >= 0
+        times, codes, values = times[keep], codes[keep], values[keep]
+    if grid_rate > 0:
+        return _grid_frames(times, codes, values, fieldnames, grid_rate,
+                            grid_origin, grid_fill, kinds)
+    starts = _window_starts(times, window_size)
+    #the window of each event. Events with timestamps <= 0 before the
+    #first window are dropped, as they are in a frame without time
+    window = np.zeros(len(times), dtype=np.int64)
+    window[starts] = 1
+    window = np.cumsum(window) - 1
+    inwindow = window >= 0
+    #one event per (window, field): the first or the last one
+    key = window[inwindow] * max(len(fieldnames), 1) + codes[inwindow]
+    events = np.flatnonzero(inwindow)
+    if discard_duplicates:
+        _, first = np.unique(key, return_index=True)
+        events = events[first]
+    else:
+        _, last = np.unique(key[::-1], return_index=True)
+        events = events[len(key) - 1 - last]
+    #group the events by field, and put their values into columns
+    events = events[np.argsort(codes[events], kind='mergesort')]
+    bounds = np.searchsorted(codes[events], np.arange(len(fieldnames) + 1))
+    columns = {'time': times[starts]}
+    for code, fieldname in enumerate(fieldnames):
+        selected = events[bounds[code]:bounds[code + 1]]
+        columns[fieldname] = _field_column(len(starts), window[selected],
+                                           values[selected], kinds[code])
+    return pd.DataFrame(columns, columns=sorted(columns))
+
+def _grid_frames(times, codes, values, fieldnames, grid_rate, grid_origin,
+                 grid_fill, kinds):
+    """Resample events onto a fixed clock grid (see quantize_arrays)"""
+    if grid_fill not in ['hold', 'nearest']:
+        print "unknown grid_fill " + str(grid_fill) + ", using 'hold'"
+        grid_fill = 'hold'
+    period = 1000.0 / grid_rate
+    if len(times) > 0:
+        steps = np.arange(np.ceil((times.min() - grid_origin) / period),
+                          np.floor((times.max() - grid_origin) / period) + 1)
+    else:
+        steps = np.arange(0)
+    grid = np.round(grid_origin + steps * period).astype(np.int64)
+    #the events of each field, sorted by time (stable, so that the last
+    #of several events with the same timestamp is the latest one)
+    order = np.lexsort((times, codes))
+    bounds = np.searchsorted(codes[order], np.arange(len(fieldnames) + 1))
+    columns = {'time': grid}
+    for code, fieldname in enumerate(fieldnames):
+        selected = order[bounds[code]:bounds[code + 1]]
+        fieldtimes = times[selected]
+        #the last event at or before each grid point
+        before = np.searchsorted(fieldtimes, grid, 'right') - 1
+        if grid_fill == 'nearest' and len(selected) > 0:
+            after = np.minimum(before + 1, len(selected) - 1)
+            later = (fieldtimes[after] - grid < grid - fieldtimes[before]) | \
+                    (before < 0)
+            before = np.where(later, after, before)
+        found = before >= 0
+        columns[fieldname] = _field_column(len(grid), np.flatnonzero(found),
+                                           values[selected[before[found]]],
+                                           kinds[code])
+    return pd.DataFrame(columns, columns=sorted(columns))
+
+def _window_starts(times, window_size):
+    """Return the indices of the events that open a window
+
+    The same windows as those of Quantizer.push: an event opens a new
+    window if its timestamp is later than the end of the current window
+    (the timestamp of the event that opened it plus window_size). Where
+    the timestamps are not smaller than the end of a window at any
+    earlier event (i.e. almost everywhere), the next window starts at
+    the first event after the end of the window, which is found by
+    binary search in the running maximum of the timestamps.
+
+    """
+    if len(times) == 0:
+        return np.array([], dtype=np.int64)
+    runmax = np.maximum.accumulate(times)
+    ends = times + window_size
+    nextstart = np.searchsorted(runmax, ends, 'right').tolist()
+    backwards = (runmax > ends).tolist()
+    timelist = times.tolist()
+    starts = []
+    i = int(np.searchsorted(runmax, 0, 'right'))
+    while i < len(timelist):
+        starts.append(i)
+        if backwards[i]:
+            #an earlier timestamp is later than the end of the window
+            end = ends[i]
+            i += 1
+            while i < len(timelist) and timelist[i] <= end:
+                i += 1
+        else:
+            i = nextstart[i]
+    return np.array(starts, dtype=np.int64)
+
+def _object_array(values):
+    """Return a one-dimensional object array of values
+
+    Unlike np.array(values, dtype=object), this never looks into values
+    that are sequences (e.g. MFVec3f), which is faster, and does not
+    create a two-dimensional array for sequences of the same length.
+
+    """
+    values = list(values)
+    getvalue = np.frompyfunc(values.__getitem__, 1, 1)
+    return getvalue(np.arange(len(values))).astype(object)
+
+def _field_column(length, rows, values, kind=None):
+    """Put the values of a field into a column of length frames, at the
+       given (distinct) rows, with NaN in the other rows and a dtype as
+       described in quantize_arrays. kind is the type of all the values,
+       if it is known"""
+    complete = len(rows) == length
+    if kind is float or (kind in (int, bool) and complete):
+        column = np.empty(length, dtype=_KIND_DTYPES[kind])
+        if not complete:
+            column.fill(np.nan)
+        column[rows] = values
+        return column
+    column = np.empty(length, dtype=object)
+    column.fill(np.nan)
+    column[rows] = values
+    if kind is None or len(rows) == 0:
+        return _typed_column(column)
+    return column
+
+# The dtype of a column of values of each kind (see _field_column)
+_KIND_DTYPES = {float: np.float64, int: np.int64, bool: bool}
+
+def _typed_column(column):
+    """Give an object array of values (NaN if missing) a dtype
+
+    See quantize_arrays: floats become float64, and ints or bools
+    without missing values become int64 or bool.
+
+    """
+    kinds = set(map(type, column))
+    if kinds == set([float]):
+        return column.astype(np.float64)
+    if kinds == set([int]):
+        return column.astype(np.int64)
+    if kinds == set([bool]):
+        return column.astype(bool)
+    return column
+
+def _quantize_records(records, **kwargs):
+    """Quantize the XIORecords of one sensor (see _quantize_columns)"""
+    events = XIOColumns()
+    codes = {}
+    for valuetype, _, fieldname, time, value in records:
+        try:
+            code = codes[fieldname, valuetype]
+        except KeyError:
+            code = codes[fieldname, valuetype] = len(events.fields)
+            events.fields.append((fieldname, valuetype.lower()))
+        events.times.append(time)
+        events.codes.append(code)
+        events.values.append(value)
+    return _quantize_columns(events, **kwargs)
+
+def _quantize_columns(events, window_size=5, with_fields=None,
+                      without_fields=None, discard_duplicates=True,
+                      grid_rate=0, grid_origin=0, grid_fill='hold',
+                      columns=None):
+    """Quantize the XIOColumns of one sensor (see quantize_arrays)
+
+    The columns are the fields in with_fields, or all the fields found
+    that are not in without_fields (as with quantize), unless a list of
+    columns is given. The types of the values of the fields are taken
+    from their XIO valuetypes.
+
+    """
     if without_fields is None:
         without_fields = []
+    found = [fieldname for fieldname, _ in events.fields]
+    if columns is not None:
+        fieldnames = list(columns)
+        selected = [x in fieldnames and x not in without_fields
+                    for x in found]
+    elif with_fields:
+        fieldnames = sorted(set(with_fields))
+        selected = [x in with_fields and x not in without_fields
+                    for x in found]
+    else:
+        selected = [x not in without_fields for x in found]
+        fieldnames = sorted(set(x for x, keep in zip(found, selected)
+                                if keep))
+    #the code of each found field in fieldnames, -1 if not selected
+    recode = np.array([fieldnames.index(x) if keep else -1
+                       for x, keep in zip(found, selected)], dtype=np.int64)
+    #the type of the values of each field, if all have the same one
+    kinds = [None] * len(fieldnames)
+    valuetypes = {}
+    for code, (_, valuetype) in zip(recode, events.fields):
+        if code >= 0:
+            valuetypes.setdefault(code, set()).add(valuetype)
+    for code, types in valuetypes.items():
+        if len(types) == 1:
+            kinds[code] = _VALUE_KINDS.get(types.pop())
+    return quantize_arrays(events.times,
+                           recode[np.array(events.codes, dtype=np.int64)],
+                           events.values, fieldnames, window_size,
+                           discard_duplicates, grid_rate, grid_origin,
+                           grid_fill, kinds)
 
-    doenumerate = enumerate_fields and not with_fields
-    if doenumerate:
-        enumerated_fields = set()
+# The Python type of the values of the XIO types with scalar values
+_VALUE_KINDS = {'sffloat': float, 'sfint32': int, 'sfbool': bool,
+                'boolean': bool}
 
-    window_end = 0
-    cur_row = {}
-    for row in rows:
-        if row['sensorname'] != sensorname:
-            continue
-        if row['fieldname'] not in with_fields and with_fields:
-            continue
-        if row['fieldname'] in without_fields:
-            continue
-        if doenumerate:
-            enumerated_fields.add(row['fieldname'])
-        value = row['value']
-        time = row['time']
-        fieldname = row['fieldname']
+def _raw_origin(grid_origin, min_time, timestamp_offset):
+    """Convert a grid origin on the StreamFrame index to a timestamp"""
+    if type(timestamp_offset) == int:
+        return grid_origin + min_time - timestamp_offset
+    return grid_origin
+
+class Quantizer(object):
+
+    """Quantize frames one event at a time."""
+
+    def __init__(self, sensorname, window_size=5, with_fields=None,
+                 without_fields=None, discard_duplicates=True,
+                 enumerate_fields=False):
+        """Create a quantizer for one sensor
+
+        The quantizer does the same as the quantize function, but keeps
+        its state (the current window) between calls. It is fed one
+        event at a time, which allows quantizing several sensors in the
+        same pass, or continuing where a previous pass left off.
+
+        Arguments and keyword arguments are the same as for quantize.
+
+        """
+        if with_fields is None:
+            with_fields = []
+        if without_fields is None:
+            without_fields = []
+        self.sensorname = sensorname
+        self.window_size = window_size
+        self.with_fields = with_fields
+        self.without_fields = without_fields
+        self.discard_duplicates = discard_duplicates
+        self.enumerate_fields = enumerate_fields
+        self.doenumerate = enumerate_fields and not with_fields
+        self.enumerated_fields = set()
+        self.window_end = 0
+        self.cur_row = {}
+
+    def push(self, row):
+        """Add a parsed event to the current window
+
+        Returns the previous frame if the event opens a new window, or
+        None if it does not.
+
+        Arguments:
+        row  -- a parsed I/O event, a dict or an XIORecord (see quantize)
+
+        """
+        if isinstance(row, tuple):
+            _, sensorname, fieldname, time, value = row
+        else:
+            sensorname = row['sensorname']
+            fieldname = row['fieldname']
+            time = row['time']
+            value = row['value']
+        if sensorname != self.sensorname:
+            return
+        if self.with_fields and fieldname not in self.with_fields:
+            return
+        if fieldname in self.without_fields:
+            return
+        if self.doenumerate:
+            self.enumerated_fields.add(fieldname)
         # If time falls in the current window, update row.
-        if time <= window_end:
+        if time <= self.window_end:
             # Do nothing if the same field already exists and
             # discard duplicates is true.
-            if fieldname in cur_row and discard_duplicates:
-                pass
-            else:
-                cur_row[fieldname] = value
+            if fieldname not in self.cur_row or not self.discard_duplicates:
+                self.cur_row[fieldname] = value
+            return
         # Otherwise, create a new window.
-        else:
-            #yield the currentframe
-            if cur_row:
-                yield cur_row
-            #initialize the new frame
-            cur_row = {'time' : time, fieldname : value}
-            window_end = time + window_size
-    #After the loop, ensure the last frame is yielded
-    yield cur_row
+        frame = self.cur_row
+        self.cur_row = {'time' : time, fieldname : value}
+        self.window_end = time + self.window_size
+        return frame
 
-    #then add row with True for all keys, so that column-types aren't
-    #converted automatically to float, due to a NaN value
-    if enumerate_fields:
+    def flush(self):
+        """Return the current (incomplete) frame
+
+        The window stays open, so that later events may still be added
+        to it.
+
+        """
+        return self.cur_row
+
+    def enumeration(self):
+        """Return a frame with value True for all enumerated fields
+
+        The frame has time -1. See quantize, argument enumerate_fields.
+
+        """
         #if with_fields are given, these are the enumerated_fields
-        if with_fields:
-            enumerated_fields = set(with_fields)
-        cur_row = dict([(field, True) for field in enumerated_fields])
+        if self.with_fields:
+            fields = set(self.with_fields)
+        else:
+            fields = self.enumerated_fields
+        cur_row = dict([(field, True) for field in fields])
         cur_row['time'] = -1
-        yield cur_row
+        return cur_row
 
 def convert_pointtier_to_streamframe(pointtier):
     """Convert a Pointier into a StreamFrame
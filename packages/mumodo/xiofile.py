@@ -33,7 +33,9 @@
 
    Functions that operate on XIOFile objects could also be found here,
    e.g. xiofile_quickcopy, a function that can copy a (region of) XIO
-   file into a new file
+   file into a new file, xiofile_merge, a function that merges
+   several XIO files into one, ordered by timestamp, and xiofile_split,
+   a function that splits an XIO file into one file per sensor
 
 """
 
@@ -47,22 +49,446 @@ __version__ = "2.0"
 __maintainer__ = "Spyros Kousidis"
 __status__ = "Development" # Development/Production/Prototype
 
-import gzip
+import gzip, heapq, os, pickle, re, time
+from functools import partial
+from itertools import islice
+import numpy as np
+import pandas as pd
+from bisect import bisect_left, bisect_right
+from collections import deque, namedtuple, OrderedDict
+from cStringIO import StringIO
+from multiprocessing import Pool
 from mumodo.InstantIO import *
+from mumodo.gzipio import GzipCheckpointReader, BlockedGzipWriter, \
+                          ReadAheadReader, TailReader, gzip_block, \
+                          gzip_block_index, read_gzip_block
 
 __all__ = [
     # Classes
-    'XIOFile',
+    'XIOFile', 'XIOMultiFile', 'XIOLineParser', 'XIORecord', 'XIOColumns',
+    'LazyValue', 'SensorFilter',
     # Functions
-    'xiofile_quickcopy'
+    'xiofile_quickcopy', 'xiofile_mergegen', 'xiofile_merge',
+    'xiofile_split'
     ]
 
+# Dict of functions for parsing sensor values
+# appropriate to each input type.
+PARSING_FN = {'sffloat' : float,
+              'sfvec3f' : SFVec3f,
+              'sfvec2f' : SFVec2f,
+              'mfvec2f' : MFVec2f,
+              'mfvec3f' : MFVec3f,
+              'sfrotation' : SFRotation,
+              'mfrotation' : MFRotation,
+              'sfbool' : sfbool,
+              'boolean': sfbool,
+              'sfint32' : int,
+              'sfstring' : str,
+              'mfstring': MFString,
+              'mffloat': MFFloat}
+
+# The same, but decoding the MF vector types into ndarrays of shape
+# (n, 2), (n, 3) and (n, 4), instead of lists of SF objects
+ARRAY_PARSING_FN = dict(PARSING_FN, mfvec2f=mfvec2f_array,
+                        mfvec3f=mfvec3f_array, mfrotation=mfrotation_array)
+
+# The first lines and the last line of a file in each format
+XIO_HEADER = {'legacy': ('<?xml version="1.0" encoding="utf-8"?>\n'
+                         '<instantioprotocol xmlns="http://www.techfak.uni'
+                         '-bielefeld.de/ags/wbski/instantloggerprotocol"'
+                         ' xmlns:irio="http://www.techfak.uni-bielefeld.de'
+                         '/ags/wbski/instantloggerprotocol/interaction"'
+                         ' version="1">\n'),
+              'venice': ('<?xml version="1.0" encoding="utf-8"?>\n'
+                         '<veniceprotocol info="venice file format '
+                         'generated by mumodo" version="1.0">\n')}
+XIO_FOOTER = {'legacy': '</instantioprotocol>',
+              'venice': '</veniceprotocol>'}
+
+# The layout of a line in each format (see XIOFile.xio_formatline)
+_LEGACY_LINE = ('<irio:%s value="%s" sensorName="xioFileClass/%s/%s"'
+                ' timestamp="%s"></irio:%s>\n')
+_VENICE_LINE = '<%s value="%s" timestamp="%s" sensorName="%s/%s"/>\n'
+
+# A compact parsed line: a tuple with the same items as the header of
+# a line (see XIOLineParser.parseheader), but with the value converted.
+# Unlike the dicts returned by xio_parseline, records take little memory
+# and the names in them are interned (shared by all records)
+XIORecord = namedtuple('XIORecord',
+                       ['valuetype', 'sensorname', 'fieldname', 'time',
+                        'value'])
+_new_record = XIORecord._make
+
+class XIOColumns(object):
+
+    """The parsed lines of one sensor, as columns
+
+    Created by XIOFile.xio_quickcolumns. fields is a list of the
+    (fieldname, valuetype) pairs of the sensor, in the order in which
+    they were found (a field with lines of different types has one pair
+    per type), and times, codes and values are lists with the timestamp,
+    the index into fields and the converted value of each line.
+
+    """
+
+    def __init__(self):
+        self.fields = []
+        self.times = []
+        self.codes = []
+        self.values = []
+
+class LazyValue(object):
+
+    """A value of an XIO line that is converted when it is first used"""
+
+    __slots__ = ('function', 'raw', '_value')
+
+    def __init__(self, function, raw):
+        """Keep the raw value string and the function that converts it
+
+        The object stands in for the converted value: its attributes,
+        items, iteration, length and string are those of the converted
+        value, which is created (once) when any of them is first used.
+        Values that are never used, e.g. those outside a time slice of a
+        StreamFrame, are never converted.
+
+        Arguments:
+        function    --  The parsing function of the value type (see
+                        PARSING_FN)
+        raw         --  The value string of the line
+
+        """
+        self.function = function
+        self.raw = raw
+        self._value = _NOT_CONVERTED
+
+    @property
+    def value(self):
+        """The converted value"""
+        if self._value is _NOT_CONVERTED:
+            self._value = self.function(self.raw)
+        return self._value
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.value, name)
+
+    def __getitem__(self, i):
+        return self.value[i]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return 'LazyValue(%s, %r)' % (getattr(self.function, '__name__',
+                                              self.function), self.raw)
+
+    def __getstate__(self):
+        return self.function, self.raw
+
+    def __setstate__(self, state):
+        self.function, self.raw = state
+        self._value = _NOT_CONVERTED
+
+_NOT_CONVERTED = object()
+
+def _lazy_parsing_fn(parsing_fn):
+    """Return parsing functions that create LazyValues for composite types
+
+    The values of the simple types (numbers, booleans and strings) are
+    still converted immediately.
+
+    Arguments:
+    parsing_fn  --  A dict of parsing functions, e.g. PARSING_FN
+
+    """
+    simple = (float, int, sfbool, str)
+    return dict((otype, function if function in simple else
+                 partial(LazyValue, function))
+                for otype, function in parsing_fn.items())
+
+def _replace_file(source, target):
+    """Rename source to target, replacing target if it exists (which
+       os.rename does not do on Windows)"""
+    if os.name == 'nt' and os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+
+class XIOLineParser(object):
+
+    """Fast parser for the lines of one XIO file."""
+
+    #The line layout written by the venice logger (and by mumodo)
+    venice_line = re.compile(r'<(\w+) value="([^"<]*)" timestamp="(\d+)" '
+                             r'sensorName="([^"<]*)"')
+
+    def __init__(self, fileformat=None, parsing_fn=None):
+        """Create a parser for the lines of an XIO file
+
+        The parser gives exactly the same results as
+        XIOFile.xio_parseline, but is faster (see benchmark_xio.py in
+        the testing folder):
+
+        - The file format (legacy or venice) is detected once, from the
+          first line that can be parsed, and the parsing method for that
+          format is tried first for all the following lines
+        - Venice lines are parsed with a single regular expression.
+          Legacy lines (attributes in any order) are parsed by searching
+          each attribute once, without splitting the line
+        - The parsing function for each value type is looked up only
+          once per type
+
+        Lines that do not have the expected layout are parsed with the
+        original (slower) method, so that the results are always the same.
+
+        Keyword arguments:
+        fileformat  --  "legacy" or "venice". Detected automatically if
+                        None (default)
+        parsing_fn  --  A dict of functions for converting values, with
+                        the (lowercase) type names as keys. Defaults to
+                        PARSING_FN. Use ARRAY_PARSING_FN to decode
+                        the MF vector types into ndarrays
+
+        """
+        self.fileformat = fileformat
+        if parsing_fn is None:
+            parsing_fn = PARSING_FN
+        self.parsing_fn = parsing_fn
+        #cache of (lowercase type, function) for each raw type string
+        self.decoders = {}
+        #cache of the interned (sensorname, fieldname) of each name
+        self.names = {}
+
+    def parseheader(self, line):
+        """Parse the attributes of a raw xioline, without the value
+
+        Returns a tuple (valuetype, sensorname, fieldname, time, value),
+        as XIOFile.xio_parseheader, or None if the line cannot be parsed
+
+        Arguments:
+        line    --  A line.
+
+        """
+        if self.fileformat == 'venice':
+            match = self.venice_line.match(line)
+            if match is not None:
+                value_type, value, timestamp, name = match.groups()
+                try:
+                    sensor_name, field_name = self.names[name]
+                except KeyError:
+                    sensor_name, field_name = self.splitname(name)
+                return (value_type, sensor_name, field_name, int(timestamp),
+                        value)
+        header = self.findheader(line)
+        if header is False:
+            header = self.splitheader(line)
+        if self.fileformat is None and header is not None:
+            self.fileformat = self.detect(line)
+        return header
+
+    def findheader(self, line):
+        """Parse the attributes of a line by searching for each of them
+
+        Works for both formats and for attributes in any order. Returns
+        the header tuple, None if the line cannot be parsed, or False if
+        the line has an unusual layout and must be parsed with
+        splitheader instead.
+
+        Arguments:
+        line    --  A line.
+
+        """
+        space = line.find(' ')
+        if space < 0:
+            return False
+        if line.find(':', 0, space) < 0:
+            #venice format: the attributes end at the next '<'
+            if not line.startswith('<'):
+                return False
+            start = 1
+            end = line.find('<', 1)
+            if end < 0:
+                end = len(line)
+            if space > end:
+                return False
+            value_type = line[1:space]
+        else:
+            #legacy format, the type is prefixed with a namespace
+            start = 0
+            end = len(line)
+            colon = line.find(':')
+            nextcolon = line.find(':', colon + 1, space)
+            value_type = line[colon + 1:nextcolon if nextcolon >= 0
+                              else space]
+        attributes = []
+        for key in ('sensorName="', 'value="', 'timestamp="'):
+            begin = line.find(key, start, end)
+            if begin < 0:
+                return None
+            begin += len(key)
+            stop = line.find('"', begin, end)
+            attributes.append(line[begin:stop if stop >= 0 else end])
+        name, value, timestamp = attributes
+        try:
+            sensor_name, field_name = self.names[name]
+        except KeyError:
+            sensor_name, field_name = self.splitname(name)
+        return (value_type, sensor_name, field_name, int(timestamp), value)
+
+    def splitname(self, name):
+        """Split a full name into an interned sensorname and fieldname
+
+        The result is cached, so that the names of all the lines of a
+        sensor are the same (shared) strings.
+
+        Arguments:
+        name    --  The value of the sensorName attribute of a line
+
+        """
+        slash = name.rfind('/')
+        if slash < 0:
+            names = ('', intern(name))
+        else:
+            names = (intern(name[:slash]), intern(name[slash + 1:]))
+        self.names[name] = names
+        return names
+
+    @staticmethod
+    def splitheader(line):
+        """Parse the attributes of a line by splitting it
+
+        This is the original parsing method of XIOFile.xio_parseline.
+        It is used as a reference, and for lines with an unusual layout.
+        Returns the header tuple, or None if the line cannot be parsed.
+
+        Arguments:
+        line    --  A line.
+
+        """
+        try:
+            #support legacy format from fame logger that had
+            # an ":" character in the type
+            if ':' not in line.split(" ")[0]:
+                line = '<:' + line.split('<')[1]
+            #get the sensor_name, value type, value and timestamp of event
+            value_type = line.split(' ')[0].split(":")[1]
+            sensor_name = line.split('sensorName="')[1].split('"')[0]
+            value = line.split('value="')[1].split('"')[0]
+            timestamp = line.split('timestamp="')[1].split('"')[0]
+        except IndexError:
+            return None
+        #extract the field (slot) name from the sensor name
+        field_name = sensor_name.split('/')[-1]
+        sensor_name = sensor_name[:-(len(field_name)+1)]
+        return (value_type, sensor_name, field_name, int(timestamp), value)
+
+    @staticmethod
+    def detect(line):
+        """Return the format ("legacy" or "venice") of a line"""
+        if ':' in line.split(" ")[0]:
+            return 'legacy'
+        return 'venice'
+
+    def decoder(self, value_type):
+        """Return the lowercase type and the parsing function of a type
+
+        The function is None if the type is not supported.
+
+        Arguments:
+        value_type  --  The type, as found in the line
+
+        """
+        try:
+            return self.decoders[value_type]
+        except KeyError:
+            otype = value_type.lower()
+            self.decoders[value_type] = (otype, self.parsing_fn.get(otype))
+            return self.decoders[value_type]
+
+    def headertime(self, header):
+        """Return the timestamp of a header (see XIOFile.xio_headertime)"""
+        if header is None:
+            return -1
+        if self.decoder(header[0])[1] is None:
+            return -2
+        return header[3]
+
+    def linetime(self, line):
+        """Return the timestamp of a raw xioline, or an error code
+
+        The same as the 'time' of the parsed line, but without
+        converting the value.
+
+        Arguments:
+        line    --  A line.
+
+        """
+        return self.headertime(self.parseheader(line))
+
+    def decodeheader(self, header):
+        """Convert a header into a parsed line (see xio_decodeheader)"""
+        value_type, sensor_name, field_name, timestamp, value = header
+        otype, function = self.decoder(value_type)
+        if function is None:
+            return {'valuetype': value_type, 'value': 'KeyError:' + otype,
+                    'sensorname': sensor_name, 'fieldname': field_name,
+                    'time': -2}
+        return {'valuetype': value_type, 'value': function(value),
+                'sensorname': sensor_name, 'fieldname': field_name,
+                'time': timestamp}
+
+    def parseline(self, line):
+        """Parse a raw xioline (see XIOFile.xio_parseline)"""
+        header = self.parseheader(line)
+        if header is None:
+            return {'valuetype': '', 'value': line, 'sensorname': '',
+                    'fieldname': '', 'time': -1}
+        return self.decodeheader(header)
+
+    def decoderecord(self, header):
+        """Convert a header into an XIORecord (see decodeheader)"""
+        value_type, sensor_name, field_name, timestamp, value = header
+        otype, function = self.decoder(value_type)
+        if function is None:
+            return XIORecord(value_type, sensor_name, field_name, -2,
+                             'KeyError:' + otype)
+        return _new_record((value_type, sensor_name, field_name, timestamp,
+                            function(value)))
+
+    def parserecord(self, line):
+        """Parse a raw xioline into an XIORecord (see parseline)"""
+        header = self.parseheader(line)
+        if header is None:
+            return XIORecord('', '', '', -1, line)
+        return self.decoderecord(header)
+
 class XIOFile(object):
 
     """Load, index and query xio.gz files output by FAME logging tool."""
 
+    # Dict of functions for parsing sensor values
+    # appropriate to each input type.
+    parsing_fn = PARSING_FN
+
+    #Version of the on-disk index layout. Index files written with a
+    #different version are ignored and rebuilt
+    index_version = 4
+    #Suffix of the default sidecar index file
+    index_suffix = '.idx'
+
     def __init__(self, path, mode='r', maxlines=0, indexing=False,
-                 headerlines=2, fileformat="venice"):
+                 headerlines=2, fileformat="venice", indexfile=None,
+                 writeindex=False, checkpoint_interval=0, mfarrays=False,
+                 blocksize=0, compresslevel=9, threads=1, follow=False,
+                 lazy=False, buffersize=65536, flush_interval=0):
         """Handles compressed XIO file I/O.
 
         Opens a compressed xio.gz file. This file is produced by legacy
@@ -74,6 +500,14 @@ class XIOFile(object):
         'r'    --  Opens a compressed xio.gz file and creates a line
                    index and a time index for fast seeking.
         'w'    --  Creates a new xio.gz file and handles write to it.
+        'a'    --  Opens an xio.gz file for appending lines to it, e.g.
+                   to resume a recording. The footer of the file is
+                   removed, and written again when the file is closed.
+                   Files closed by XIOFile end with the footer in a
+                   gzip member of its own, which is simply cut off.
+                   Other files (e.g. written by another logger, or not
+                   closed after a crash) are rewritten once. A file
+                   that does not exist is created, as in 'w' mode.
 
         Keyword args:
         maxlines    --  The number of lines to index. Can be used to
@@ -87,23 +521,81 @@ class XIOFile(object):
                         values:
                         "legacy" - The old TechFak format
                         "venice" - (default) the newer, shorter format
+        indexfile   --  Path of the sidecar index file. Defaults to the
+                        path of the XIO file plus '.idx'. When indexing,
+                        a sidecar index that matches the size and
+                        modification time of the XIO file is loaded
+                        instead of scanning the whole file
+        writeindex  --  If True, the index built by the indexing pass
+                        is saved to the sidecar index file, so that
+                        the file can be reopened quickly next time.
+                        In write modes, the index is kept up to date
+                        while lines are written, and saved whenever the
+                        file is flushed (see xio_flush) and closed
+        checkpoint_interval --  If larger than 0, compressed files are
+                                read with a GzipCheckpointReader that
+                                keeps a decompressor checkpoint every
+                                checkpoint_interval (uncompressed) bytes.
+                                Seeking (e.g. xio_getline) then takes
+                                constant time instead of decompressing
+                                from the start of the file. 1048576
+                                (1MB) is a sensible value for large files
+        mfarrays    --  If True, MFVec2f, MFVec3f and MFRotation values
+                        are decoded into ndarrays of shape (n, 2),
+                        (n, 3) and (n, 4) when parsing lines, which is
+                        faster than creating an object for each item
+        blocksize   --  (write mode) If larger than 0, the file is
+                        written as a blocked gzip file, with blocks of
+                        about blocksize uncompressed bytes (65536 is a
+                        sensible value). Blocked files are valid gzip
+                        files, but they can also be read with random
+                        access and parsed in parallel (see the
+                        processes argument of xio_quicklinegen)
+        compresslevel -- (write mode) The gzip compression level (1-9)
+        threads     --  (write mode) The number of threads compressing
+                        the blocks of a blocked file
+        follow      --  Set to True for files that are still being
+                        written (see xio_follow). Compressed files are
+                        then read with a GzipCheckpointReader, which
+                        accepts incomplete files and sees the lines that
+                        are appended later
+        lazy        --  If True, the values of the composite types
+                        (vectors, rotations and the MF types) are parsed
+                        into LazyValue objects, which keep the value
+                        string and convert it only when it is first used
+        buffersize  --  (write modes) The written lines are collected in
+                        a buffer, which is compressed and written to the
+                        file when it holds buffersize bytes
+        flush_interval -- (write modes) If larger than 0, the file is
+                          flushed (see xio_flush) when lines are written
+                          and the last flush is flush_interval seconds
+                          ago, so that readers (see xio_follow) see the
+                          lines of a live recording with little delay
 
         """
         self.mode = mode
+        self.path = path
+        if indexfile is None:
+            indexfile = path + self.index_suffix
+        self.indexfile = indexfile
         self.indexed = indexing
         self.headerlines = headerlines
         if self.mode == 'r':
+            #parser for the lines of this file (detects the format)
+            parsing_fn = ARRAY_PARSING_FN if mfarrays else PARSING_FN
+            if lazy:
+                parsing_fn = _lazy_parsing_fn(parsing_fn)
+            self.parser = XIOLineParser(parsing_fn=parsing_fn)
             #dictionary of fieldnames {sensorname: fieldnames}
             self.fieldnames = {}
+            #statistics of each field, collected while indexing
+            #{(sensorname, fieldname): [valuetype, count, bytes,
+            #first time, last time, max gap, previous time]}
+            self.catalog = {}
+            #reader for the lines appended to the file (see xio_follow)
+            self.tail = None
             #open the file
-            with open(path) as f:
-                self.is_gzipped = (f.read(2) == '\x1f\x8b')
-            if self.is_gzipped:
-                print 'opening compressed file ...'
-                self.f = gzip.open(path)
-            else:
-                print 'opening un-compressed file ...'
-                self.f = open(path)
+            self.f = self.__open__(checkpoint_interval, follow)
             if self.indexed == False:
                 print 'opening file without indexing'
                 # Skip the header lines
@@ -113,36 +605,68 @@ class XIOFile(object):
                 #self.min_time = self.xio_parseline(self.f.readline())['time']
                 #self.f.seek(0)
                 line = self.f.readline()
-                while self.xio_parseline(line)['time'] < 0 and line != '':
+                while self.parser.linetime(line) < 0 and line != '':
                     line = self.f.readline()
-                if self.xio_parseline(line)['time'] >= 0:
-                    self.min_time = self.xio_parseline(line)['time']
+                if self.parser.linetime(line) >= 0:
+                    self.min_time = self.parser.linetime(line)
                 else:
                     print 'no valid lines found!'
                 #exit the constructor here if not indexing
                 return
+            if self.xio_loadindex(maxlines=maxlines):
+                print 'loaded index from ' + self.indexfile
+                return
             self.xio_index(maxlines)
-        elif self.mode == "w":
+            if writeindex:
+                self.xio_saveindex(maxlines=maxlines)
+        elif self.mode in ['w', 'a']:
             if fileformat in ['legacy', 'venice']:
-                self.f = gzip.open(path, "w")
                 self.xioformat = fileformat
-                self.xio_writeheader()
+                self.parser = XIOLineParser(fileformat)
+                #the formatted lines that are not written yet
+                self.buffer = []
+                self.buffered = 0
+                self.buffersize = buffersize
+                self.flush_interval = flush_interval
+                self.flush_due = time.time() + flush_interval
+                #the number of lines and the (uncompressed) size written
+                self.lines = 0
+                self.offset = 0
+                #last timestamp that was added to the time index
+                self.toffset = 0
+                #the state needed for appending (see __resume__)
+                self.resume = None
+                self.writeindex = writeindex
+                if writeindex:
+                    self.__newindex__()
+                if self.mode == 'a' and os.path.isfile(path):
+                    self.__resume__(blocksize, compresslevel, threads)
+                else:
+                    self.f = self.__create__(path, 'wb', blocksize,
+                                             compresslevel, threads)
+                    self.xio_writeheader()
             else:
                 print "unsupported file format."
                 print " Only 'legacy' and 'venice' allowed"
         else:
-            print "unsupported mode. Only 'r' and 'w' allowed"
+            print "unsupported mode. Only 'r', 'w' and 'a' allowed"
 
 
 
 
+    def __open__(self, checkpoint_interval, follow):
+        """Open the file for reading (see the constructor)"""
+        self.f, self.is_gzipped, self.blocks = \
+                _open_xio(self.path, checkpoint_interval, follow)
+        return self.f
+
+    def __readahead__(self):
+        """Return the lines of the file, read by a background thread"""
+        return ReadAheadReader(self.path)
+
     def xio_index(self, maxlines):
         """Perform indexing of an input XIO file """
-        #Set up structures for indexing
-        #List of file offsets every 1000 lines
-        self.line_offset = []
-        #list of flie offsets every 1 sec (1000ms)
-        self.time_offset = []
+        self.__newindex__()
         #file indexing: populate line_offset every 1000 lines
         #time_offset every (approximately) one second
         #and fill fieldnames dictionary
@@ -156,13 +680,10 @@ class XIOFile(object):
             #Break if specified number of lines is reached
             if maxlines > 0 and (i - self.headerlines) > maxlines:
                 break
-            #Create an index every 1000 lines
-            if (i - self.headerlines) % 1000 == 0:
-                self.line_offset.append(offset)
             #Create an index every (approximately 1000ms
             if i > (self.headerlines - 1):
-                parsedline = self.xio_parseline(line)
-                tcurrent = parsedline['time']
+                header = self.parser.parseheader(line)
+                tcurrent = self.parser.headertime(header)
                 if tcurrent == -1:
                     print 'unable to parse line ', i, ' ', line
                 elif not hasattr(self, 'min_time'):
@@ -170,13 +691,8 @@ class XIOFile(object):
                 if tcurrent - toffset >= 1000:
                     self.time_offset.append(offset)
                     toffset = tcurrent
-                #populate fieldnames dictionary
-                sname = parsedline['sensorname']
-                fname = parsedline['fieldname']
-                if sname not in self.fieldnames:
-                    self.fieldnames[sname] = []
-                if fname not in self.fieldnames[sname]:
-                    self.fieldnames[sname].append(fname)
+                self.__indexline__(i - self.headerlines, offset, header,
+                                   tcurrent, len(line))
             #add to byte offset
             offset += len(line)
             #show progress
@@ -188,13 +704,278 @@ class XIOFile(object):
             self.max_lines = i - self.headerlines - 1
         #self.min_time = self.xio_parseline_lineno(0)['time']
         self.max_time = self.xio_parseline_lineno(self.max_lines)['time']
+        self.xio_timeindex()
         print 'done! (indexed ' + str(self.max_lines + 1) + ' lines)'
 
+    def __newindex__(self):
+        """Set up the (empty) structures of the line and time index"""
+        #dictionary of fieldnames {sensorname: fieldnames}, and
+        #statistics of each field (see the constructor)
+        self.fieldnames = {}
+        self.catalog = {}
+        #List of file offsets every 1000 lines
+        self.line_offset = []
+        #list of flie offsets every 1 sec (1000ms)
+        self.time_offset = []
+        #smallest and largest timestamp of every 1000 lines
+        self.block_min_time = []
+        self.block_max_time = []
+        #bitmap of the sensors in every 1000 lines, with a bit for each
+        #sensorname in sensorbits {sensorname: bit number}
+        self.block_sensors = []
+        self.sensorbits = {}
+
+    def __indexline__(self, lineno, offset, header, tcurrent, size):
+        """Add a line to the line index, time index, fieldnames and catalog"""
+        #Create an index every 1000 lines
+        if lineno / 1000 == len(self.line_offset):
+            self.line_offset.append(offset)
+            self.block_min_time.append(float('inf'))
+            self.block_max_time.append(-1)
+            self.block_sensors.append(0)
+        if tcurrent >= 0:
+            block = lineno / 1000
+            if tcurrent < self.block_min_time[block]:
+                self.block_min_time[block] = tcurrent
+            if tcurrent > self.block_max_time[block]:
+                self.block_max_time[block] = tcurrent
+        #populate fieldnames dictionary
+        if header is None:
+            sname = fname = ''
+        else:
+            sname, fname = header[1], header[2]
+        if sname not in self.fieldnames:
+            self.fieldnames[sname] = []
+        if fname not in self.fieldnames[sname]:
+            self.fieldnames[sname].append(fname)
+        if header is None:
+            return
+        #add the sensor to the bitmap of the block
+        bit = self.sensorbits.get(sname)
+        if bit is None:
+            bit = self.sensorbits[sname] = len(self.sensorbits)
+        self.block_sensors[lineno / 1000] |= 1 << bit
+        #collect the statistics of the field
+        stats = self.catalog.get((sname, fname))
+        if stats is None:
+            stats = [header[0], 0, 0, -1, -1, 0, -1]
+            self.catalog[(sname, fname)] = stats
+        stats[1] += 1
+        stats[2] += size
+        timestamp = header[3]
+        if stats[3] < 0 or timestamp < stats[3]:
+            stats[3] = timestamp
+        if timestamp > stats[4]:
+            stats[4] = timestamp
+        if stats[6] >= 0 and timestamp - stats[6] > stats[5]:
+            stats[5] = timestamp - stats[6]
+        stats[6] = timestamp
+
+    def xio_catalog(self):
+        """Return the statistics of each sensor field as a DataFrame.
+
+        The statistics are collected while indexing, so that it can be
+        checked whether a sensor exists, how dense it is, or how much
+        memory its values need, without reading the file again. The
+        DataFrame is indexed by sensorname and fieldname, and has the
+        columns:
+
+        valuetype   --  The value type of the first line of the field
+        count       --  The number of lines
+        first_time,
+        last_time   --  The smallest and the largest timestamp
+        rate        --  The mean number of lines per second
+        max_gap     --  The largest time (in ms) between two consecutive
+                        lines of the field
+        bytes       --  The size of the lines in the (uncompressed) file
+
+        Returns None if the file is not indexed.
+
+        """
+        if not self.indexed:
+            print 'the catalog is only available for indexed files'
+            return None
+        columns = ['valuetype', 'count', 'first_time', 'last_time', 'rate',
+                   'max_gap', 'bytes']
+        rows = []
+        for key in sorted(self.catalog):
+            valuetype, count, size, first, last, gap, _ = self.catalog[key]
+            rate = (count - 1) * 1000.0 / (last - first) if last > first \
+                   else float('nan')
+            rows.append([valuetype, count, first, last, rate, gap, size])
+        index = pd.MultiIndex.from_tuples(sorted(self.catalog),
+                                          names=['sensorname', 'fieldname'])
+        return pd.DataFrame(rows, index=index, columns=columns)
+
+    def xio_timeindex(self):
+        """Build the lookup tables for seeking by time
+
+        The index holds the smallest and largest timestamp of every
+        block of 1000 lines (block_min_time and block_max_time). From
+        these, two sorted lists are built, which are searched with
+        bisect:
+
+        max_time_upto   --  The largest timestamp in the blocks up to
+                            (and including) each block. The first line
+                            with a timestamp >= t is in the first block
+                            where max_time_upto >= t
+        min_time_from   --  The smallest timestamp in the blocks from
+                            each block to the end of the file. There are
+                            no lines with a timestamp <= t after the last
+                            block where min_time_from <= t
+
+        Both remain correct if the timestamps are not in order (e.g. a
+        sensor was restarted) or if there are gaps in the recording.
+
+        """
+        self.max_time_upto = []
+        for tmax in self.block_max_time:
+            if self.max_time_upto and self.max_time_upto[-1] > tmax:
+                tmax = self.max_time_upto[-1]
+            self.max_time_upto.append(tmax)
+        self.min_time_from = []
+        for tmin in reversed(self.block_min_time):
+            if self.min_time_from and self.min_time_from[-1] < tmin:
+                tmin = self.min_time_from[-1]
+            self.min_time_from.append(tmin)
+        self.min_time_from.reverse()
+
+
+    def xio_canseek(self):
+        """Return True if the file can be entered at any line offset
+           without reading (decompressing) the data before it
+
+        This holds for uncompressed files, blocked gzip files and files
+        opened with a checkpoint_interval (once the checkpoints have been
+        created). The gzip module decompresses plain gzip files from the
+        start up to the offset instead.
+
+        """
+        return not self.is_gzipped or self.blocks is not None or \
+               isinstance(self.f, GzipCheckpointReader)
+
+    def xio_indexstate(self, maxlines=0):
+        """Return the fingerprint an index file must match to be valid.
+
+        The fingerprint consists of the size and modification time of
+        the XIO file, as well as the indexing parameters.
+
+        Keyword arguments:
+        maxlines    --  The number of lines to index (see constructor)
+
+        """
+        stat = os.stat(self.path)
+        return {'version': self.index_version, 'size': stat.st_size,
+                'mtime': stat.st_mtime, 'headerlines': self.headerlines,
+                'maxlines': maxlines}
+
+    def xio_saveindex(self, indexfile=None, maxlines=0):
+        """Save the index of an indexed XIO file to a sidecar file.
+
+        The file is written to a temporary file first and then renamed,
+        so that readers never see a half-written index. Returns True if
+        the index was saved.
+
+        Keyword arguments:
+        indexfile   --  Path of the index file. Defaults to the indexfile
+                        given to the constructor
+        maxlines    --  The number of lines that were indexed
+
+        """
+        if not hasattr(self, 'line_offset') or not hasattr(self, 'min_time'):
+            return False
+        if indexfile is None:
+            indexfile = self.indexfile
+        index = self.xio_indexstate(maxlines)
+        index.update({'line_offset': self.line_offset,
+                      'time_offset': self.time_offset,
+                      'block_min_time': self.block_min_time,
+                      'block_max_time': self.block_max_time,
+                      'block_sensors': self.block_sensors,
+                      'sensorbits': self.sensorbits,
+                      'fieldnames': self.fieldnames,
+                      'catalog': self.catalog,
+                      'min_time': self.min_time,
+                      'max_time': self.max_time,
+                      'max_lines': self.max_lines})
+        if self.mode != 'r':
+            #needed for appending to the file (see __resume__)
+            index['resume'] = self.resume
+        index.update(self.__indexextras__())
+        tmpfile = indexfile + '.tmp'
+        try:
+            with open(tmpfile, 'wb') as f:
+                pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+            _replace_file(tmpfile, indexfile)
+        except (IOError, OSError):
+            print 'could not write index file ' + indexfile
+            return False
+        return True
+
+    def xio_loadindex(self, indexfile=None, maxlines=0):
+        """Load the index of an XIO file from a sidecar file.
+
+        The index is only used if it was built from a file with the same
+        size and modification time, and with the same indexing
+        parameters. Returns True if a valid index was loaded.
+
+        Keyword arguments:
+        indexfile   --  Path of the index file. Defaults to the indexfile
+                        given to the constructor
+        maxlines    --  The number of lines to index (see constructor)
+
+        """
+        if indexfile is None:
+            indexfile = self.indexfile
+        if not os.path.isfile(indexfile):
+            return False
+        try:
+            with open(indexfile, 'rb') as f:
+                index = pickle.load(f)
+        except Exception:
+            print 'ignoring unreadable index file ' + indexfile
+            return False
+        state = self.xio_indexstate(maxlines)
+        if not isinstance(index, dict) or \
+           any(index.get(key) != state[key] for key in state):
+            return False
+        self.line_offset = index['line_offset']
+        self.time_offset = index['time_offset']
+        self.block_min_time = index['block_min_time']
+        self.block_max_time = index['block_max_time']
+        self.block_sensors = index['block_sensors']
+        self.sensorbits = index['sensorbits']
+        self.fieldnames = index['fieldnames']
+        self.catalog = index['catalog']
+        self.min_time = index['min_time']
+        self.max_time = index['max_time']
+        self.max_lines = index['max_lines']
+        self.resume = index.get('resume')
+        self.__setindexextras__(index)
+        self.xio_timeindex()
+        return True
+
+    def __indexextras__(self):
+        """Return more entries for the index file (see xio_saveindex)"""
+        return {}
+
+    def __setindexextras__(self, index):
+        """Use the entries of __indexextras__ of a loaded index"""
+        pass
 
     def xio_quicklinegen(self, start_time, end_time, parsed=True,
-                         relative=True, on_errors='ignore'):
+                         relative=True, on_errors='ignore',
+                         sensorfilter=None, processes=1, readahead=False,
+                         records=False):
         """Quickly generate a timestamp range for un-indexed files.
 
+        If the file is indexed, reading starts at the first block of
+        1000 lines that contains start_time (see xio_timeindex), instead
+        of at the start of the file. If a sensorfilter is given as well,
+        the blocks without any of the selected sensors are skipped (see
+        block_sensors), which is fast for files with random access (see
+        the checkpoint_interval and blocksize arguments of XIOFile).
+
         Arguments:
         start_time, end_time    --  The desired time range.
         start_time = 0 means start reading from the first line of the file.
@@ -213,6 +994,24 @@ class XIOFile(object):
                         on_errors is 'stop', the generator will stop
                         at the first unparseable line; an additional
                         warning will be printed.
+        sensorfilter --  A function f(sensorname, fieldname) that returns
+                         True for the lines that should be generated,
+                         e.g. a SensorFilter object. It is applied before
+                         the value is converted, so that the values of
+                         lines that are not needed are never parsed
+        processes    --  The number of processes that parse a blocked
+                         file (see the blocksize argument of XIOFile) in
+                         parallel, or None for one per CPU. The lines are
+                         generated in the same order. Only parsed lines
+                         of blocked files are generated in parallel, and
+                         the sensorfilter must be picklable (e.g. a
+                         SensorFilter object, not a lambda)
+        readahead    --  If True, the file is read and decompressed by a
+                         background thread (see gzipio.ReadAheadReader),
+                         while the lines are parsed
+        records      --  If True, parsed lines are generated as XIORecord
+                         tuples instead of dicts, which is faster and
+                         takes less memory
 
 
         """
@@ -222,31 +1021,362 @@ class XIOFile(object):
             start_time += self.min_time
             if end_time > 0:
                 end_time += self.min_time
-        #self.f.seek(0)
-        #length = len([li for n, li in enumerate(self.f)]) - 1
-        self.f.seek(0)
-        for i, line in enumerate(self.f):
-            #Ignore 8the header lines
-            if i <= (self.headerlines - 1):
-                continue
+        if processes != 1 and parsed and self.blocks is not None:
+            for row in self.__blockgen__(start_time, end_time, on_errors,
+                                         sensorfilter, processes, records):
+                yield row
+            return
+        lines, numbered = self.__linesource__(start_time, sensorfilter,
+                                              readahead)
+        decode = self.parser.decoderecord if records else \
+                 self.parser.decodeheader
+        try:
+            for i, line in numbered:
+                #Ignore 8the header lines
+                if i <= (self.headerlines - 1):
+                    continue
 
-            parsedline = self.xio_parseline(line)
-            tcurrent = parsedline["time"]
+                header = self.parser.parseheader(line)
+                tcurrent = self.parser.headertime(header)
 
-            if tcurrent < 0:
-                if errors.index(on_errors) > 0:
-                    print "line " + str(i - self.headerlines) + " not parseable"
-                if errors.index(on_errors) > 1:
+                if tcurrent < 0:
+                    if errors.index(on_errors) > 0:
+                        print "line " + str(i - self.headerlines) + \
+                              " not parseable"
+                    if errors.index(on_errors) > 1:
+                        break
+                    continue  #for clarity
+
+                if tcurrent < start_time:
+                    continue
+
+                if end_time > 0 and tcurrent > end_time:
+                    break
+
+                if sensorfilter is not None and \
+                   not sensorfilter(header[1], header[2]):
+                    continue
+
+                yield decode(header) if parsed else line
+        finally:
+            if readahead:
+                lines.close()
+
+    def __linesource__(self, start_time, sensorfilter, readahead):
+        """Return the file (or read-ahead reader) to read the lines of
+           xio_quicklinegen from, and a generator of (line number, line)"""
+        first = 0
+        block = 0
+        if readahead:
+            lines = self.__readahead__()
+        elif self.indexed and start_time > self.min_time:
+            #skip the blocks before start_time: all their lines are earlier
+            block = min(bisect_left(self.max_time_upto, start_time),
+                        len(self.line_offset) - 1)
+            self.f.seek(self.line_offset[block])
+            first = self.headerlines + block * 1000
+            lines = self.f
+        else:
+            self.f.seek(0)
+            lines = self.f
+        if self.indexed and sensorfilter is not None and not readahead:
+            numbered = self.__sensorlines__(block,
+                                            self.__sensormask__(sensorfilter))
+        else:
+            numbered = enumerate(lines, first)
+        return lines, numbered
+
+    def xio_quickcolumns(self, start_time, end_time, relative=True,
+                         on_errors='ignore', sensorfilter=None, processes=1,
+                         readahead=False):
+        """Read a timestamp range into columns, one XIOColumns per sensor
+
+        Reads the same lines as xio_quicklinegen (with parsed=True), but
+        instead of generating a row for each line, appends the timestamp,
+        the field and the converted value of the line to the columns of
+        its sensor. This is faster than collecting XIORecords, and the
+        columns take less memory. Returns a dict {sensorname: XIOColumns}
+        with the sensors that have lines in the range.
+
+        Arguments:
+        start_time, end_time    --  The desired time range (see
+                                    xio_quicklinegen)
+
+        Keyword arguments:
+        relative,
+        on_errors,
+        sensorfilter,
+        processes,
+        readahead   --  See xio_quicklinegen
+
+        """
+        errors = ['ignore', 'report', 'stop']
+        if relative:
+            start_time += self.min_time
+            if end_time > 0:
+                end_time += self.min_time
+        columns = {}
+        #the field code, the appends of the columns and the parsing
+        #function of each (valuetype, sensorname, fieldname)
+        targets = {}
+        if processes != 1 and self.blocks is not None:
+            for row in self.__blockgen__(start_time, end_time, on_errors,
+                                         sensorfilter, processes, True):
+                key = row[:3]
+                try:
+                    code, addtime, addcode, addvalue, _ = targets[key]
+                except KeyError:
+                    code, addtime, addcode, addvalue, _ = targets[key] = \
+                        self.__columntarget__(columns, key)
+                addtime(row[3])
+                addcode(code)
+                addvalue(row[4])
+            return columns
+        lines, numbered = self.__linesource__(start_time, sensorfilter,
+                                              readahead)
+        parseheader = self.parser.parseheader
+        headertime = self.parser.headertime
+        #the lines of other sensors are mostly rejected before they are
+        #parsed, by looking for the sensornames in the lines (unless they
+        #are needed for reporting errors or stopping at end_time)
+        names = None
+        if isinstance(sensorfilter, SensorFilter) and \
+           on_errors == 'ignore' and end_time <= 0 and \
+           not any('&' in x for x in sensorfilter.sensornames):
+            names = tuple(sensorfilter.sensornames)
+        try:
+            for i, line in numbered:
+                if i < self.headerlines:
+                    continue
+                if names is not None:
+                    for name in names:
+                        if name in line:
+                            break
+                    else:
+                        continue
+                header = parseheader(line)
+                tcurrent = headertime(header)
+                if tcurrent < 0:
+                    if errors.index(on_errors) > 0:
+                        print "line " + str(i - self.headerlines) + \
+                              " not parseable"
+                    if errors.index(on_errors) > 1:
+                        break
+                    continue
+                if tcurrent < start_time:
+                    continue
+                if end_time > 0 and tcurrent > end_time:
                     break
-                continue  #for clarity
+                if sensorfilter is not None and \
+                   not sensorfilter(header[1], header[2]):
+                    continue
+                key = header[:3]
+                try:
+                    code, addtime, addcode, addvalue, function = targets[key]
+                except KeyError:
+                    code, addtime, addcode, addvalue, function = \
+                        targets[key] = self.__columntarget__(columns, key)
+                addtime(tcurrent)
+                addcode(code)
+                addvalue(function(header[4]))
+        finally:
+            if readahead:
+                lines.close()
+        return columns
+
+    def __columntarget__(self, columns, key):
+        """Add a field to the XIOColumns of its sensor (see
+           xio_quickcolumns), and return where its lines go"""
+        valuetype, sensorname, fieldname = key
+        if sensorname not in columns:
+            columns[sensorname] = XIOColumns()
+        column = columns[sensorname]
+        otype, function = self.parser.decoder(valuetype)
+        column.fields.append((fieldname, otype))
+        return (len(column.fields) - 1, column.times.append,
+                column.codes.append, column.values.append, function)
+
+    def __sensormask__(self, sensorfilter):
+        """Return the bitmap of the sensors selected by a sensorfilter"""
+        mask = 0
+        for sname, bit in self.sensorbits.items():
+            if any(sensorfilter(sname, fname) for fname in
+                   self.fieldnames[sname]):
+                mask |= 1 << bit
+        return mask
+
+    def __sensorlines__(self, block, mask):
+        """Generate (line number, line) for the blocks with the sensors
+
+        Starts at the given block of 1000 lines, and skips the blocks that
+        contain none of the sensors in the bitmap mask. The last block is
+        read to the end of the file, which may have more lines than were
+        indexed.
 
-            if tcurrent < start_time:
+        """
+        last = len(self.line_offset) - 1
+        position = None
+        while block <= last:
+            if block < last and not self.block_sensors[block] & mask:
+                block += 1
                 continue
+            if position != block:
+                self.f.seek(self.line_offset[block])
+            lineno = self.headerlines + block * 1000
+            if block == last:
+                for lineno, line in enumerate(self.f, lineno):
+                    yield lineno, line
+                return
+            for lineno in xrange(lineno, lineno + 1000):
+                yield lineno, self.f.readline()
+            block += 1
+            position = block
+
+    def xio_follow(self, parsed=True, on_errors='ignore', sensorfilter=None,
+                   poll_interval=0.5, timeout=None):
+        """Generate the lines of a file that is still being written.
+
+        The first call generates all the lines in the file, and then
+        waits for new lines to be appended, like 'tail -f'. The next
+        call continues after the last line generated by the previous
+        one, so lines that are appended in the meantime are not lost.
+        An incomplete last line is only generated when it is complete.
+
+        If the file is indexed, the lines that are appended are added
+        to the index (line_offset, the time index and fieldnames), and
+        max_lines and max_time are updated, so that seeking (e.g.
+        xio_timeseek) includes them. time_offset is not extended.
 
-            if end_time > 0 and tcurrent > end_time:
-                break
+        Keyword arguments:
+        parsed       --  Flag to yield parsed or non-parsed output.
+        on_errors,
+        sensorfilter --  See xio_quicklinegen
+        poll_interval -- Seconds to wait before looking for new lines
+        timeout      --  Stop after timeout seconds without new lines.
+                         None (default) waits forever, 0 stops as soon
+                         as all the lines written so far are generated
+
+        """
+        errors = ['ignore', 'report', 'stop']
+        if self.tail is None:
+            self.tail = TailReader(self.path)
+            self.tail_lineno = -self.headerlines
+            #lines that were read but not parsed, and rows not yet
+            #generated, so that the next call can continue from there
+            self.tail_lines = deque()
+            self.tail_rows = deque()
+        waited = 0
+        while True:
+            while self.tail_rows:
+                yield self.tail_rows.popleft()
+            if not self.tail_lines:
+                offset = self.tail.offset
+                for line in self.tail.readlines():
+                    self.tail_lines.append((offset, line))
+                    offset += len(line)
+            if not self.tail_lines:
+                if timeout is not None and waited >= timeout:
+                    return
+                time.sleep(poll_interval)
+                waited += poll_interval
+                continue
+            waited = 0
+            stop = False
+            while self.tail_lines:
+                offset, line = self.tail_lines.popleft()
+                lineno = self.tail_lineno
+                self.tail_lineno += 1
+                if lineno < 0:
+                    continue
+                header = self.parser.parseheader(line)
+                tcurrent = self.parser.headertime(header)
+                if self.indexed and lineno > self.max_lines:
+                    self.__indexline__(lineno, offset, header, tcurrent,
+                                       len(line))
+                    self.max_lines = lineno
+                    if tcurrent >= 0:
+                        self.max_time = tcurrent
+                if tcurrent < 0:
+                    if errors.index(on_errors) > 0:
+                        print "line " + str(lineno) + " not parseable"
+                    if errors.index(on_errors) > 1:
+                        stop = True
+                        break
+                    continue
+                if not hasattr(self, 'min_time'):
+                    self.min_time = tcurrent
+                if sensorfilter is not None and \
+                   not sensorfilter(header[1], header[2]):
+                    continue
+                self.tail_rows.append(self.parser.decodeheader(header)
+                                      if parsed else line)
+            if self.indexed:
+                self.xio_timeindex()
+            if stop:
+                while self.tail_rows:
+                    yield self.tail_rows.popleft()
+                return
+
+    def __blockgen__(self, start_time, end_time, on_errors, sensorfilter,
+                     processes, records=False):
+        """Parse the blocks of a blocked file in a process pool
 
-            yield parsedline if parsed else line
+        Generates the same rows as xio_quicklinegen (with absolute
+        start_time and end_time). Every process reads, decompresses and
+        parses whole blocks, and returns the rows that pass the filters.
+
+        """
+        errors = ['ignore', 'report', 'stop']
+        #the header lines are skipped by byte offset
+        self.f.seek(0)
+        for _ in range(self.headerlines):
+            self.f.readline()
+        headersize = self.f.tell()
+        tasks = []
+        for rawoffset, rawsize, offset, size in self.blocks:
+            if offset + size <= headersize:
+                continue
+            if end_time > 0 and self.__blockmintime__(offset, size) > end_time:
+                #parsing would stop at the first line of this block
+                break
+            tasks.append((self.path, rawoffset, rawsize,
+                          max(0, headersize - offset), self.parser.fileformat,
+                          self.parser.parsing_fn, start_time, end_time,
+                          sensorfilter, on_errors == 'stop', records))
+        tasks = iter(tasks)
+        pool = Pool(processes)
+        try:
+            #only a few blocks are parsed ahead of the rows that are used
+            pending = deque(pool.apply_async(_parse_xio_block, (task, ))
+                            for task in islice(tasks, 2 * processes))
+            lineno = 0
+            while pending:
+                rows, nlines, errorlines, stop = pending.popleft().get()
+                if errors.index(on_errors) > 0:
+                    for i in errorlines:
+                        print "line " + str(lineno + i) + " not parseable"
+                for row in rows:
+                    yield row
+                if stop:
+                    break
+                lineno += nlines
+                for task in islice(tasks, 1):
+                    pending.append(pool.apply_async(_parse_xio_block,
+                                                    (task, )))
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __blockmintime__(self, offset, size):
+        """Return the smallest timestamp the line index allows for the
+           lines of a compressed block (0 if the file is not indexed)"""
+        if not self.indexed or not self.line_offset:
+            return 0
+        first = max(0, bisect_right(self.line_offset, offset) - 1)
+        last = bisect_left(self.line_offset, offset + size)
+        times = [x for x in self.block_min_time[first:max(last, first + 1)]
+                 if x != float('inf')]
+        return min(times) if times else 0
 
     def xio_quicksearch(self, timestamp, restart=True):
         """Quick searching of a timestamp for un-indexed files.
@@ -271,14 +1401,84 @@ class XIOFile(object):
         for i, line in enumerate(self.f):
             #Ignore the header lines
             if i > (self.headerlines - 1):
-                parsedline = self.xio_parseline(line)
-                tcurrent = parsedline["time"]
+                tcurrent = self.parser.linetime(line)
                 if tcurrent == timestamp:
                     return (True, tcurrent)
                 elif tcurrent > timestamp:
                     return (False, tcurrent)
         return (False, tcurrent, "end of file")
 
+    def xio_timestamps(self, refresh=False):
+        """Return the timestamps of all lines, read in a single pass.
+
+        Returns a tuple of two ndarrays: the timestamps of the lines that
+        can be parsed, in file order, and their line numbers (as in
+        xio_getline). Both are kept, so that only the first call reads
+        the file.
+
+        Keyword arguments:
+        refresh --  Read the file again, e.g. if lines were appended
+
+        """
+        if refresh or not hasattr(self, 'timestamps'):
+            times = []
+            linenos = []
+            self.f.seek(0)
+            for i, line in enumerate(self.f, -self.headerlines):
+                if i < 0:
+                    continue
+                tcurrent = self.parser.linetime(line)
+                if tcurrent >= 0:
+                    times.append(tcurrent)
+                    linenos.append(i)
+            self.timestamps = (np.array(times, dtype=np.int64),
+                               np.array(linenos, dtype=np.int64))
+        return self.timestamps
+
+    def xio_batchsearch(self, timestamps, relative=False):
+        """Search many timestamps at once.
+
+        The same as calling xio_quicksearch (with restart=True) for each
+        timestamp, but the file is read only once (see xio_timestamps),
+        and the timestamps are looked up with a binary search. Useful
+        for finding the offsets between XIO files and other formats at
+        many synchronization points.
+
+        Returns a tuple of three ndarrays:
+        found   --  True if the timestamp exists in the file
+        times   --  The timestamp of the first line (in file order)
+                    with a timestamp larger than or equal to the one
+                    sought after, -1 if there is none
+        linenos --  The line number of that line, -1 if there is none
+
+        Arguments:
+        timestamps  --  A list or array of the timestamps sought after
+
+        Keyword arguments:
+        relative    --  Toggle between relative and absolute timestamps
+                        (both the ones sought after and the ones returned)
+
+        """
+        times, linenos = self.xio_timestamps()
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if relative:
+            timestamps = timestamps + self.min_time
+        #the first line with a timestamp >= t is also the first line
+        #where the running maximum of the timestamps is >= t
+        positions = np.searchsorted(np.maximum.accumulate(times),
+                                    timestamps)
+        beyond = positions == len(times)
+        positions[beyond] = 0
+        nexttimes = times[positions] if len(times) else \
+                    np.zeros(len(timestamps), dtype=np.int64)
+        found = (nexttimes == timestamps) & ~beyond
+        lines = linenos[positions] if len(times) else nexttimes.copy()
+        if relative:
+            nexttimes = nexttimes - self.min_time
+        nexttimes[beyond] = -1
+        lines[beyond] = -1
+        return found, nexttimes, lines
+
     def xio_seek(self, lineno=0):
         """Seek up to a line by looking up the line_offset list.
 
@@ -290,17 +1490,30 @@ class XIOFile(object):
             return False
 
         #find the nearest line_offset index and offset from there
-        offset_index = (lineno) / 1000
-        self.f.seek(self.line_offset[offset_index])
-        #readin x-1 lines where x is the offset from the last 1000_line_offset
-        i = 0
-        while i < (lineno%1000):
+        i = self.__seekentry__(lineno / 1000, lineno=lineno)
+        #readin the lines from there up to lineno
+        while i < lineno:
             self.f.readline()
             i += 1
 
+    def __seekentry__(self, block, lineno=None, timestamp=None):
+        """Seek to the first line of a block of 1000 lines and return its
+           line number (see xio_seek and xio_timeseek)
+
+        Subclasses may enter the block at a later line instead, if it is
+        not after lineno and all the lines before it have timestamps
+        smaller than timestamp.
+
+        """
+        self.f.seek(self.line_offset[block])
+        return block * 1000
+
     def xio_timeseek(self, timestamp=0, relative=True):
         """Seek to the first line with a specified timestamp
-        by looking up the time_offset list.
+        by looking up the time index.
+
+        The block of 1000 lines that contains the line is found with a
+        binary search (see xio_timeindex), and only that block is read.
 
         parameter:
         timestamp    --  The time to seek to (in ms)
@@ -310,31 +1523,34 @@ class XIOFile(object):
 
         returns:
         False if timeseeking fails
-        The first line found with the requested timestamp
+        The first line found with the requested timestamp (or the first
+        line with a later timestamp, if there is no such line)
+
+        """
+        return self.__timeseek__(timestamp, relative)[1]
+
+    def __timeseek__(self, timestamp, relative):
+        """Seek to the first line with a timestamp >= timestamp
+
+        Returns the line number and the line, or (None, False)
 
         """
         if self.indexed == False:
-            return False
+            return None, False
 
         if relative:
             timestamp += self.min_time
-        if timestamp < self.min_time or timestamp > self.max_time:
-            return False
-        #find the nearest time_offset index and offset from there
-        offset_index = (timestamp - self.min_time) / 1000 - 1
-        self.f.seek(self.time_offset[offset_index])
-        #seek back if erroneoulsy sought too far
-        while (self.xio_parseline(self.f.readline())['time'] > timestamp) and \
-              (offset_index >= 0):
-            offset_index -= 1
-            self.f.seek(self.time_offset[offset_index])
-        if offset_index == -1:
-            self.f.seek(0)
+        if timestamp < self.min_time or timestamp > self.max_time_upto[-1]:
+            return None, False
+        #find the first block that contains a timestamp >= timestamp
+        block = bisect_left(self.max_time_upto, timestamp)
+        lineno = self.__seekentry__(block, timestamp=timestamp)
         #readin lines until timestamp is found
         line = self.f.readline()
-        while self.xio_parseline(line)['time'] < timestamp:
+        while self.parser.linetime(line) < timestamp:
             line = self.f.readline()
-        return line
+            lineno += 1
+        return lineno, line
 
 
     def xio_getline(self, lineno=0):
@@ -402,32 +1618,67 @@ class XIOFile(object):
 
         line    --  A line.
         """
-        try:
-            #support legacy format from fame logger that had
-            # an ":" character in the type
-            if ':' not in line.split(" ")[0]:
-                line = '<:' + line.split('<')[1]
-            #get the sensor_name, value type, value and timestamp of event
-            value_type = line.split(' ')[0].split(":")[1]
-            sensor_name = line.split('sensorName="')[1].split('"')[0]
-            value = line.split('value="')[1].split('"')[0]
-            timestamp = line.split('timestamp="')[1].split('"')[0]
+        header = XIOLineParser.splitheader(line)
+        if header is None:
+            return {'valuetype': '', 'value': line, 'sensorname': '',
+                    'fieldname': '', 'time': -1}
+        return self.xio_decodeheader(header)
 
-            #extract the field (slot) name from the sensor name
-            sensor_name, field_name = self.xio_parsename(sensor_name)
+    def xio_parseheader(self, line=' '):
+        """Parse the attributes of a raw xioline, without the value
 
-            #pack everything into a dict
-            values = {'valuetype': value_type,
-                      'value': self.xio_parsetypes(value, value_type.lower()),
-                      'sensorname': sensor_name, 'fieldname': field_name,
-                      'time': int(timestamp)}
+        Splitting the line is cheap compared to converting the value
+        into an object (see xio_parsetypes). Lines can be filtered by
+        their header, so that only the values that are needed are
+        converted (see xio_decodeheader).
 
-            #if the type is not supported return an error code of -2
-            if str(values['value']).startswith('KeyError'):
-                values['time'] = -2
-        except IndexError:
-            values = {'valuetype': '', 'value': line, 'sensorname': '',
-                      'fieldname': '', 'time': -1}
+        Returns a tuple (valuetype, sensorname, fieldname, time, value)
+        where value is the raw (unconverted) string, or None if the
+        line cannot be parsed
+
+        Keyword arguments:
+
+        line    --  A line.
+        """
+        return self.parser.parseheader(line)
+
+    def xio_headertime(self, header):
+        """Return the timestamp of a parsed header (see xio_parseheader)
+
+        Returns the same error codes as xio_parseline: -1 if the line
+        could not be parsed, and -2 if the type is not supported
+
+        Arguments:
+        header  --  A header tuple, or None
+
+        """
+        if header is None:
+            return -1
+        if header[0].lower() not in self.parsing_fn:
+            return -2
+        return header[3]
+
+    def xio_decodeheader(self, header):
+        """Convert a parsed header into a parsed line
+
+        Converts the raw value according to its type, and returns the
+        same dictionary as xio_parseline
+
+        Arguments:
+        header  --  A header tuple (see xio_parseheader)
+
+        """
+        value_type, sensor_name, field_name, timestamp, value = header
+        otype = value_type.lower()
+        #pack everything into a dict
+        values = {'valuetype': value_type,
+                  'value': self.xio_parsetypes(value, otype),
+                  'sensorname': sensor_name, 'fieldname': field_name,
+                  'time': timestamp}
+
+        #if the type is not supported return an error code of -2
+        if otype not in self.parsing_fn:
+            values['time'] = -2
         return values
 
     def xio_parsetypes(self, value, otype):
@@ -446,23 +1697,8 @@ class XIOFile(object):
            a string starting with 'KeyError', followed by the type
 
         """
-        # Dict of functions for parsing sensor values
-        # appropriate to each input type.
-        parsing_fn = {'sffloat' : float,
-                      'sfvec3f' : SFVec3f,
-                      'sfvec2f' : SFVec2f,
-                      'mfvec2f' : MFVec2f,
-                      'mfvec3f' : MFVec3f,
-                      'sfrotation' : SFRotation,
-                      'mfrotation' : MFRotation,
-                      'sfbool' : sfbool,
-                      'boolean': sfbool,
-                      'sfint32' : int,
-                      'sfstring' : str,
-                      'mfstring': MFString,
-                      'mffloat': MFFloat}
         try:
-            converted = parsing_fn[otype](value)
+            converted = self.parsing_fn[otype](value)
         except KeyError:
             converted = 'KeyError:' + str(otype)
         return converted
@@ -493,7 +1729,8 @@ class XIOFile(object):
 
 
 
-    def xio_linegen(self, start=0, end=1, parsed=True, on_errors='ignore'):
+    def xio_linegen(self, start=0, end=1, parsed=True, on_errors='ignore',
+                    records=False):
 
         """Generate a (raw or parsed) line range from a previously
            opened and indexed XIO file.
@@ -509,6 +1746,8 @@ class XIOFile(object):
                         on_errors is 'stop', the generator will stop
                         at the first unparseable line; an additional
                         warning will be printed.
+        records      -- Generate parsed lines as XIORecord tuples instead
+                        of dicts (see xio_quicklinegen)
 
 
         """
@@ -528,8 +1767,12 @@ class XIOFile(object):
                     yield line
                     continue
                 #else:
-                parsedline = self.xio_parseline(line)
-                tcurrent = parsedline["time"]
+                if records:
+                    parsedline = self.parser.parserecord(line)
+                    tcurrent = parsedline.time
+                else:
+                    parsedline = self.parser.parseline(line)
+                    tcurrent = parsedline["time"]
                 #errors = ['ignore', 'report', 'stop']
                 if tcurrent < 0:
                     if errors.index(on_errors) > 0:
@@ -547,7 +1790,8 @@ class XIOFile(object):
 
 
     def xio_linegen_timerange(self, start_time, end_time, relative=True,
-                              parsed=True, on_errors='ignore'):
+                              parsed=True, on_errors='ignore',
+                              sensorfilter=None, records=False):
         """Generate a (parsed or raw) line range from a previously
            opened and indexed XIO file.
 
@@ -559,10 +1803,17 @@ class XIOFile(object):
                          Relative timestamps have their zero at min_time
                          (the first timestamp in the file)
         parsed -- Toggle between raw or parsed output lines
+        sensorfilter --  A function f(sensorname, fieldname) that returns
+                         True for the lines that should be generated
+                         (see xio_quicklinegen)
+        records      --  Generate parsed lines as XIORecord tuples
+                         instead of dicts (see xio_quicklinegen)
 
         """
         errors = ['ignore', 'report', 'stop']
-        line = self.xio_timeseek(start_time, relative)
+        decode = self.parser.decoderecord if records else \
+                 self.parser.decodeheader
+        lineno, line = self.__timeseek__(start_time, relative)
         if start_time > end_time:
             yield "bad limits"
         elif not line:
@@ -571,11 +1822,21 @@ class XIOFile(object):
             if relative:
                 end_time += self.min_time
                 start_time += self.min_time
-            tcurrent = start_time
-            parsedline = self.xio_parseline(line)
-            while tcurrent <= end_time and line != '':
+            #no lines in the range after the last block that starts
+            #before end_time (lines that were not indexed are read until
+            #the first line after end_time)
+            endline = bisect_right(self.min_time_from, end_time) * 1000
+            header = self.parser.parseheader(line)
+            tcurrent = self.parser.headertime(header)
+            while line != '':
+                if lineno >= endline and (endline < len(self.line_offset) *
+                                          1000 or tcurrent > end_time):
+                    break
                 if tcurrent > 0:
-                    yield parsedline if parsed else line
+                    if start_time <= tcurrent <= end_time and \
+                       (sensorfilter is None or
+                        sensorfilter(header[1], header[2])):
+                        yield decode(header) if parsed else line
                 else:
                     if errors.index(on_errors) > 0:
                         print "unparseable line: " + line
@@ -583,8 +1844,9 @@ class XIOFile(object):
                         break
 
                 line = self.f.readline()
-                parsedline = self.xio_parseline(line)
-                tcurrent = parsedline["time"]
+                lineno += 1
+                header = self.parser.parseheader(line)
+                tcurrent = self.parser.headertime(header)
 
     def xio_formatline(self, value_type, value, sensorname, fieldname,
                        timestamp):
@@ -599,55 +1861,569 @@ class XIOFile(object):
         timestamp   -- The timestamp of this line
 
         """
-        string = {}
-        string['legacy'] = '<irio:' + str(value_type) + ' value="' + \
-                           str(value) + '" sensorName="xioFileClass/' + \
-                           str(sensorname) + '/' + str(fieldname) + \
-                           '" timestamp="' + str(timestamp) + '"></irio:' + \
-                           str(value_type) + '>' +'\n'
-        string['venice'] = '<' + str(value_type) + ' value="' + \
-                           str(value) + '" timestamp="' + str(timestamp) + \
-                           '" sensorName="' + str(sensorname) + '/' + \
-                           str(fieldname) + '"/>'  +'\n'
-        return string[self.xioformat]
+        if self.xioformat == 'legacy':
+            return _LEGACY_LINE % (value_type, value, sensorname, fieldname,
+                                   timestamp, value_type)
+        return _VENICE_LINE % (value_type, value, timestamp, sensorname,
+                               fieldname)
 
     def xio_writeheader(self):
         """Write the header to the output XIO file"""
-        self.xio_writeline('<?xml version="1.0" encoding="utf-8"?>'+'\n')
-        string = {}
-        string['legacy'] = ('<instantioprotocol xmlns="http://www.techfak.uni'
-                            '-bielefeld.de/ags/wbski/instantloggerprotocol"'
-                            ' xmlns:irio="http://www.techfak.uni-bielefeld.de'
-                            '/ags/wbski/instantloggerprotocol/interaction"'
-                            ' version="1">')
-        string['venice'] = ('<veniceprotocol info="venice file format '
-                            'generated by mumodo" version="1.0">')
-        self.xio_writeline(string[self.xioformat] + '\n')
+        self.__write__(XIO_HEADER[self.xioformat])
 
     def xio_writeline(self, line):
         """Write a line to an XIO file previously opened for writing """
+        self.xio_writelines((line, ))
 
-        self.f.write(line)
+    def xio_writelines(self, lines):
+        """Write a batch of lines to an XIO file opened for writing
+
+        The lines are added to the index (if it is kept, see the
+        writeindex argument of the constructor) and to the buffer, and
+        the buffer is written or flushed as needed.
+
+        Arguments:
+        lines   --  A list of raw xiolines
+
+        """
+        start = self.offset
+        if self.writeindex:
+            for line in lines:
+                self.__indexwrite__(line)
+                self.offset += len(line)
+                self.lines += 1
+        else:
+            self.offset += sum(map(len, lines))
+            self.lines += len(lines)
+        self.buffer.extend(lines)
+        self.buffered += self.offset - start
+        if self.buffered >= self.buffersize:
+            self.__drain__()
+        if self.flush_interval > 0 and time.time() >= self.flush_due:
+            self.xio_flush()
+
+    def xio_writerecords(self, records):
+        """Format and write a batch of records to an XIO file
+
+        This is faster than formatting and writing the lines one by one
+        with xio_formatline and xio_writeline.
+
+        Arguments:
+        records --  A list of tuples (valuetype, sensorname, fieldname,
+                    time, value), e.g. XIORecords
+
+        """
+        if self.xioformat == 'legacy':
+            lines = [_LEGACY_LINE % (v, value, s, f, t, v)
+                     for v, s, f, t, value in records]
+        else:
+            lines = [_VENICE_LINE % (v, value, t, s, f)
+                     for v, s, f, t, value in records]
+        self.xio_writelines(lines)
+
+    def xio_flush(self):
+        """Write the buffered lines and flush the file
+
+        The lines written so far can then be read from the file (see
+        xio_follow), and the index is saved if it is kept (see the
+        writeindex argument of the constructor).
+
+        """
+        self.__drain__()
+        self.f.flush()
+        if self.writeindex:
+            self.resume = (self.offset, self.toffset, None)
+            self.__saveindex__()
+        self.flush_due = time.time() + self.flush_interval
 
     def xiofile_close(self):
         """Close a previously opened xio File."""
 
-        string = {}
-        string['legacy'] = '</instantioprotocol>'
-        string['venice'] = '</veniceprotocol>'
+        if self.mode == 'r':
+            self.f.close()
+            return
+        self.__drain__()
+        self.f.close()
+        #the footer is written as a gzip member of its own, so that
+        #it can be cut off when appending to the file (see __resume__)
+        footer = XIO_FOOTER[self.xioformat]
+        with open(self.path, 'ab') as raw:
+            raw.write(gzip_block(footer))
+        if self.writeindex:
+            #the footer is indexed like any other line (see xio_index)
+            blank = '' not in self.fieldnames.get('', [])
+            self.resume = (self.offset, self.toffset, blank)
+            self.__indexline__(self.lines, self.offset, None, -1,
+                               len(footer))
+            self.__saveindex__()
+
+    def __create__(self, path, mode, blocksize, compresslevel, threads):
+        """Open a gzip file for writing (see the constructor)"""
+        if blocksize > 0:
+            return BlockedGzipWriter(path, blocksize, compresslevel, threads,
+                                     mode)
+        return gzip.open(path, mode, compresslevel)
+
+    def __write__(self, data):
+        """Add data that is not a line (e.g. the header) to the buffer"""
+        self.buffer.append(data)
+        self.buffered += len(data)
+        self.offset += len(data)
+
+    def __drain__(self):
+        """Compress and write the buffered lines"""
+        if self.buffer:
+            self.f.write(''.join(self.buffer))
+            del self.buffer[:]
+            self.buffered = 0
+
+    def __indexwrite__(self, line):
+        """Add a written line to the index (see xio_index)"""
+        header = self.parser.parseheader(line)
+        tcurrent = self.parser.headertime(header)
+        if tcurrent != -1 and not hasattr(self, 'min_time'):
+            self.min_time = tcurrent
+        if tcurrent - self.toffset >= 1000:
+            self.time_offset.append(self.offset)
+            self.toffset = tcurrent
+        self.__indexline__(self.lines, self.offset, header, tcurrent,
+                           len(line))
+        self.max_time = tcurrent
+
+    def __saveindex__(self):
+        """Save the index of the lines written so far"""
+        self.max_lines = self.lines - 1
+        self.xio_saveindex()
+
+    def __resume__(self, blocksize, compresslevel, threads):
+        """Open an existing file for appending (see the constructor)
+
+        The fileformat is taken from the header of the file. If the file
+        ends with the footer written by xiofile_close, the footer is cut
+        off. Otherwise, the lines of the file are copied into a new file
+        (without the footer and an incomplete last line), which then
+        replaces the file. The index is loaded from the sidecar index
+        file if it was saved by a writer, and rebuilt otherwise.
+
+        """
+        f, _, blocks = _open_xio(self.path, follow=True, verbose=False)
+        header = [f.readline() for _ in range(self.headerlines)]
+        if 'instantioprotocol' in ''.join(header):
+            self.xioformat = 'legacy'
+        else:
+            self.xioformat = 'venice'
+        self.parser = XIOLineParser(self.xioformat)
+        footer = gzip_block(XIO_FOOTER[self.xioformat])
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as raw:
+            raw.seek(max(0, size - len(footer)))
+            closed = raw.read() == footer
+        #a file that was flushed but not closed can only be appended to
+        #if its gzip members are complete, i.e. if it is a blocked file
+        if self.writeindex and self.xio_loadindex() and \
+           self.resume is not None and \
+           (closed or (self.resume[2] is None and blocks is not None)):
+            f.close()
+            self.offset, self.toffset, blank = self.resume
+            self.lines = self.max_lines + 1
+            if closed:
+                #remove the footer from the index
+                if blank:
+                    self.fieldnames[''].remove('')
+                    if not self.fieldnames['']:
+                        del self.fieldnames['']
+                if self.lines % 1000 == 0:
+                    for blocklist in [self.line_offset, self.block_min_time,
+                                      self.block_max_time,
+                                      self.block_sensors]:
+                        blocklist.pop()
+        elif closed:
+            if self.writeindex:
+                print 'indexing ...'
+                self.__newindex__()
+                self.offset = sum(map(len, header))
+                line = f.readline()
+                for nextline in f:
+                    self.__indexwrite__(line)
+                    self.offset += len(line)
+                    self.lines += 1
+                    line = nextline
+            f.close()
+        else:
+            print 'rewriting ' + self.path + ' ...'
+            tmpfile = self.path + '.tmp'
+            self.f = self.__create__(tmpfile, 'wb', blocksize, compresslevel,
+                                     threads)
+            if self.writeindex:
+                self.__newindex__()
+            for line in header:
+                self.__write__(line)
+            #no flushing (and saving the index) before the file is replaced
+            self.flush_due = float('inf')
+            for line in f:
+                if not line.endswith('\n') or line.startswith('</'):
+                    break
+                self.xio_writeline(line)
+            f.close()
+            self.__drain__()
+            _replace_file(tmpfile, self.path)
+            self.flush_due = time.time() + self.flush_interval
+            return
+        with open(self.path, 'rb+') as raw:
+            raw.truncate(size - len(footer) if closed else size)
+        if blocks is not None:
+            blocksize = blocksize or 65536
+        self.f = self.__create__(self.path, 'ab', blocksize, compresslevel,
+                                 threads)
+
+def _open_xio(path, checkpoint_interval=0, follow=False, verbose=True):
+    """Open an XIO file for reading
+
+    Returns the file object, True if the file is compressed, and the
+    blocks of a blocked gzip file (None for other files).
+
+    """
+    with open(path) as f:
+        is_gzipped = (f.read(2) == '\x1f\x8b')
+    blocks = gzip_block_index(path) if is_gzipped else None
+    if blocks is not None:
+        message = 'opening blocked compressed file ...'
+        f = GzipCheckpointReader(path, checkpoint_interval or 1048576,
+                                 blocks=blocks, follow=follow)
+    elif is_gzipped and (checkpoint_interval > 0 or follow):
+        message = 'opening compressed file with random access ...'
+        f = GzipCheckpointReader(path, checkpoint_interval or 1048576,
+                                 follow=follow)
+    elif is_gzipped:
+        message = 'opening compressed file ...'
+        f = gzip.open(path)
+    else:
+        message = 'opening un-compressed file ...'
+        f = open(path)
+    if verbose:
+        print message
+    return f, is_gzipped, blocks
+
+class XIOMultiFile(XIOFile):
+
+    """Read the parts of a rotated recording as one XIO file."""
+
+    index_suffix = '.parts.idx'
+
+    def __init__(self, paths, maxlines=0, indexing=False, headerlines=2,
+                 indexfile=None, writeindex=False, checkpoint_interval=0,
+                 mfarrays=False, lazy=False):
+        """Open an ordered list of XIO files as one file (read mode)
+
+        Long recordings are often split into several files (parts). The
+        parts are read one after the other, as if their lines were in one
+        file: the header lines of all parts but the first and the closing
+        tags of all parts but the last are left out. There is one line
+        index and one time index for all parts, so that seeking (e.g. by
+        xio_linegen_timerange) opens only the part with the line sought
+        after, and reading continues into the next parts.
+
+        Arguments:
+        paths       --  The list of the paths of the parts, in order
+
+        Keyword arguments:
+        maxlines,
+        indexing,
+        headerlines,
+        writeindex,
+        checkpoint_interval,
+        mfarrays,
+        lazy        --  See XIOFile
+        indexfile   --  Path of the sidecar index file. Defaults to the
+                        path of the first part plus '.parts.idx'. The
+                        index is only used if no part has changed
+
+        Files that are still being written (XIOFile argument follow) and
+        parallel parsing of blocked files are not supported.
 
-        if self.mode == 'w':
-            self.xio_writeline(string[self.xioformat])
+        """
+        self.paths = list(paths)
+        if indexfile is None:
+            indexfile = self.paths[0] + self.index_suffix
+        super(XIOMultiFile, self).__init__(self.paths[0], 'r', maxlines,
+                                           indexing, headerlines,
+                                           indexfile=indexfile,
+                                           writeindex=writeindex,
+                                           checkpoint_interval=
+                                           checkpoint_interval,
+                                           mfarrays=mfarrays, lazy=lazy)
+
+    def __open__(self, checkpoint_interval, follow):
+        print 'opening ' + str(len(self.paths)) + ' parts ...'
+        opener = partial(_open_xio, checkpoint_interval=checkpoint_interval,
+                         verbose=False)
+        self.is_gzipped = False
+        self.blocks = None
+        self.f = _XIOPartsReader(self.paths, self.headerlines,
+                                 lambda path: opener(path)[0])
+        return self.f
+
+    def __readahead__(self):
+        return _XIOPartsReader(self.paths, self.headerlines, ReadAheadReader)
+
+    def __indexextras__(self):
+        #where the parts start, so that seeking opens the right part
+        #right away after the index is loaded
+        return {'part_starts': list(self.f.starts),
+                'part_skips': list(self.f.skips),
+                'part_lines': list(self.f.startlines),
+                'part_times': list(self.part_times)}
+
+    def __setindexextras__(self, index):
+        starts = index.get('part_starts', [])
+        if len(starts) > len(self.f.starts):
+            self.f.starts = list(starts)
+            self.f.skips = list(index['part_skips'])
+            self.f.startlines = list(index['part_lines'])
+        self.part_times = list(index.get('part_times', []))
+
+    def __newindex__(self):
+        super(XIOMultiFile, self).__newindex__()
+        #the largest timestamp before each part (see __seekentry__)
+        self.part_times = []
+        self.__maxtime = -1
+
+    def __indexline__(self, lineno, offset, header, tcurrent, size):
+        while len(self.part_times) < len(self.f.starts) and \
+              offset >= self.f.starts[len(self.part_times)]:
+            self.part_times.append(self.__maxtime)
+        self.__maxtime = max(self.__maxtime, tcurrent)
+        super(XIOMultiFile, self).__indexline__(lineno, offset, header,
+                                                tcurrent, size)
+
+    def __seekentry__(self, block, lineno=None, timestamp=None):
+        #enter the block at the start of the last part that begins in it,
+        #if the line sought after is not before it
+        for part in reversed(range(1, len(self.f.startlines))):
+            start = self.f.startlines[part]
+            if start is None:
+                continue
+            start -= self.headerlines
+            if start <= block * 1000:
+                break
+            if lineno is not None and start > lineno:
+                continue
+            if timestamp is not None and \
+               (part >= len(self.part_times) or
+                self.part_times[part] >= timestamp):
+                continue
+            self.f.seek(self.f.starts[part])
+            return start
+        return super(XIOMultiFile, self).__seekentry__(block, lineno,
+                                                       timestamp)
+
+    def xio_indexstate(self, maxlines=0):
+        """Return the fingerprint an index file must match to be valid.
+
+        The same as XIOFile.xio_indexstate, but with the paths, sizes and
+        modification times of all parts.
+
+        """
+        state = super(XIOMultiFile, self).xio_indexstate(maxlines)
+        stats = [os.stat(path) for path in self.paths]
+        state.update({'paths': self.paths,
+                      'size': [stat.st_size for stat in stats],
+                      'mtime': [stat.st_mtime for stat in stats]})
+        return state
+
+    def xio_canseek(self):
+        """Return True if all the parts can be entered at any offset (see
+           XIOFile.xio_canseek)"""
+        for path in self.paths:
+            with open(path, 'rb') as f:
+                gzipped = f.read(2) == '\x1f\x8b'
+            if gzipped and gzip_block_index(path) is None:
+                return False
+        return True
+
+    def xio_follow(self, *args, **kwargs):
+        print 'following multi-part files is not supported'
+        return iter([])
+
+class _XIOPartsReader(object):
+
+    """The lines of the parts of a recording, as one file (XIOMultiFile)
+
+    Offsets (see tell and seek) are positions in the joined lines, which
+    leave out the header lines of all parts but the first, and the last
+    line of all parts but the last if it has no newline (the closing tag).
+
+    """
+
+    def __init__(self, paths, headerlines, opener):
+        self.paths = paths
+        self.headerlines = headerlines
+        self.opener = opener
+        #the offset of the first line of each part, the size of the
+        #header lines of the part and the number of lines before it (None
+        #if unknown), known once the part has been opened (or loaded with
+        #the index, see XIOMultiFile)
+        self.starts = []
+        self.skips = []
+        self.startlines = []
+        self.f = None
+        self.offset = 0
+        self.lineno = 0
+        self.__openpart__(0)
+
+    def __openpart__(self, part):
+        """Open a part and skip its header lines"""
+        if self.f is not None:
+            self.f.close()
+        self.f = self.opener(self.paths[part])
+        self.lines = iter(self.f)
+        self.part = part
+        skip = 0
+        if part > 0:
+            for _ in range(self.headerlines):
+                skip += len(next(self.lines, ''))
+        if part == len(self.starts):
+            self.starts.append(self.offset)
+            self.skips.append(skip)
+            self.startlines.append(self.lineno)
+
+    def readline(self):
+        """Read one line, continuing with the next part at the end"""
+        last = len(self.paths) - 1
+        while True:
+            line = next(self.lines, '')
+            if line.endswith('\n') or (line and self.part == last):
+                self.offset += len(line)
+                if self.lineno is not None:
+                    self.lineno += 1
+                return line
+            if self.part == last:
+                return ''
+            self.__openpart__(self.part + 1)
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def __iter__(self):
+        return self
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset):
+        """Move to an offset (the start of a line) in the joined lines"""
+        if offset > self.starts[-1] and len(self.starts) < len(self.paths):
+            #where the next parts start is not known yet: read up to offset
+            if self.part != len(self.starts) - 1 or self.offset > offset:
+                self.seek(self.starts[-1])
+            while self.offset < offset and self.readline():
+                pass
+            return
+        part = bisect_right(self.starts, offset) - 1
+        if part != self.part:
+            self.__openpart__(part)
+        self.f.seek(self.skips[part] + offset - self.starts[part])
+        self.lines = iter(self.f)
+        self.offset = offset
+        self.lineno = self.startlines[part] \
+                      if offset == self.starts[part] else None
+
+    def close(self):
+        """Close the open part"""
         self.f.close()
 
+def _parse_xio_block(task):
+    """Parse one block of a blocked XIO file (see XIOFile.__blockgen__)
+
+    Returns the parsed rows that pass the filters, the number of lines
+    in the block, the indices of the unparseable lines and True if no
+    more blocks need to be parsed.
+
+    """
+    (path, rawoffset, rawsize, skip, fileformat, parsing_fn, start_time,
+     end_time, sensorfilter, stop_on_errors, records) = task
+    parser = XIOLineParser(fileformat, parsing_fn)
+    decode = parser.decoderecord if records else parser.decodeheader
+    lines = StringIO(read_gzip_block(path, rawoffset, rawsize))
+    lines.seek(skip)
+    rows = []
+    errorlines = []
+    i = -1
+    for i, line in enumerate(lines):
+        header = parser.parseheader(line)
+        tcurrent = parser.headertime(header)
+        if tcurrent < 0:
+            errorlines.append(i)
+            if stop_on_errors:
+                return rows, i + 1, errorlines, True
+            continue
+        if tcurrent < start_time:
+            continue
+        if end_time > 0 and tcurrent > end_time:
+            return rows, i + 1, errorlines, True
+        if sensorfilter is not None and not sensorfilter(header[1], header[2]):
+            continue
+        rows.append(decode(header))
+    return rows, i + 1, errorlines, False
+
+class SensorFilter(object):
+
+    """Select XIO lines by their sensorname and fieldname."""
+
+    def __init__(self, sensornames, with_fields=None, without_fields=None):
+        """Create a filter for the sensorfilter argument of the generators
+
+        The filter is called with a sensorname and a fieldname and
+        returns True if the line should be kept. Lines are selected in
+        the same way as by the quantize function of mumodoIO.
+
+        Arguments:
+        sensornames    --  A sensorname, or a collection of sensornames
+
+        Keyword arguments:
+        with_fields    --  a list of fieldnames. Only these fields are kept
+        without_fields --  a list of fieldnames. These fields are dropped.
+                           This overrides with_fields
+
+        """
+        if isinstance(sensornames, basestring):
+            sensornames = [sensornames]
+        self.sensornames = set(sensornames)
+        self.with_fields = set(with_fields) if with_fields else None
+        self.without_fields = set(without_fields) if without_fields \
+                              else set()
+
+    def __call__(self, sensorname, fieldname):
+        if sensorname not in self.sensornames:
+            return False
+        if self.with_fields is not None and fieldname not in self.with_fields:
+            return False
+        return fieldname not in self.without_fields
 
 
 def xiofile_quickcopy(origin_file, new_file, start_time=0, end_time=0,
-                      relative=True):
+                      relative=True, sensornames=None):
     """Copy a part of a XIOFile to a new file.
 
+    The lines are copied as they are: only their timestamps and
+    sensornames are parsed, not their values.
+
+    If the origin file is indexed (either an indexed XIOFile object, or
+    a file with a sidecar index, see XIOFile), copying starts at the
+    first block of lines that contains start_time, and the lines before
+    it are not parsed. Only uncompressed and blocked gzip files (see
+    XIOFile, argument blocksize) are entered there without reading the
+    data before it, so the sidecar index of a plain gzip file is not
+    used (its lines are read ahead instead). An indexed XIOFile object
+    that was opened with a checkpoint_interval and has already been
+    read once is entered at the checkpoints.
+
     Arguments:
-    origin_file        --  Filename and path of the file to copy.
+    origin_file        --  Filename and path of the file to copy, or an
+                           XIOFile object opened for reading.
     new_file           --  Filename and path of the new file.
 
     Keyword arguments:
@@ -656,12 +2432,285 @@ def xiofile_quickcopy(origin_file, new_file, start_time=0, end_time=0,
     relative     --  Toggle between relative and absolute timestamps
                      Relative timestamps have their zero at min_time
                      (the first timestamp in the file)
+    sensornames  --  A sensorname or a collection of sensornames. If
+                     given, only the lines of these sensors are copied
 
     """
-    infile = XIOFile(origin_file, 'r', indexing=False)
+    if isinstance(origin_file, XIOFile):
+        infile = origin_file
+    else:
+        #a valid sidecar index is only used where it saves reading
+        infile = XIOFile(origin_file, 'r')
+        if infile.xio_canseek() and infile.xio_loadindex():
+            infile.indexed = True
+    sensorfilter = None
+    if sensornames is not None:
+        sensorfilter = SensorFilter(sensornames)
     oufile = XIOFile(new_file, 'w')
     for line in infile.xio_quicklinegen(start_time, end_time, parsed=False,
-                                        relative=relative):
+                                        relative=relative,
+                                        sensorfilter=sensorfilter,
+                                        readahead=not infile.indexed):
+        oufile.xio_writeline(line)
+    if infile is not origin_file:
+        infile.xiofile_close()
+    oufile.xiofile_close()
+
+def xiofile_mergegen(xiofiles, start_time=0, end_time=0, parsed=True,
+                     offsets=None, sensorfilter=None):
+    """Generate the lines of several XIO files, ordered by timestamp.
+
+    The files are read in parallel and merged with a heap, so memory
+    use does not depend on the size of the files. Lines with the same
+    timestamp are generated in the order of the files, and the lines
+    of each file stay in their original order.
+
+    Arguments:
+    xiofiles    --  A list of filenames or XIOFile objects opened for
+                    reading
+
+    Keyword arguments:
+    start_time,
+    end_time    --  Time range (absolute timestamps, after adding the
+                    offsets). Default values merge the entire files
+    parsed      --  Flag to yield parsed or raw lines
+    offsets     --  A list with a timestamp offset (in ms) for each
+                    file, which is added to the timestamps of its lines
+                    (also to the timestamp attribute of raw lines), e.g.
+                    to synchronize files recorded on different machines
+    sensorfilter --  A function f(sensorname, fieldname) that returns
+                     True for the lines that should be generated (see
+                     XIOFile.xio_quicklinegen)
+
+    """
+    infiles = [x if isinstance(x, XIOFile) else XIOFile(x, 'r')
+               for x in xiofiles]
+    if offsets is None:
+        offsets = [0] * len(infiles)
+    generators = []
+    for index, infile in enumerate(infiles):
+        offset = offsets[index]
+        start = max(start_time - offset, 0) if start_time > 0 else 0
+        end = end_time - offset if end_time > 0 else 0
+        if end_time > 0 and end <= 0:
+            #the whole file is after end_time
+            continue
+        generators.append(_timed_lines(index, infile, start, end, parsed,
+                                       offset, sensorfilter))
+    try:
+        for _, _, _, line in heapq.merge(*generators):
+            yield line
+    finally:
+        for generator in generators:
+            generator.close()
+        for infile, xiofile in zip(infiles, xiofiles):
+            if infile is not xiofile:
+                infile.xiofile_close()
+
+def _timed_lines(index, infile, start_time, end_time, parsed, offset,
+                 sensorfilter):
+    """Generate (timestamp, index, lineno, line) tuples for merging"""
+    lines = infile.xio_quicklinegen(start_time, end_time, parsed,
+                                    relative=False, sensorfilter=sensorfilter,
+                                    readahead=not infile.indexed)
+    try:
+        for lineno, line in enumerate(lines):
+            if parsed:
+                line['time'] += offset
+                timestamp = line['time']
+            else:
+                timestamp = infile.parser.linetime(line)
+                if offset:
+                    line = line.replace('timestamp="%d"' % timestamp,
+                                        'timestamp="%d"' %
+                                        (timestamp + offset), 1)
+                    timestamp += offset
+            yield timestamp, index, lineno, line
+    finally:
+        lines.close()
+
+def xiofile_merge(origin_files, new_file, start_time=0, end_time=0,
+                  offsets=None, sensornames=None):
+    """Merge several XIOFiles into a new file, ordered by timestamp.
+
+    The lines are copied as they are (see xiofile_quickcopy), except for
+    their timestamps if offsets are given.
+
+    Arguments:
+    origin_files    --  A list of filenames or XIOFile objects opened
+                        for reading
+    new_file        --  Filename and path of the new file.
+
+    Keyword arguments:
+    start_time,
+    end_time,
+    offsets         --  See xiofile_mergegen
+    sensornames     --  A sensorname or a collection of sensornames. If
+                        given, only the lines of these sensors are copied
+
+    """
+    sensorfilter = None
+    if sensornames is not None:
+        sensorfilter = SensorFilter(sensornames)
+    oufile = XIOFile(new_file, 'w')
+    for line in xiofile_mergegen(origin_files, start_time, end_time, False,
+                                 offsets, sensorfilter):
         oufile.xio_writeline(line)
-    infile.xiofile_close()
     oufile.xiofile_close()
+
+def xiofile_split(origin_file, new_files=None, groups=None, sensornames=None,
+                  start_time=0, end_time=0, relative=True, max_open=32,
+                  buffersize=65536, blocksize=None, writeindex=False):
+    """Split a XIOFile into one file per sensor, in a single pass.
+
+    The lines are copied as they are (see xiofile_quickcopy). Programs
+    that need only one sensor can then read a much smaller file. The new
+    files are written by XIOFile objects. The lines of each new file are
+    buffered, and only max_open files are open at the same time, so
+    that files with many sensors can be split (closed files are
+    reopened in 'a' mode, which cuts off their footer).
+
+    Arguments:
+    origin_file     --  Filename and path of the file to split, or an
+                        XIOFile object opened for reading.
+
+    Keyword arguments:
+    new_files       --  The filenames of the new files, with {} in
+                        place of the sensorname (or group name), e.g.
+                        'out/{}.xio.gz'. The slashes in sensornames are
+                        replaced by underscores. If two sensornames give
+                        the same filename (e.g. 'a/b' and 'a_b'), a
+                        number is added to the later one. Defaults to
+                        the name of the origin file followed by
+                        _{}.xio.gz
+    groups          --  A dict {group name: list of sensornames}. The
+                        sensors of a group are written to the same file.
+                        Other sensors get a file of their own
+    sensornames     --  A sensorname or a collection of sensornames. If
+                        given, only the lines of these sensors are copied
+    start_time,end_time  --  Time range which should be copied. Default
+                             values copy the entire file.
+    relative        --  Toggle between relative and absolute timestamps
+    max_open        --  The maximum number of open files
+    buffersize      --  The number of bytes buffered for each file
+    blocksize       --  The blocksize of the new files (see XIOFile).
+                        Defaults to 65536 if the origin file is a blocked
+                        gzip file, and to 0 (plain gzip) otherwise
+    writeindex      --  If True, the sidecar index of each new file is
+                        written as well (see XIOFile)
+
+    Returns a dict {sensorname or group name: filename of the new file}
+
+    """
+    if isinstance(origin_file, XIOFile):
+        infile = origin_file
+    else:
+        infile = XIOFile(origin_file, 'r')
+    if new_files is None:
+        new_files = re.sub(r'(\.xio)?(\.gz)?$', '', infile.path) + \
+                    '_{}.xio.gz'
+    if blocksize is None:
+        blocksize = 65536 if infile.blocks is not None else 0
+    groupof = {}
+    for group, members in (groups or {}).items():
+        for sensorname in members:
+            groupof[sensorname] = group
+    sensorfilter = None if sensornames is None else SensorFilter(sensornames)
+    writers = None
+    filenames = {}
+    #the filenames of the sensors (or groups), by sensorname
+    targets = {}
+    for line in infile.xio_quicklinegen(start_time, end_time, parsed=False,
+                                        relative=relative,
+                                        sensorfilter=sensorfilter,
+                                        readahead=not infile.indexed):
+        if writers is None:
+            #the format of the lines is known after parsing the first one
+            writers = _XIOWriterPool(infile.parser.fileformat, max_open,
+                                     buffersize, blocksize, writeindex)
+        #the sensor of the line, from the line itself (the names are
+        #cached by the parser)
+        sensorname = infile.parser.parseheader(line)[1]
+        try:
+            filename = targets[sensorname]
+        except KeyError:
+            key = groupof.get(sensorname, sensorname)
+            if key not in filenames:
+                filenames[key] = _split_filename(new_files, key,
+                                                 filenames.values())
+            filename = targets[sensorname] = filenames[key]
+        writers.writeline(filename, line)
+    if writers is not None:
+        writers.close()
+    if infile is not origin_file:
+        infile.xiofile_close()
+    return filenames
+
+def _split_filename(new_files, key, used):
+    """Return the filename of a sensor or group (see xiofile_split) that
+       is not one of the used filenames"""
+    name = key.replace('/', '_')
+    filename = new_files.format(name)
+    number = 2
+    while filename in used:
+        filename = new_files.format(name + '_' + str(number))
+        number += 1
+    if number > 2:
+        print 'writing ' + key + ' to ' + filename + \
+              ', as its name is taken by another sensor'
+    return filename
+
+class _XIOWriterPool(object):
+
+    """Write lines to many XIO files, keeping only a few of them open"""
+
+    def __init__(self, fileformat, max_open, buffersize, blocksize,
+                 writeindex):
+        self.fileformat = fileformat
+        self.max_open = max_open
+        self.buffersize = buffersize
+        self.blocksize = blocksize
+        self.writeindex = writeindex
+        #the open XIOFiles, least recently used first
+        self.files = OrderedDict()
+        #the lines not written yet, and their size, for each filename
+        self.buffers = {}
+        self.sizes = {}
+        #the files that were created (and are appended to)
+        self.created = set()
+
+    def writeline(self, filename, line):
+        """Buffer a line for a file, and write the buffer when it is full"""
+        try:
+            self.buffers[filename].append(line)
+        except KeyError:
+            self.buffers[filename] = [line]
+            self.sizes[filename] = 0
+        self.sizes[filename] += len(line)
+        if self.sizes[filename] >= self.buffersize:
+            self.__flush__(filename)
+
+    def __flush__(self, filename):
+        """Write the buffered lines of a file, opening it if needed"""
+        f = self.files.pop(filename, None)
+        if f is None:
+            if len(self.files) >= self.max_open:
+                self.files.popitem(last=False)[1].xiofile_close()
+            f = XIOFile(filename, 'a' if filename in self.created else 'w',
+                        fileformat=self.fileformat, blocksize=self.blocksize,
+                        writeindex=self.writeindex,
+                        buffersize=self.buffersize)
+            self.created.add(filename)
+        self.files[filename] = f
+        f.xio_writelines(self.buffers[filename])
+        self.buffers[filename] = []
+        self.sizes[filename] = 0
+
+    def close(self):
+        """Write the rest of the lines and close all files"""
+        for filename in self.buffers:
+            if self.buffers[filename]:
+                self.__flush__(filename)
+        for f in self.files.values():
+            f.xiofile_close()
+        self.files.clear()
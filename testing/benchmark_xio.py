@@ -0,0 +1,64 @@
+"""
+Benchmark of the XIO line parsers
+
+Compares the number of lines per second parsed by XIOFile.xio_parseline
+(the original, split-based parser) and by XIOLineParser (the parser
+used by the XIOFile generators), and checks that both give the same
+results. Also shows the speed of XIOLineParser when decoding the MF
+vector types into ndarrays (XIOFile(..., mfarrays=True)).
+
+usage: python benchmark_xio.py [xiofile ...]
+
+"""
+
+import sys, gzip, time
+from mumodo.xiofile import XIOFile, XIOLineParser, ARRAY_PARSING_FN
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    f = opener(path)
+    lines = f.readlines()
+    f.close()
+    return lines
+
+def lines_per_second(parse, lines, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for line in lines:
+            parse(line)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(lines) / best
+
+def comparable(parsedline):
+    parsedline = dict(parsedline)
+    parsedline['value'] = str(parsedline['value'])
+    return parsedline
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or ['../sampledata/test.xio.gz',
+                             '../sampledata/othersensor.xio.gz',
+                             'data/types.xio.gz']
+    for path in paths:
+        lines = read_lines(path)
+        reference = XIOFile(path).xio_parseline
+        parser = XIOLineParser()
+        for line in lines:
+            if comparable(reference(line)) != comparable(parser.parseline(line)):
+                print "results differ for line: " + line
+                break
+        original = lines_per_second(reference, lines)
+        fast = lines_per_second(parser.parseline, lines)
+        headers = lines_per_second(parser.parseheader, lines)
+        arrays = lines_per_second(XIOLineParser(parsing_fn=ARRAY_PARSING_FN)
+                                  .parseline, lines)
+        print "{} ({} lines)".format(path, len(lines))
+        print "  xio_parseline:             {:10.0f} lines/s".format(original)
+        print "  XIOLineParser.parseline:   {:10.0f} lines/s ({:.1f}x)"\
+              .format(fast, fast / original)
+        print "  ... with MF arrays:        {:10.0f} lines/s ({:.1f}x)"\
+              .format(arrays, arrays / original)
+        print "  XIOLineParser.parseheader: {:10.0f} lines/s ({:.1f}x)"\
+              .format(headers, headers / original)
@@ -8,5 +8,6 @@ python unittest_InstantIO.py -v > /dev/null
 python unittest_analysis.py -v > /dev/null
 python unittest_corpus.py -v > /dev/null
 python unittest_increco.py -v > /dev/null
+python unittest_gzipio.py -v > /dev/null
 
 
@@ -17,9 +17,12 @@ __status__ = "Development" # Development/Production/Prototype
 
 ####################################################################
 
-import unittest
+import unittest, math, pickle
+import numpy as np
 from mumodo.InstantIO import sfbool, SFVec3f, SFVec2f, SFRotation, MFVec2f, \
-                             MFVec3f, MFRotation, MFString, MFFloat
+                             MFVec3f, MFRotation, MFString, MFFloat, \
+                             mfvec3f_array, mfvec2f_array, mfrotation_array, \
+                             mf_batch, mf_unbatch
 
 class instant_testing(unittest.TestCase):
 
@@ -61,6 +64,19 @@ class instant_testing(unittest.TestCase):
                              '3.4 5.6 2.3 8.9')
         self.failUnlessEqual(list(SFRotation(1, 4, 3, 6)),
                              [1.0, 4.0, 3.0, 6.0])
+        #the Euler angles follow changes of the quaternion
+        rotation = SFRotation('0 0 0 1')
+        self.failUnlessEqual(rotation.heading, 0.0)
+        rotation.qx = 1
+        self.failUnlessEqual(rotation.bank, math.pi / 2)
+        self.failUnlessEqual(rotation.heading, 0.0)
+        self.failUnlessEqual(rotation.attitude, 0.0)
+        #objects pickled before the Euler angles were cached still load
+        rotation = SFRotation('0 0 0 1')
+        del rotation.__dict__['_SFRotation__euler']
+        rotation = pickle.loads(pickle.dumps(rotation))
+        self.failUnlessEqual(rotation.bank, 0.0)
+        self.failUnlessEqual(rotation.heading, 0.0)
 
     def test_MFVec3f(self):
         self.failUnlessEqual(str(type(MFVec3f("[2.0 4.0 6.0,"
@@ -161,5 +177,43 @@ class instant_testing(unittest.TestCase):
         self.assertTrue(sfbool("truE"))
         self.assertFalse(sfbool("yes"))
 
+    def test_mf_arrays(self):
+        for string in ["[2.0 4.0 6.0, 3.0 5.0 7.0]", "[a 4.0 6.0, 3.0 b 5.0]",
+                       "[1 2 3, 4 5, 6 7 8 9]", "[1 2 3,4 5 6]", "[]", "",
+                       "[1  2 3, inf 1e3 -.5]", "[0x1 2 3, 1 2 3f]"]:
+            self.failUnlessEqual(mfvec3f_array(string).tolist(),
+                                 MFVec3f(string).toarray().tolist())
+        self.failUnlessEqual(mfvec3f_array("[2.0 4.0 6.0, 3.0 5.0]").tolist(),
+                             [[2.0, 4.0, 6.0], [-1.0, -1.0, -1.0]])
+        self.failUnlessEqual(mfvec3f_array("[]").shape, (0, 3))
+        self.failUnlessEqual(mfvec2f_array("[2.0 4.0, 3.0 b]").tolist(),
+                             [[2.0, 4.0], [-1.0, -1.0]])
+        self.failUnlessEqual(mfrotation_array("[1 2 3 4, 5 6 7 8]")[1].tolist(),
+                             [5.0, 6.0, 7.0, 8.0])
+        self.failUnlessEqual(mfvec3f_array("[1 2 3]", np.float32).dtype,
+                             np.float32)
+        batch = mf_batch(["[1 2 3, 4 5 6]", None, MFVec3f("[7 8 9]"), "[]"], 3)
+        self.failUnlessEqual(batch.shape, (4, 2, 3))
+        self.failUnlessEqual(batch[0].tolist(), [[1, 2, 3], [4, 5, 6]])
+        self.failUnlessEqual(batch[2, 0].tolist(), [7, 8, 9])
+        self.assertTrue(np.isnan(batch[2, 1]).all())
+        self.assertTrue(np.isnan(batch[1]).all() and np.isnan(batch[3]).all())
+        self.failUnlessEqual(mf_batch([], 3).shape, (0, 0, 3))
+        values = mf_unbatch(mf_batch(["[0.1 2 3, 4 5 6]", "[]", "[7 8 9]"],
+                                     3, np.float32))
+        self.failUnlessEqual(str(values[0]), "[0.1 2.0 3.0, 4.0 5.0 6.0]")
+        self.assertTrue(np.isnan(values[1]))
+        self.failUnlessEqual(str(values[2]), "[7.0 8.0 9.0]")
+        rotations = mf_unbatch(mf_batch(["[1 2 3 4]"], 4))
+        self.assertTrue(isinstance(rotations[0], MFRotation))
+        #items that are all NaN keep their positions, unless at the end
+        batch = np.array([[[0, 0, 0], [np.nan] * 3, [2, 2, 2], [np.nan] * 3]])
+        values = mf_unbatch(batch)
+        self.failUnlessEqual(len(values[0]), 3)
+        self.failUnlessEqual(str(values[0][2]), '2.0 2.0 2.0')
+        self.assertTrue(np.isnan(mf_batch(values, 3)[0, 1]).all())
+        self.failUnlessEqual(mf_batch(values, 3)[0, 2].tolist(), [2, 2, 2])
+        self.failUnlessEqual(mf_unbatch(np.zeros((2, 0, 3))), [np.nan] * 2)
+
 if __name__ == "__main__":
     unittest.main()
@@ -15,6 +15,7 @@ Write a mumodo to a file
 
 import unittest, os
 import mumodo.corpus as cp
+from mumodo.mumodoIO import open_streamframe_from_xiofile
 
 class MumodoTest(unittest.TestCase):
 
@@ -221,6 +222,32 @@ class MumodoTest(unittest.TestCase):
                          self.PickledStreamResource.get_streamframe()\
                           ['JointPositions3'].map(lambda x: str(x))).all())
 
+    def test_shared_xio_resources(self):
+        shared = cp.Mumodo(name='shared', localpath='data')
+        kinect2 = cp.XIOStreamResource(name='kinect2',
+                                       filename='fseeksmaller.xio.gz',
+                                       sensorname='lab-labtop/irioKinect 2',
+                                       kwargs={'end_time': 13})
+        kinect = cp.XIOStreamResource(name='kinect',
+                                      filename='fseeksmaller.xio.gz',
+                                      sensorname='lab-labtop/irioKinect',
+                                      kwargs={'end_time': 13,
+                                              'timestamp_offset': 10})
+        shared.add_resource(kinect2)
+        shared.add_resource(kinect)
+        #accessing one resource loads both of them
+        kinect2.get_streamframe()
+        self.assertIsNotNone(kinect.__cached_object__)
+        self.assertTrue(kinect.get_streamframe().equals(\
+                        open_streamframe_from_xiofile('data/fseeksmaller.xio.gz',
+                                                      'lab-labtop/irioKinect',
+                                                      end_time=13,
+                                                      timestamp_offset=10)))
+        self.assertTrue(kinect2.get_streamframe().equals(\
+                        open_streamframe_from_xiofile('data/fseeksmaller.xio.gz',
+                                                     'lab-labtop/irioKinect 2',
+                                                      end_time=13)))
+
     def test_tier_resources(self):
         #check additional attributes
         self.assertEqual(self.IntervalResource.get_tiername(), 'S')
@@ -0,0 +1,181 @@
+import unittest, gzip, os, random, zlib
+from mumodo.gzipio import GzipCheckpointReader, BlockedGzipWriter, \
+                          ReadAheadReader, TailReader, gzip_block_index, \
+                          read_gzip_block
+
+class GzipIOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = gzip.open('data/linestest.xio.gz').read()
+        #small intervals and chunks, so that many checkpoints are created
+        self.r = GzipCheckpointReader('data/linestest.xio.gz', interval=4096,
+                                      chunksize=512)
+        #A file consisting of two gzip members
+        with open('data/twomembers.xio.gz', 'wb') as f:
+            f.write(open('data/linestest.xio.gz', 'rb').read())
+            f.write(open('data/types.xio.gz', 'rb').read())
+        self.m = GzipCheckpointReader('data/twomembers.xio.gz', interval=4096,
+                                      chunksize=512)
+        #A truncated, a corrupted and a padded copy
+        raw = open('data/linestest.xio.gz', 'rb').read()
+        with open('data/truncated.xio.gz', 'wb') as f:
+            f.write(raw[:len(raw) / 2])
+        with open('data/corrupted.xio.gz', 'wb') as f:
+            f.write(raw[:3000] + 'x' * 40 + raw[3040:])
+        with open('data/padded.xio.gz', 'wb') as f:
+            f.write(raw + '\0' * 100)
+
+    def test_sequential_reading(self):
+        self.failUnlessEqual(self.r.read(), self.data)
+        self.failUnlessEqual(self.r.read(), '')
+        self.r.seek(0)
+        self.failUnlessEqual(list(self.r), self.data.splitlines(True))
+        self.failUnlessEqual(self.r.tell(), len(self.data))
+        self.assertTrue(len(self.r.checkpoints) > 5)
+
+    def test_random_seeking(self):
+        self.r.read()
+        random.seed(7)
+        for offset in [random.randint(0, len(self.data)) for _ in range(50)]:
+            self.failUnlessEqual(self.r.seek(offset), offset)
+            self.failUnlessEqual(self.r.read(100),
+                                 self.data[offset:offset + 100])
+        self.r.seek(116)
+        self.failUnlessEqual(self.r.readline(), '<sfint32 value="0" timestamp'
+                             '="1" sensorName="linetest/linenumber"/>\n')
+        self.r.seek(10, 1)
+        self.failUnlessEqual(self.r.tell(), 116 + 68 + 10)
+        self.r.seek(len(self.data) + 10)
+        self.failUnlessEqual(self.r.readline(), '')
+
+    def test_multiple_members(self):
+        other = gzip.open('data/types.xio.gz').read()
+        self.failUnlessEqual(self.m.read(), self.data + other)
+        self.m.seek(len(self.data) - 20)
+        self.failUnlessEqual(self.m.read(40),
+                             (self.data + other)[len(self.data) - 20:
+                                                 len(self.data) + 20])
+
+    def test_blocked_gzip(self):
+        for threads in [1, 3]:
+            w = BlockedGzipWriter('data/blocked.xio.gz', blocksize=1000,
+                                  threads=threads)
+            for line in self.data.splitlines(True):
+                w.write(line)
+            w.close()
+            self.failUnlessEqual(gzip.open('data/blocked.xio.gz').read(),
+                                 self.data)
+            blocks = gzip_block_index('data/blocked.xio.gz')
+            self.assertTrue(len(blocks) > len(self.data) / 1000)
+            self.failUnlessEqual(blocks[-1][2] + blocks[-1][3], len(self.data))
+            for rawoffset, rawsize, offset, size in blocks:
+                block = read_gzip_block('data/blocked.xio.gz', rawoffset,
+                                        rawsize)
+                self.failUnlessEqual(block, self.data[offset:offset + size])
+                #only the last line has no newline
+                self.assertTrue(block.endswith('\n') or
+                                offset + size == len(self.data))
+        self.failUnlessEqual(gzip_block_index('data/linestest.xio.gz'), None)
+        b = GzipCheckpointReader('data/blocked.xio.gz', blocks=blocks)
+        self.failUnlessEqual(len(b.checkpoints), len(blocks))
+        for offset in [5000, 100, len(self.data) - 50, 999, 1000]:
+            b.seek(offset)
+            self.failUnlessEqual(b.read(60), self.data[offset:offset + 60])
+        b.close()
+
+    def test_read_ahead(self):
+        for path, data in [('data/linestest.xio.gz', self.data),
+                           ('data/twomembers.xio.gz', self.m.read()),
+                           ('data/types.xio', open('data/types.xio').read())]:
+            reader = ReadAheadReader(path, chunksize=100, queuesize=2)
+            self.failUnlessEqual(list(reader), data.splitlines(True))
+            reader.close()
+        #stop reading half way
+        reader = ReadAheadReader('data/linestest.xio.gz', chunksize=100,
+                                 queuesize=2)
+        for i, line in enumerate(reader):
+            if i == 10:
+                break
+        reader.close()
+        self.assertFalse(reader.thread.is_alive())
+        #damaged files raise an error, but padding after the end is ignored
+        for path in ['data/truncated.xio.gz', 'data/corrupted.xio.gz']:
+            reader = ReadAheadReader(path, chunksize=100)
+            self.assertRaises(IOError, list, reader)
+        reader = ReadAheadReader('data/padded.xio.gz', chunksize=100)
+        self.failUnlessEqual(list(reader), self.data.splitlines(True))
+
+    def test_tail_reader(self):
+        #a gzip file that is being written, flushed after each part
+        growing = open('data/growing.xio.gz', 'wb')
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        tail = TailReader('data/growing.xio.gz', chunksize=100)
+        self.failUnlessEqual(tail.readlines(), [])
+        lines = []
+        for part in [self.data[:1000], self.data[1000:1010],
+                     self.data[1010:5000], self.data[5000:]]:
+            growing.write(compressor.compress(part) +
+                          compressor.flush(zlib.Z_SYNC_FLUSH))
+            growing.flush()
+            offset = tail.offset
+            new = tail.readlines()
+            #only complete lines are returned
+            self.failUnlessEqual(''.join(new),
+                                 self.data[offset:self.data.rfind('\n', 0,
+                                           self.data.find(part) + len(part))
+                                           + 1])
+            lines += new
+        growing.write(compressor.flush())
+        growing.close()
+        #the last line has no newline
+        self.failUnlessEqual(''.join(lines) + tail.rest, self.data)
+        tail.close()
+        #a growing file is also readable with a GzipCheckpointReader
+        growing = open('data/growing.xio.gz', 'rb').read()
+        open('data/growing.xio.gz', 'wb').write(growing[:3000])
+        reader = GzipCheckpointReader('data/growing.xio.gz', follow=True)
+        start = reader.read()
+        open('data/growing.xio.gz', 'ab').write(growing[3000:])
+        self.failUnlessEqual(start + reader.read(), self.data)
+        reader.close()
+        #unless it is followed, a file must not end within a member
+        open('data/growing.xio.gz', 'wb').write(growing[:3000])
+        reader = GzipCheckpointReader('data/growing.xio.gz')
+        self.assertRaises(IOError, reader.read)
+        reader.close()
+
+    def test_damaged_files(self):
+        for path in ['data/truncated.xio.gz', 'data/corrupted.xio.gz']:
+            reader = GzipCheckpointReader(path, interval=4096, chunksize=512)
+            self.assertRaises(IOError, reader.read)
+            reader.close()
+        reader = GzipCheckpointReader('data/padded.xio.gz', interval=4096,
+                                      chunksize=512)
+        self.failUnlessEqual(reader.read(), self.data)
+        reader.close()
+        #a file that is still being written: corrupted data raises, a
+        #truncated member may still grow, and trailing garbage is dropped
+        reader = TailReader('data/corrupted.xio.gz', chunksize=512)
+        self.assertRaises(IOError, reader.readlines)
+        reader.close()
+        reader = TailReader('data/truncated.xio.gz', chunksize=512)
+        lines = reader.readlines()
+        self.assertTrue(0 < len(lines) < len(self.data.splitlines()))
+        reader.close()
+        reader = TailReader('data/padded.xio.gz', chunksize=512)
+        self.failUnlessEqual(''.join(reader.readlines()), self.data[
+            :self.data.rfind('\n') + 1])
+        self.failUnlessEqual(reader.readlines(), [])
+        reader.close()
+
+    def tearDown(self):
+        os.system('rm -f data/growing.xio.gz')
+        self.r.close()
+        self.m.close()
+        os.system('rm data/twomembers.xio.gz')
+        os.system('rm -f data/blocked.xio.gz')
+        os.system('rm -f data/truncated.xio.gz data/corrupted.xio.gz '
+                  'data/padded.xio.gz')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,23 @@
 import unittest
-import tgt, os
+import tgt, os, gzip
+import numpy as np
+import pandas as pd
 from mumodo.mumodoIO import quantize, open_streamframe_from_xiofile, \
+                            open_streamframes_from_xiofile, \
+                            open_streamframe_chunks_from_xiofile, \
+                            StreamFrameFollower, \
                             save_streamframe_to_xiofile, quantize, \
                             open_intervalframe_from_textgrid, \
                             save_intervalframe_to_textgrid, \
                             convert_pointtier_to_streamframe, \
                             convert_streamframe_to_pointtier, \
-                            open_intervalframe_from_increco
+                            open_intervalframe_from_increco, \
+                            decode_streamframe, quantize_arrays, \
+                            mf_column_array, expand_mf_columns, \
+                            collapse_mf_columns
 
-from mumodo.xiofile import XIOFile
+from mumodo.xiofile import XIOFile, LazyValue
+from mumodo.InstantIO import MFVec2f
 
 class MumodoTest(unittest.TestCase):
 
@@ -108,6 +117,177 @@ class MumodoTest(unittest.TestCase):
         self.failUnlessEqual(len(self.rsn), 0)
 
 
+    def test_streams_from_xio(self):
+        streams = open_streamframes_from_xiofile('data/fseeksmaller.xio.gz',
+                                         {"lab-labtop/irioKinect 2": {},
+                                          "lab-labtop/irioKinect": \
+                                          {'timestamp_offset': 10},
+                                          "wrong/sensor/name": None},
+                                         end_time=13,
+                                         timestamp_offset='raw')
+        self.assertTrue(streams["lab-labtop/irioKinect 2"].equals(self.fraw))
+        self.assertTrue(streams["lab-labtop/irioKinect"].equals(self.f2))
+        self.failUnlessEqual(len(streams["wrong/sensor/name"]), 0)
+
+    def test_stream_from_indexed_xio(self):
+        #the sidecar index is used to skip the lines of other sensors
+        os.system('cp data/fseeksmaller.xio.gz data/indexed.xio.gz')
+        XIOFile('data/indexed.xio.gz', indexing=True, writeindex=True)
+        stream = open_streamframe_from_xiofile('data/indexed.xio.gz',
+                                               "lab-labtop/irioKinect 2",
+                                               window_size=5, with_fields=[],
+                                               without_fields=[],
+                                               discard_duplicates=True,
+                                               start_time=0, end_time=13,
+                                               relative=True,
+                                               timestamp_offset=10)
+        self.assertTrue(stream.equals(self.f))
+        streams = open_streamframes_from_xiofile('data/indexed.xio.gz',
+                                         {"lab-labtop/irioKinect 2": {},
+                                          "lab-labtop/irioKinect": \
+                                          {'timestamp_offset': 10}},
+                                         end_time=13,
+                                         timestamp_offset='raw')
+        self.assertTrue(streams["lab-labtop/irioKinect 2"].equals(self.fraw))
+        self.assertTrue(streams["lab-labtop/irioKinect"].equals(self.f2))
+        #plain gzip files are read ahead instead, and a stale index is
+        #not rebuilt by an import
+        self.assertFalse(XIOFile('data/indexed.xio.gz').xio_canseek())
+        index = open('data/indexed.xio.gz.idx', 'rb').read()
+        os.utime('data/indexed.xio.gz', (0, 0))
+        stream = open_streamframe_from_xiofile('data/indexed.xio.gz',
+                                               "lab-labtop/irioKinect",
+                                               window_size=5, with_fields=[],
+                                               without_fields=[],
+                                               discard_duplicates=True,
+                                               start_time=0, end_time=13,
+                                               relative=True,
+                                               timestamp_offset=10)
+        self.assertTrue(stream.equals(self.f2))
+        self.failUnlessEqual(open('data/indexed.xio.gz.idx', 'rb').read(),
+                             index)
+        #uncompressed files are entered at the indexed blocks
+        os.system('gunzip -c data/fseeksmaller.xio.gz > data/indexed.xio')
+        XIOFile('data/indexed.xio', indexing=True, writeindex=True)
+        self.assertTrue(XIOFile('data/indexed.xio').xio_canseek())
+        stream = open_streamframe_from_xiofile('data/indexed.xio',
+                                               "lab-labtop/irioKinect 2",
+                                               window_size=5, with_fields=[],
+                                               without_fields=[],
+                                               discard_duplicates=True,
+                                               start_time=0, end_time=13,
+                                               relative=True,
+                                               timestamp_offset=10)
+        self.assertTrue(stream.equals(self.f))
+
+    def test_stream_from_xio_parts(self):
+        #a recording rotated into two files reads like the whole file
+        lines = gzip.open('data/fseeksmaller.xio.gz').readlines()
+        parts = ['data/parts0.xio.gz', 'data/parts1.xio.gz']
+        for path, body in zip(parts, [lines[2:60], lines[60:-1]]):
+            w = XIOFile(path, 'w')
+            for line in body:
+                w.xio_writeline(line)
+            w.xiofile_close()
+        stream = open_streamframe_from_xiofile(parts,
+                                               "lab-labtop/irioKinect",
+                                               window_size=5, with_fields=[],
+                                               without_fields=[],
+                                               discard_duplicates=True,
+                                               start_time=0, end_time=13,
+                                               relative=True,
+                                               timestamp_offset=10)
+        self.assertTrue(stream.equals(self.f2))
+
+    def test_stream_chunks_from_xio(self):
+        #the chunks concatenate to the whole StreamFrame
+        whole = open_streamframe_from_xiofile('data/linestest.xio.gz',
+                                              'linetest', window_size=20)
+        chunks = list(open_streamframe_chunks_from_xiofile(
+            'data/linestest.xio.gz', 'linetest', chunk_rows=100,
+            window_size=20, batchsize=64))
+        self.failUnlessEqual([len(x) for x in chunks], [100, 100, 100, 34])
+        self.assertTrue(pd.concat(chunks).equals(whole))
+        chunks = list(open_streamframe_chunks_from_xiofile(
+            'data/linestest.xio.gz', 'linetest', chunk_duration=1000,
+            window_size=20, batchsize=64))
+        self.failUnlessEqual(len(chunks), 10)
+        self.assertTrue((chunks[1].index // 1000 == 1).all())
+        self.assertTrue(pd.concat(chunks).equals(whole))
+        for fill in ['hold', 'nearest']:
+            whole = open_streamframe_from_xiofile('data/fseeksmaller.xio.gz',
+                                                  "lab-labtop/irioKinect 2",
+                                                  grid_rate=1000,
+                                                  grid_fill=fill)
+            chunks = open_streamframe_chunks_from_xiofile(
+                'data/fseeksmaller.xio.gz', "lab-labtop/irioKinect 2",
+                chunk_rows=3, grid_rate=1000, grid_fill=fill, batchsize=10)
+            self.assertTrue(pd.concat(list(chunks)).applymap(str).equals(
+                whole.applymap(str)))
+        #the index is only saved if asked for
+        self.assertFalse(os.path.isfile('data/fseeksmaller.xio.gz.idx'))
+        #the same dtypes as the whole StreamFrame, also for int and bool
+        #fields with missing values in some chunks only
+        w = XIOFile('data/gaps.xio.gz', 'w')
+        for i in range(100):
+            w.xio_writeline(w.xio_formatline('sffloat', i / 2.0, 's', 'x',
+                                             10 * i + 1))
+            if i < 80:
+                w.xio_writeline(w.xio_formatline('sfint32', i, 's', 'n',
+                                                 10 * i + 1))
+        w.xiofile_close()
+        tests = [('data/gaps.xio.gz', 's', 30)] + \
+                [('data/fseeksmaller.xio.gz', x, 5) for x in
+                 XIOFile('data/fseeksmaller.xio.gz', indexing=True).fieldnames
+                 if x.startswith('lab-labtop/')]
+        for path, sensorname, rows in tests:
+            chunks = list(open_streamframe_chunks_from_xiofile(
+                path, sensorname, chunk_rows=rows, batchsize=16,
+                writeindex=True))
+            whole = open_streamframe_from_xiofile(path, sensorname)
+            self.failUnlessEqual(pd.concat(chunks).dtypes.to_dict(),
+                                 whole.dtypes.to_dict())
+            self.assertTrue(pd.concat(chunks).applymap(str).equals(
+                whole.applymap(str)))
+        self.assertTrue(os.path.isfile('data/fseeksmaller.xio.gz.idx'))
+
+    def test_lazy_stream_from_xio(self):
+        kwargs = {'sensorname': 'VeniceHubReplay/Kinect/Face',
+                  'end_time': 2000}
+        stream = open_streamframe_from_xiofile('../sampledata/test.xio.gz',
+                                               lazy=True, **kwargs)
+        expected = open_streamframe_from_xiofile('../sampledata/test.xio.gz',
+                                                 **kwargs)
+        self.failUnlessEqual(stream.index.tolist(), expected.index.tolist())
+        self.failUnlessEqual(type(stream['FaceNose'].iloc[0]), LazyValue)
+        decoded = decode_streamframe(stream)
+        self.failUnlessEqual(type(decoded['FaceNose'].iloc[0]), MFVec2f)
+        self.failUnlessEqual(decoded.applymap(str).values.tolist(),
+                             expected.applymap(str).values.tolist())
+        #only a slice, or only some columns
+        decoded = decode_streamframe(stream.ix[1000:2000], ['FaceNose'])
+        self.failUnlessEqual(decoded.index.tolist(),
+                             expected.ix[1000:2000].index.tolist())
+        self.failUnlessEqual(type(decoded['FaceNose'].iloc[0]), MFVec2f)
+        self.failUnlessEqual(type(decoded['FaceEyeLeft'].iloc[0]), LazyValue)
+
+    def test_follow_xio(self):
+        lines = gzip.open('data/fseeksmaller.xio.gz').readlines()
+        live = open('data/live.xio', 'w')
+        live.writelines(lines[:40])
+        live.write(lines[40][:30])
+        live.flush()
+        follower = StreamFrameFollower('data/live.xio', 'lab-labtop/irioKinect')
+        first = follower.refresh()
+        live.write(lines[40][30:])
+        live.writelines(lines[41:])
+        live.close()
+        self.assertTrue(len(follower.refresh()) > len(first))
+        self.assertTrue(follower.refresh().equals(
+            open_streamframe_from_xiofile('data/fseeksmaller.xio.gz',
+                                          'lab-labtop/irioKinect')))
+        follower.close()
+
     def test_stream_to_xio(self):
         self.failUnlessEqual(self.outtake_from_xio.xio_getline(5),
                              '<sffloat value="-0.7323895" timestamp="10"'
@@ -126,6 +306,34 @@ class MumodoTest(unittest.TestCase):
                              ' sensorName="lab-labtop/irioKinect 2/so'
                              'undAngle"/>\n')
 
+    def test_typed_stream_to_xio(self):
+        #columns keep their XIO types, and the sensors merge in time order
+        first = pd.DataFrame({'count': [1, 2], 'ok': [True, False],
+                              'name': ['a', np.nan],
+                              'box': [MFVec2f("[1 2]"), np.nan],
+                              'time': [5, 20]},
+                             columns=['time', 'count', 'ok', 'name', 'box'],
+                             index=[5, 20])
+        second = pd.DataFrame({'angle': [0.5, np.nan, 0.25]},
+                              index=[20, 10, 5])
+        save_streamframe_to_xiofile({'one': first, 'two': second},
+                                    'data/sf_to_xio3.xio.gz', chunksize=1)
+        lines = XIOFile('data/sf_to_xio3.xio.gz', indexing=True)
+        names = [lines.xio_getline(i).split('sensorName="')[1][:-4]
+                 for i in range(8)]
+        self.failUnlessEqual(names, ['one/count', 'one/ok', 'one/name',
+                                     'one/box', 'two/angle', 'one/count',
+                                     'one/ok', 'two/angle'])
+        self.failUnlessEqual(lines.xio_getline(0),
+                             '<sfint32 value="1" timestamp="5"'
+                             ' sensorName="one/count"/>\n')
+        self.failUnlessEqual(lines.xio_getline(6),
+                             '<sfbool value="False" timestamp="20"'
+                             ' sensorName="one/ok"/>\n')
+        self.failUnlessEqual(lines.xio_getline(3),
+                             '<mfvec2f value="[1.0 2.0]" timestamp="5"'
+                             ' sensorName="one/box"/>\n')
+
     def test_interval_from_textgrid(self):
         self.failUnlessEqual(self.if_from_tg_tier.ix[100]['end_time'], 1095.864)
 
@@ -135,6 +343,131 @@ class MumodoTest(unittest.TestCase):
 
     def test_quantize(self):
         self.failUnlessEqual(self.q, -0.7323895)
+        #compact records give the same frames
+        infile = XIOFile('data/fseeksmaller.xio.gz')
+        for sensorname in ["lab-labtop/irioKinect 2", "lab-labtop/irioKinect"]:
+            rows = list(infile.xio_quicklinegen(0, 0))
+            records = list(infile.xio_quicklinegen(0, 0, records=True))
+            self.failUnlessEqual(list(quantize(records, sensorname,
+                                               enumerate_fields=True)),
+                                 list(quantize(rows, sensorname,
+                                               enumerate_fields=True)))
+
+    def test_quantize_arrays(self):
+        #the same frames as quantize, also for timestamps out of order
+        times = [3, 1, 5, 4, 9, 20, 12, 24, 26]
+        codes = [0, 1, 1, 0, -1, 0, 1, 1, 0]
+        values = [1.5, 1, 2, 2.5, 0, 3.5, 3, 4, 4.5]
+        for discard in [True, False]:
+            frame = quantize_arrays(times, codes, values, ['a', 'b'], 5,
+                                    discard)
+            rows = [{'sensorname': 's', 'fieldname': 'ab'[code],
+                     'time': time, 'value': value} for time, code, value
+                    in zip(times, codes, values) if code >= 0]
+            frames = list(quantize(rows, 's', 5, discard_duplicates=discard))
+            expected = pd.DataFrame(frames)
+            self.failUnlessEqual(frame.fillna(-1).values.tolist(),
+                                 expected.fillna(-1).values.tolist())
+        #the ignored event (code -1) does not open a window
+        self.failUnlessEqual(frame['time'].tolist(), [3, 20, 26])
+        self.failUnlessEqual(frame['b'].tolist()[:2], [2, 4])
+        #typed columns
+        self.failUnlessEqual(frame['a'].dtype, np.float64)
+        self.failUnlessEqual(frame['b'].dtype, object)
+        self.failUnlessEqual(frame['time'].dtype, np.int64)
+        frame = quantize_arrays([1, 2, 8], [0, 0, 0], [True, False, True],
+                                ['c', 'd'])
+        self.failUnlessEqual(frame['c'].dtype, bool)
+        self.failUnlessEqual(len(frame['d'].dropna()), 0)
+        #the same dtypes from the kinds of the fields, without looking
+        #at the values
+        for kinds in [None, [bool, None]]:
+            frame = quantize_arrays([1, 2, 8], [0, 0, 0], [True, False, True],
+                                    ['c', 'd'], kinds=kinds)
+            self.failUnlessEqual(frame['c'].dtype, bool)
+            self.failUnlessEqual(frame['d'].dtype, np.float64)
+        frame = quantize_arrays([1, 8, 9], [0, 0, 1], [1, 2, 3], ['e', 'f'],
+                                kinds=[int, int])
+        self.failUnlessEqual(frame['e'].dtype, np.int64)
+        self.failUnlessEqual(frame['f'].dtype, object)
+        self.failUnlessEqual(frame['f'].fillna(-1).tolist(), [-1, 3])
+        #the same StreamFrame as quantizing frame by frame
+        self.failUnlessEqual(self.f['soundAngle'].dtype, np.float64)
+        follower = StreamFrameFollower('data/fseeksmaller.xio.gz',
+                                       "lab-labtop/irioKinect 2",
+                                       timestamp_offset=10)
+        self.assertTrue(follower.refresh().equals(
+            open_streamframe_from_xiofile('data/fseeksmaller.xio.gz',
+                                          "lab-labtop/irioKinect 2",
+                                          timestamp_offset=10)))
+        follower.close()
+
+    def test_quantize_grid(self):
+        times = [5, 40, 41, 100]
+        codes = [0, 1, 0, 0]
+        values = [1.0, 'x', 2.0, 3.0]
+        held = quantize_arrays(times, codes, values, ['a', 'b'],
+                               grid_rate=30)
+        self.failUnlessEqual(held['time'].tolist(), [33, 67, 100])
+        self.failUnlessEqual(held['a'].tolist(), [1.0, 2.0, 3.0])
+        self.failUnlessEqual(held['b'].tolist()[1:], ['x', 'x'])
+        nearest = quantize_arrays(times, codes, values, ['a', 'b'],
+                                  grid_rate=30, grid_fill='nearest')
+        self.failUnlessEqual(nearest['a'].tolist(), [2.0, 2.0, 3.0])
+        self.failUnlessEqual(nearest['b'].tolist(), ['x', 'x', 'x'])
+        #the StreamFrames of different sensors share their index
+        streams = [open_streamframe_from_xiofile('data/fseeksmaller.xio.gz',
+                                                 sensorname, grid_rate=50,
+                                                 grid_origin=10,
+                                                 timestamp_offset=10)
+                   for sensorname in ["lab-labtop/irioKinect 2",
+                                      "lab-labtop/irioKinect"]]
+        for stream in streams:
+            self.assertTrue(((stream.index - 10) % 20 == 0).all())
+            self.assertTrue((stream.index[1:] - stream.index[:-1] == 20).all())
+        self.failUnlessEqual(streams[0].ix[10]['soundAngle'],
+                             self.f.ix[10]['soundAngle'])
+        both = open_streamframes_from_xiofile('data/fseeksmaller.xio.gz',
+                                              ["lab-labtop/irioKinect 2",
+                                               "lab-labtop/irioKinect"],
+                                              grid_rate=50, grid_origin=10,
+                                              timestamp_offset=10)
+        self.assertTrue(both["lab-labtop/irioKinect 2"].equals(streams[0]))
+        self.assertTrue(both["lab-labtop/irioKinect"].equals(streams[1]))
+
+    def test_expand_mf_columns(self):
+        stream = pd.DataFrame({'time': [1, 2, 3],
+                               'box': [MFVec2f("[1 2, 3 4]"), MFVec2f("[]"),
+                                       MFVec2f("[5 6]")],
+                               'name': ['a', 'b', 'c']},
+                              columns=['time', 'box', 'name'],
+                              index=[10, 20, 30])
+        array = mf_column_array(stream, 'box')
+        self.failUnlessEqual(array.shape, (3, 2, 2))
+        self.failUnlessEqual(array.dtype, np.float32)
+        self.assertTrue(np.isnan(array[1]).all() and np.isnan(array[2, 1]).all())
+        expanded = expand_mf_columns(stream)
+        self.failUnlessEqual(list(expanded.columns),
+                             ['time', 'box_0_x', 'box_0_y', 'box_1_x',
+                              'box_1_y', 'name'])
+        self.failUnlessEqual(expanded['box_1_y'].ix[10], 4)
+        collapsed = collapse_mf_columns(expanded)
+        self.failUnlessEqual(list(collapsed.columns), ['time', 'box', 'name'])
+        self.failUnlessEqual(str(collapsed['box'].ix[10]), '[1.0 2.0, 3.0 4.0]')
+        self.failUnlessEqual(str(collapsed['box'].ix[30]), '[5.0 6.0]')
+        self.assertTrue(np.isnan(collapsed['box'].ix[20]))
+        #importing with expand_mf gives the same columns
+        faces = open_streamframe_from_xiofile('../sampledata/test.xio.gz',
+                                              'VeniceHubReplay/Kinect/Face',
+                                              end_time=1000)
+        expanded = open_streamframe_from_xiofile('../sampledata/test.xio.gz',
+                                                 'VeniceHubReplay/Kinect/Face',
+                                                 end_time=1000,
+                                                 expand_mf=True)
+        self.assertTrue(expanded.applymap(str).equals(
+            expand_mf_columns(faces).applymap(str)))
+        self.assertTrue(collapse_mf_columns(expanded).applymap(str).equals(
+            faces.applymap(str)))
 
     def test_pointtier_to_stream(self):
         self.failUnlessEqual(str(self.cv['mark'].values[1]), 'B')
@@ -156,8 +489,16 @@ class MumodoTest(unittest.TestCase):
         self.failUnlessEqual(self.ic2['38.4'].ix[0]['text'], 'ragt')
 
     def tearDown(self):
+        os.system('rm -f data/live.xio')
+        os.system('rm -f data/parts0.xio.gz data/parts1.xio.gz')
+        os.system('rm -f data/indexed.xio.gz data/indexed.xio.gz.idx')
+        os.system('rm -f data/indexed.xio data/indexed.xio.idx')
+        os.system('rm -f data/gaps.xio.gz data/gaps.xio.gz.idx')
+        os.system('rm -f data/linestest.xio.gz.idx')
+        os.system('rm -f data/fseeksmaller.xio.gz.idx')
         os.system('rm data/sf_to_xio.xio.gz')
         os.system('rm data/sf_to_xio2.xio.gz')
+        os.system('rm -f data/sf_to_xio3.xio.gz')
 
 if __name__ == "__main__":
     unittest.main()
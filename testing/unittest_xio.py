@@ -1,5 +1,8 @@
-import unittest, math, os
-from mumodo.xiofile import XIOFile, xiofile_quickcopy
+import unittest, math, os, gzip, pickle, time
+from mumodo.xiofile import XIOFile, XIOMultiFile, XIOLineParser, XIORecord, \
+                           LazyValue, SensorFilter, \
+                           xiofile_quickcopy, xiofile_mergegen, \
+                           xiofile_merge, xiofile_split
 
 class XioTest(unittest.TestCase):
 
@@ -182,6 +185,57 @@ class XioTest(unittest.TestCase):
         #Test the mode of writing to a file
         self.failUnlessEqual(XIOFile('data/trywriting.xio.gz', 'w').mode, 'w')
 
+    def test_appending(self):
+        lines = gzip.open('data/linestest.xio.gz').readlines()
+        keys = ['line_offset', 'time_offset', 'block_min_time',
+                'block_max_time', 'block_sensors', 'fieldnames', 'catalog',
+                'min_time', 'max_time', 'max_lines']
+        def check():
+            self.failUnlessEqual(gzip.open('data/appended.xio.gz').read(),
+                                 ''.join(lines))
+            appended = XIOFile('data/appended.xio.gz', indexing=True)
+            for key in keys:
+                self.failUnlessEqual(getattr(appended, key),
+                                     getattr(self.o, key))
+        #write in two sessions, keeping the index up to date
+        w = XIOFile('data/appended.xio.gz', 'w', writeindex=True)
+        w.xio_writelines(lines[2:500])
+        w.xiofile_close()
+        self.failUnlessEqual(XIOFile('data/appended.xio.gz', indexing=True
+                                     ).xio_getline(497), lines[499])
+        w = XIOFile('data/appended.xio.gz', 'a', writeindex=True)
+        self.failUnlessEqual(w.lines, 498)
+        w.xio_writelines(lines[500:-1])
+        w.xiofile_close()
+        check()
+        #a blocked file that was flushed, but not closed
+        w = XIOFile('data/appended.xio.gz', 'w', writeindex=True,
+                    blocksize=4096)
+        records = list(self.o.xio_quicklinegen(0, 0, records=True))
+        w.xio_writerecords(records[:700])
+        w.xio_flush()
+        w = XIOFile('data/appended.xio.gz', 'a', writeindex=True)
+        w.xio_writerecords(records[700:])
+        w.xiofile_close()
+        check()
+        #a file that was not written by XIOFile is rewritten
+        os.system('cp data/linestest.xio.gz data/appended.xio.gz')
+        os.system('rm -f data/appended.xio.gz.idx')
+        w = XIOFile('data/appended.xio.gz', 'a', writeindex=True)
+        self.failUnlessEqual(w.lines, 1000)
+        w.xiofile_close()
+        check()
+        #the index is saved whenever the file is flushed
+        w = XIOFile('data/appended.xio.gz', 'w', writeindex=True,
+                    flush_interval=0.01)
+        w.xio_writelines(lines[2:10])
+        time.sleep(0.02)
+        w.xio_writelines(lines[10:20])
+        flushed = XIOFile('data/appended.xio.gz', indexing=True, follow=True)
+        self.failUnlessEqual(flushed.max_lines, 17)
+        self.failUnlessEqual(flushed.xio_getline(17), lines[19])
+        w.xiofile_close()
+
     def test_copying_an_iofile(self):
         self.failUnlessEqual(self.k.xio_getline(2), '<irio:sfint32 xmlns="" '
              'xmlns:ns3="http://www.techfak.uni-bielefeld.de/ags/wbski/insta'
@@ -370,7 +424,484 @@ class XioTest(unittest.TestCase):
 
         self.failUnlessEqual(self.p.xio_quicksearch(6001), (True, 6001))
 
+    def test_batchsearch(self):
+        searched = [6001, 15, 6005, 9991, 9992, 1]
+        found, times, linenos = self.p.xio_batchsearch(searched)
+        self.failUnlessEqual(found.tolist(),
+                             [True, False, False, True, False, True])
+        self.failUnlessEqual(times.tolist(), [6001, 21, 6011, 9991, -1, 1])
+        self.failUnlessEqual(linenos.tolist(), [600, 2, 601, 999, -1, 0])
+        for timestamp, time in zip(searched, times):
+            if time >= 0:
+                self.failUnlessEqual(self.p.xio_quicksearch(timestamp)[:2],
+                                     (time == timestamp, time))
+        self.failUnlessEqual(self.p.xio_timestamps()[0].tolist(),
+                             [10 * i + 1 for i in range(1000)])
+        found, times, linenos = self.g.xio_batchsearch([0, 1, 2],
+                                                       relative=True)
+        self.failUnlessEqual(times.tolist(), [0, 1, -1])
+        self.failUnlessEqual(linenos.tolist(), [0, 10, -1])
+        self.failUnlessEqual(self.f.xio_parseline_lineno(10)['time'],
+                             self.g.min_time + 1)
+
+    def test_sidecar_index(self):
+        os.system('cp data/linestest.xio.gz data/sidecar.xio.gz')
+        written = XIOFile('data/sidecar.xio.gz', indexing=True,
+                          writeindex=True)
+        self.assertTrue(os.path.isfile('data/sidecar.xio.gz.idx'))
+        loaded = XIOFile('data/sidecar.xio.gz', indexing=True)
+        self.failUnlessEqual(loaded.line_offset, written.line_offset)
+        self.failUnlessEqual(loaded.time_offset, written.time_offset)
+        self.failUnlessEqual(loaded.fieldnames, written.fieldnames)
+        self.failUnlessEqual(loaded.min_time, 1)
+        self.failUnlessEqual(loaded.max_time, written.max_time)
+        self.failUnlessEqual(loaded.max_lines, 999)
+        self.failUnlessEqual(loaded.max_time_upto, written.max_time_upto)
+        self.failUnlessEqual(loaded.min_time_from, written.min_time_from)
+        self.failUnlessEqual(loaded.catalog, written.catalog)
+        self.failUnlessEqual(loaded.xio_getline(899), '<sfint32 value="899" '
+             'timestamp="8991" sensorName="linetest/linenumber"/>\n')
+        #an index built with other parameters is not used
+        self.assertFalse(loaded.xio_loadindex(maxlines=10))
+        #a modified file invalidates the index
+        os.utime('data/sidecar.xio.gz', (0, 0))
+        self.assertFalse(loaded.xio_loadindex())
+
+    def test_sensor_filter(self):
+        fields = SensorFilter('dsglab-desk-3', with_fields=['soundAngle',
+                                                            'framenumber'],
+                              without_fields=['framenumber'])
+        self.failUnlessEqual(list(self.g.xio_quicklinegen(0, 0,
+                                                       sensorfilter=fields)),
+                             [self.f.xio_parseline_lineno(5)])
+        self.failUnlessEqual(list(self.f.xio_linegen_timerange(0, 10,
+                                                       sensorfilter=fields)),
+                             [self.f.xio_parseline_lineno(5)])
+        self.failUnlessEqual(len(list(self.o.xio_linegen_timerange(0, 10000,
+                             sensorfilter=SensorFilter(['linetest', 'x'])))),
+                             1000)
+        self.failUnlessEqual(list(self.g.xio_quicklinegen(0, 0,
+                             sensorfilter=lambda s, f: s == 'other')), [])
+        self.failUnlessEqual(self.f.xio_decodeheader(self.f.xio_parseheader\
+                                 (self.f.xio_getline(5))),
+                             self.f.xio_parseline_lineno(5))
+
+    def test_line_parser(self):
+        for path in ['data/types.xio.gz', 'data/linestest.xio.gz',
+                     'data/parsing5.xio.gz', 'data/fseeksmaller.xio.gz',
+                     'data/unreadable.xio.gz']:
+            parser = XIOLineParser()
+            for line in gzip.open(path):
+                expected = self.f.xio_parseline(line)
+                parsed = parser.parseline(line)
+                self.failUnlessEqual(str(parsed.pop('value')),
+                                     str(expected.pop('value')))
+                self.failUnlessEqual(parsed, expected)
+        self.failUnlessEqual(self.f.parser.fileformat, 'legacy')
+        self.failUnlessEqual(self.o.parser.fileformat, 'venice')
+        #lines with an unusual layout are parsed as before
+        for line in ['<sffloat timestamp="5" sensorName="a/b" value="1.5"/>',
+                     ' <sfint32 value="1" timestamp="2" sensorName="a/b"/>',
+                     '<irio:sfint32 value="7" sensorName="x" timestamp="4"',
+                     '<foo value="1" timestamp="2" sensorName="a/b"/>',
+                     '<sfint32 value="1" sensorName="a/b"/>']:
+            self.failUnlessEqual(self.o.parser.parseline(line),
+                                 self.o.xio_parseline(line))
+
+    def test_mf_arrays(self):
+        a = XIOFile('data/types.xio.gz', indexing=True, mfarrays=True)
+        for line in gzip.open('data/types.xio.gz'):
+            parsed = a.parser.parseline(line)
+            expected = self.f.xio_parseline(line)
+            if expected['valuetype'].lower() in ['mfvec2f', 'mfvec3f', 'mfrotation']:
+                self.failUnlessEqual(parsed['value'].tolist(),
+                                     expected['value'].toarray().tolist())
+            else:
+                self.failUnlessEqual(str(parsed['value']),
+                                     str(expected['value']))
+        positions = list(a.xio_quicklinegen(0, 1, sensorfilter=SensorFilter(
+                             ['dsglab-desk-3'], ['jointPositions3D0'])))
+        self.failUnlessEqual(positions[0]['value'].shape, (20, 3))
+
+    def test_checkpointed_reading(self):
+        c = XIOFile('data/linestest.xio.gz', indexing=True,
+                    checkpoint_interval=4096)
+        self.failUnlessEqual(c.line_offset, self.o.line_offset)
+        self.failUnlessEqual(c.time_offset, self.o.time_offset)
+        for lineno in [899, 3, 998, 0, 512]:
+            self.failUnlessEqual(c.xio_getline(lineno),
+                                 self.o.xio_getline(lineno))
+        self.failUnlessEqual(c.xio_getline_attime(31, relative=False),
+                             '<sfint32 value="3" timestamp="31" sensorName="li'
+                             'netest/linenumber"/>\n')
+        self.failUnlessEqual(list(c.xio_linegen(990, 999)),
+                             list(self.o.xio_linegen(990, 999)))
+
+    def test_blocked_file(self):
+        w = XIOFile('data/blocked.xio.gz', 'w', blocksize=2000,
+                    compresslevel=6, threads=2)
+        for line in gzip.open('data/linestest.xio.gz').readlines()[2:]:
+            w.xio_writeline(line)
+        w.xiofile_close()
+        b = XIOFile('data/blocked.xio.gz', indexing=True)
+        self.assertTrue(len(b.blocks) > 10)
+        self.failUnlessEqual(self.o.blocks, None)
+        self.failUnlessEqual(b.line_offset, self.o.line_offset)
+        self.failUnlessEqual(b.xio_getline(512), self.o.xio_getline(512))
+        linefilter = SensorFilter(['linetest'], ['linenumber'])
+        for start, end in [(0, 0), (100, 300), (0, 20), (900, 10000)]:
+            rows = list(b.xio_quicklinegen(start, end, sensorfilter=linefilter,
+                                           processes=2))
+            self.failUnlessEqual(rows, list(self.o.xio_quicklinegen(start,
+                                 end, sensorfilter=linefilter)))
+        self.failUnlessEqual(len(list(b.xio_quicklinegen(0, 0, processes=2,
+                                                         on_errors='stop'))),
+                             len(list(self.o.xio_quicklinegen(0, 0))))
+        #the blocks after end_time are not parsed
+        w = XIOFile('data/blocked.xio.gz', 'w', blocksize=20000)
+        for i in range(5000):
+            w.xio_writeline(w.xio_formatline('sfint32', i, 'linetest',
+                                             'linenumber', 10 * i + 1))
+        w.xiofile_close()
+        b = XIOFile('data/blocked.xio.gz', indexing=True)
+        mintimes = [b.__blockmintime__(offset, size)
+                    for _, _, offset, size in b.blocks]
+        #(the last block only has the footer, without timestamps)
+        self.failUnlessEqual(mintimes[:-1], sorted(mintimes[:-1]))
+        self.assertTrue(mintimes[-2] > 30000)
+        rows = b.xio_quicklinegen(0, 25000, processes=2, records=True)
+        self.failUnlessEqual([x.value for x in rows], range(2501))
+
+    def test_records(self):
+        for xiofile in [self.f, self.o, self.q]:
+            rows = [dict(x, value=str(x['value'])) for x in
+                    xiofile.xio_quicklinegen(0, 0)]
+            records = [dict(x._asdict(), value=str(x.value)) for x in
+                       xiofile.xio_quicklinegen(0, 0, records=True)]
+            self.failUnlessEqual(records, rows)
+        self.failUnlessEqual(list(self.o.xio_linegen(10, 20, records=True)),
+                             [XIORecord('sfint32', 'linetest', 'linenumber',
+                                        10 * i + 1, i) for i in
+                                        range(10, 21)])
+        records = list(self.o.xio_linegen_timerange(100, 300, records=True))
+        self.failUnlessEqual([x._asdict() for x in records],
+                             list(self.o.xio_linegen_timerange(100, 300)))
+        #the names of all records are the same strings
+        self.assertTrue(records[0].sensorname is records[-1].sensorname)
+        self.failUnlessEqual(self.o.parser.parserecord('<bad line'),
+                             ('', '', '', -1, '<bad line'))
+
+    def test_columns(self):
+        #the same lines as the records, as columns per sensor
+        for xiofile in [self.f, self.o, self.q]:
+            sensors = {}
+            for x in xiofile.xio_quicklinegen(0, 0, records=True):
+                sensors.setdefault(x.sensorname, []).append(
+                    (x.time, x.fieldname, x.valuetype.lower(), str(x.value)))
+            columns = xiofile.xio_quickcolumns(0, 0)
+            self.failUnlessEqual(sorted(columns), sorted(sensors))
+            for sensorname, events in columns.items():
+                self.failUnlessEqual(zip(events.times,
+                                         [events.fields[x] for x in
+                                          events.codes],
+                                         map(str, events.values)),
+                                     [(t, (f, v), s) for t, f, v, s in
+                                      sensors[sensorname]])
+        #a sensorfilter and a time range
+        columns = self.o.xio_quickcolumns(100, 300, sensorfilter=
+                                          SensorFilter('linetest'))
+        self.failUnlessEqual(columns['linetest'].fields,
+                             [('linenumber', 'sfint32')])
+        self.failUnlessEqual(columns['linetest'].values, range(10, 31))
+        self.failUnlessEqual(self.o.xio_quickcolumns(0, 0, sensorfilter=
+                                                     SensorFilter('other')),
+                             {})
+
+    def test_lazy_values(self):
+        lazy = XIOFile('data/types.xio.gz', lazy=True)
+        rows = list(lazy.xio_quicklinegen(0, 0))
+        expected = list(self.f.xio_quicklinegen(0, 0))
+        self.failUnlessEqual(len(rows), len(expected))
+        for row, other in zip(rows, expected):
+            self.failUnlessEqual(str(row['value']), str(other['value']))
+        #simple values are converted, the others when they are used
+        types = dict((x['valuetype'], x['value']) for x in rows)
+        self.failUnlessEqual(type(types['sfint32']), int)
+        vector = types['mfvec3f']
+        self.failUnlessEqual(type(vector), LazyValue)
+        self.assertTrue(vector.raw.startswith('[0.2124978 -0.1224827'))
+        self.failUnlessEqual(len(vector), 20)
+        self.failUnlessEqual(vector[0].x, 0.2124978)
+        self.failUnlessEqual(type(vector.value).__name__, "MFVec3f")
+        self.failUnlessEqual(pickle.loads(pickle.dumps(vector)).raw,
+                             vector.raw)
+
+    def test_read_ahead(self):
+        for start, end in [(0, 0), (100, 300)]:
+            self.failUnlessEqual(list(self.o.xio_quicklinegen(start, end,
+                                                              readahead=True)),
+                                 list(self.o.xio_quicklinegen(start, end)))
+        self.failUnlessEqual(list(self.g.xio_quicklinegen(0, 0, parsed=False,
+                                                          readahead=True)),
+                             list(self.g.xio_quicklinegen(0, 0, parsed=False)))
+
+    def test_follow(self):
+        lines = gzip.open('data/linestest.xio.gz').readlines()
+        live = open('data/live.xio', 'w')
+        live.writelines(lines[:502])
+        live.write(lines[502][:20])
+        live.flush()
+        f = XIOFile('data/live.xio', indexing=True, follow=True)
+        self.failUnlessEqual([x['value'] for x in f.xio_follow(timeout=0)],
+                             range(500))
+        self.failUnlessEqual(f.xio_timeseek(5000, relative=False), False)
+        live.write(lines[502][20:])
+        live.writelines(lines[503:-1])
+        live.flush()
+        follow = f.xio_follow(timeout=0)
+        self.failUnlessEqual(follow.next()['value'], 500)
+        follow.close()
+        #the next call continues after the last generated line
+        self.failUnlessEqual([x['value'] for x in f.xio_follow(timeout=0)],
+                             range(501, 1000))
+        live.write(lines[-1])
+        live.close()
+        self.failUnlessEqual(list(f.xio_follow(timeout=0)), [])
+        #the closing tag has no newline, so it is not read (it is line
+        #1000, the first line of the second block of the full index)
+        self.failUnlessEqual(f.max_lines, self.o.max_lines)
+        self.failUnlessEqual(f.max_time, 9991)
+        self.failUnlessEqual(f.line_offset, self.o.line_offset[:1])
+        self.failUnlessEqual(f.max_time_upto, self.o.max_time_upto[:1])
+        self.failUnlessEqual(f.xio_timeseek(5000, relative=False),
+                             self.o.xio_timeseek(5000, relative=False))
+        self.failUnlessEqual(f.catalog, self.o.catalog)
+
+    def test_catalog(self):
+        catalog = self.o.xio_catalog()
+        self.failUnlessEqual(catalog.index.tolist(),
+                             [('linetest', 'linenumber')])
+        self.failUnlessEqual(catalog.iloc[0].tolist(),
+                             ['sfint32', 1000, 1, 9991, 100.0, 10, 72779])
+        catalog = XIOFile('../sampledata/test.xio.gz',
+                          indexing=True).xio_catalog()
+        self.failUnlessEqual(len(catalog), 15)
+        self.failUnlessEqual(catalog['count'].sum(), 30242)
+        face = catalog.loc['VeniceHubReplay/Kinect/Face']
+        self.failUnlessEqual(face.loc['FaceRotation', 'valuetype'],
+                             'mfrotation')
+        self.failUnlessEqual(face.loc['FaceNose', 'max_gap'], 65)
+        unindexed = XIOFile('data/types.xio.gz')
+        self.failUnlessEqual(unindexed.xio_catalog(), None)
+
+    def test_quickcopy(self):
+        os.system('cp data/linestest.xio.gz data/sidecar.xio.gz')
+        xiofile_quickcopy('data/sidecar.xio.gz', 'data/copy1.xio.gz', 5000,
+                          5100)
+        XIOFile('data/sidecar.xio.gz', indexing=True, writeindex=True)
+        #the copy of the indexed file starts from the block of start_time
+        xiofile_quickcopy('data/sidecar.xio.gz', 'data/copy2.xio.gz', 5000,
+                          5100)
+        copy = gzip.open('data/copy1.xio.gz').read()
+        self.failUnlessEqual(copy, gzip.open('data/copy2.xio.gz').read())
+        self.failUnlessEqual(len(copy.splitlines()), 14)
+        xiofile_quickcopy(self.o, 'data/copy2.xio.gz', 5000, 5100)
+        self.failUnlessEqual(copy, gzip.open('data/copy2.xio.gz').read())
+        #only some sensors
+        xiofile_quickcopy('data/types.xio.gz', 'data/copy1.xio.gz',
+                          sensornames=['dsglab-desk-3'])
+        names = [self.f.xio_parseline(x)['sensorname'] for x in
+                 gzip.open('data/copy1.xio.gz').readlines()[2:-1]]
+        self.failUnlessEqual(set(names), set(['dsglab-desk-3']))
+        self.failUnlessEqual(len(names), 16)
+
+    def test_merge(self):
+        rows = list(xiofile_mergegen(['../sampledata/test.xio.gz',
+                                      '../sampledata/othersensor.xio.gz']))
+        times = [x['time'] for x in rows]
+        self.failUnlessEqual(times, sorted(times))
+        self.failUnlessEqual(len(rows), 45208)
+        #lines with equal timestamps follow the order of the files
+        rows = list(xiofile_mergegen([self.o, 'data/linestest.xio.gz'],
+                                     offsets=[10, 0], end_time=31))
+        self.failUnlessEqual([(x['time'], x['value']) for x in rows],
+                             [(1, 0), (11, 0), (11, 1), (21, 1), (21, 2),
+                              (31, 2), (31, 3)])
+        xiofile_merge(['data/linestest.xio.gz', 'data/linestest.xio.gz'],
+                      'data/copy1.xio.gz', 20, 40, offsets=[0, 5])
+        merged = XIOFile('data/copy1.xio.gz')
+        self.failUnlessEqual([(x['time'], x['value']) for x in
+                              merged.xio_quicklinegen(0, 0, True, False)],
+                             [(21, 2), (26, 2), (31, 3), (36, 3)])
+
+    def test_split(self):
+        #with one open file, the new files are reopened many times
+        names = xiofile_split('../sampledata/test.xio.gz',
+                              'data/split_{}.xio.gz', max_open=1,
+                              buffersize=4096)
+        self.failUnlessEqual(names, {
+            'VeniceHubReplay/Kinect/Face':
+            'data/split_VeniceHubReplay_Kinect_Face.xio.gz',
+            'VeniceHubReplay/Venice/Body1':
+            'data/split_VeniceHubReplay_Venice_Body1.xio.gz'})
+        for sensorname, filename in names.items():
+            xiofile_quickcopy('../sampledata/test.xio.gz',
+                              'data/copy1.xio.gz', sensornames=sensorname)
+            self.failUnlessEqual(gzip.open(filename).read(),
+                                 gzip.open('data/copy1.xio.gz').read())
+        #a group of sensors, in the format of the origin file
+        names = xiofile_split('data/types.xio.gz', 'data/split_{}.xio.gz',
+                              groups={'desk': ['dsglab-desk-3']},
+                              start_time=1)
+        self.failUnlessEqual(names, {'desk': 'data/split_desk.xio.gz'})
+        xiofile_quickcopy('data/types.xio.gz', 'data/copy1.xio.gz', 1)
+        split = gzip.open('data/split_desk.xio.gz').read().splitlines()
+        self.failUnlessEqual(split[-1], '</instantioprotocol>')
+        self.failUnlessEqual(split[2:-1], gzip.open('data/copy1.xio.gz')
+                             .read().splitlines()[2:-1])
+        self.failUnlessEqual(len(split), 9)
+        #sensornames which give the same filename
+        w = XIOFile('data/copy2.xio.gz', 'w', blocksize=1024)
+        for i in range(200):
+            sensorname = ['a/b', 'a_b'][i % 2]
+            w.xio_writeline(w.xio_formatline('sfint32', i, sensorname, 'x',
+                                             i))
+        w.xiofile_close()
+        names = xiofile_split('data/copy2.xio.gz', 'data/split_{}.xio.gz',
+                              max_open=1, buffersize=256, writeindex=True)
+        self.failUnlessEqual(names, {'a/b': 'data/split_a_b.xio.gz',
+                                     'a_b': 'data/split_a_b_2.xio.gz'})
+        for sensorname, filename in names.items():
+            split = XIOFile(filename)
+            self.failUnlessEqual(set(x['sensorname'] for x in
+                                     split.xio_quicklinegen(0, 0, True)),
+                                 set([sensorname]))
+            self.failUnlessEqual(len(list(split.xio_quicklinegen(0, 0))),
+                                 100)
+            #the new files are blocked as the origin file, with an index
+            self.assertTrue(len(split.blocks) > 1)
+            self.assertTrue(os.path.exists(filename + '.idx'))
+
+    def test_sensor_blocks(self):
+        #sensor b only in the lines 1000-2999
+        w = XIOFile('data/restarted.xio.gz', 'w')
+        for i in range(3500):
+            sensorname = 'b' if 1000 <= i < 3000 else 'a'
+            w.xio_writeline(w.xio_formatline('sfint32', i, sensorname, 'x',
+                                             i + 1))
+        w.xiofile_close()
+        r = XIOFile('data/restarted.xio.gz', indexing=True,
+                    checkpoint_interval=10000)
+        self.failUnlessEqual(r.sensorbits, {'a': 0, 'b': 1})
+        self.failUnlessEqual(r.block_sensors, [1, 2, 2, 1])
+        #only the lines of the blocks with the sensor are read
+        calls = []
+        def sensorfilter(sensorname, fieldname):
+            calls.append(sensorname)
+            return sensorname == 'a'
+        rows = list(r.xio_quicklinegen(0, 0, True, False,
+                                       sensorfilter=sensorfilter))
+        self.failUnlessEqual([x['value'] for x in rows],
+                             range(1000) + range(3000, 3500))
+        self.failUnlessEqual(calls.count('b'), 1)
+        rows = list(r.xio_quicklinegen(1500, 0, True, False,
+                                       sensorfilter=SensorFilter('b')))
+        self.failUnlessEqual([x['value'] for x in rows], range(1499, 3000))
+
+    def test_multifile(self):
+        #linestest, split into three parts
+        lines = gzip.open('data/linestest.xio.gz').readlines()
+        paths = []
+        for i, (start, end) in enumerate([(2, 402), (402, 752), (752, -1)]):
+            paths.append('data/part{}.xio.gz'.format(i))
+            w = XIOFile(paths[-1], 'w')
+            for line in lines[start:end]:
+                w.xio_writeline(line)
+            w.xiofile_close()
+        m = XIOMultiFile(paths, indexing=True, writeindex=True)
+        #the same index as the whole file
+        self.failUnlessEqual(m.line_offset, self.o.line_offset)
+        self.failUnlessEqual(m.time_offset, self.o.time_offset)
+        self.failUnlessEqual(m.max_lines, self.o.max_lines)
+        self.failUnlessEqual(m.max_time, self.o.max_time)
+        for lineno in [0, 399, 400, 401, 751, 999]:
+            self.failUnlessEqual(m.xio_getline(lineno),
+                                 self.o.xio_getline(lineno))
+        #time ranges across the parts
+        self.failUnlessEqual([x['value'] for x in
+                              m.xio_linegen_timerange(3990, 4020)],
+                             [399, 400, 401, 402])
+        self.failUnlessEqual(list(m.xio_linegen_timerange(3000, 8000)),
+                             list(self.o.xio_linegen_timerange(3000, 8000)))
+        self.failUnlessEqual(list(m.xio_quicklinegen(7000, 0)),
+                             list(self.o.xio_quicklinegen(7000, 0)))
+        #only the last part is opened to read its lines
+        m.xio_getline(900)
+        self.failUnlessEqual(m.f.part, 2)
+        #the sidecar index of the parts
+        self.assertTrue(os.path.isfile('data/part0.xio.gz.parts.idx'))
+        loaded = XIOMultiFile(paths, indexing=True)
+        self.failUnlessEqual(loaded.line_offset, m.line_offset)
+        self.failUnlessEqual(loaded.xio_getline(800), self.o.xio_getline(800))
+        #with a loaded index, seeking opens only the part sought after
+        for seek in [lambda f: f.xio_getline(900),
+                     lambda f: list(f.xio_linegen_timerange(9000, 9100))]:
+            loaded = XIOMultiFile(paths, indexing=True)
+            opened = []
+            opener = loaded.f.opener
+            loaded.f.opener = lambda path: opened.append(path) or opener(path)
+            self.failUnlessEqual(seek(loaded), seek(self.o))
+            self.failUnlessEqual(loaded.f.part, 2)
+            self.failUnlessEqual(opened, [paths[2]])
+        #without index
+        unindexed = XIOMultiFile(paths)
+        self.failUnlessEqual(unindexed.min_time, 1)
+        for readahead in [False, True]:
+            self.failUnlessEqual(list(unindexed.xio_quicklinegen(0, 0,
+                                      readahead=readahead)),
+                                 list(self.o.xio_quicklinegen(0, 0)))
+
+    def test_time_index(self):
+        #a recording with a gap, restarted (timestamps go back) after
+        #2500 lines
+        times = [10 * i + 1 for i in range(1200)] + \
+                [10 * i + 50001 for i in range(1300)] + \
+                [10 * i + 5 for i in range(1500)]
+        w = XIOFile('data/restarted.xio.gz', 'w')
+        for i, t in enumerate(times):
+            w.xio_writeline(w.xio_formatline('sfint32', i, 'restart', 'line',
+                                             t))
+        w.xiofile_close()
+        r = XIOFile('data/restarted.xio.gz', indexing=True)
+        #(the last block only has the closing tag of the file)
+        self.failUnlessEqual(r.block_min_time[:4], [1, 10001, 5, 5005])
+        self.failUnlessEqual(r.block_max_time, [9991, 57991, 62991, 14995, -1])
+        self.failUnlessEqual(r.max_time_upto, [9991, 57991, 62991, 62991,
+                                               62991])
+        self.failUnlessEqual(r.min_time_from[:4], [1, 5, 5, 5005])
+        #the first line (in file order) at or after a timestamp
+        for t in [1, 6, 12000, 20000, 50001, 62991]:
+            lineno = [i for i, x in enumerate(times) if x >= t][0]
+            self.failUnlessEqual(r.xio_timeseek(t, relative=False),
+                                 r.xio_getline(lineno))
+        self.failUnlessEqual(r.xio_timeseek(62992, relative=False), False)
+        #all lines in a range, also after the restart
+        for start, end in [(1, 100), (11000, 12000), (11995, 50011),
+                           (60000, 70000), (5, 5)]:
+            self.failUnlessEqual([x['value'] for x in
+                                  r.xio_linegen_timerange(start, end, False)],
+                                 [i for i, x in enumerate(times)
+                                  if x >= start and x <= end])
+
     def tearDown(self):
+        os.system('rm -f data/copy1.xio.gz data/copy2.xio.gz')
+        os.system('rm -f data/live.xio')
+        os.system('rm -f data/appended.xio.gz data/appended.xio.gz.idx')
+        os.system('rm -f data/split_*.xio.gz data/split_*.xio.gz.idx')
+        os.system('rm -f data/part*.xio.gz data/part0.xio.gz.parts.idx')
+        os.system('rm -f data/restarted.xio.gz')
+        os.system('rm -f data/blocked.xio.gz')
+        os.system('rm -f data/sidecar.xio.gz data/sidecar.xio.gz.idx')
         os.system('rm data/newtypes.xio.gz')
         os.system('rm data/trywriting.xio.gz')
         os.system('rm data/trywriting2.xio.gz')